@@ -5,6 +5,7 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django import forms
 from .models import Hospital, Patient, Doctor, PatientRecord, Clinic, HospitalAdmin as HospitalAdminModel
+from . import fragments, roles, stats
 
 class CustomAdminSite(admin.AdminSite):
     site_header = 'Health Management System'
@@ -16,7 +17,7 @@ class CustomAdminSite(admin.AdminSite):
         if request.user.is_superuser or request.user.is_staff:
             return True
         # Allow access to hospital users for their specific sections
-        if hasattr(request.user, 'hospital') and request.user.is_authenticated:
+        if request.user.is_authenticated and roles.get_role(request).account_hospital_id is not None:
             return True
         return False
 
@@ -32,15 +33,14 @@ class CustomAdminSite(admin.AdminSite):
             return redirect('admin:login')
             
         context = {
-            'patient_count': Patient.objects.count(),
-            'doctor_count': Doctor.objects.count(),
-            'hospital_count': Hospital.objects.count(),
-            'record_count': PatientRecord.objects.count(),
+            'counts': fragments.lazy(stats.global_counts),
+            'fragment_version': fragments.version(roles.Role(roles.STAFF), 'counts'),
             **self.each_context(request),
             'title': 'Admin Dashboard',
             'opts': self._registry.keys(),
         }
-        return render(request, 'admin/custom_dashboard.html', context)
+        with fragments.reads_for('counts'):
+            return render(request, 'admin/custom_dashboard.html', context)
 
 # Create instance and register models
 custom_admin_site = CustomAdminSite(name='custom_admin')
@@ -56,6 +56,7 @@ class HospitalAdminForm(forms.ModelForm):
 class HospitalAdmin(admin.ModelAdmin):
     form = HospitalAdminForm
     list_display = ('name', 'get_username', 'registration_number', 'hospital_type', 'city', 'contact_person_name')
+    list_select_related = ('user',)
     list_filter = ('hospital_type', 'city', 'state')
     search_fields = ('name', 'registration_number', 'contact_person_name', 'email', 'user__username')
     
@@ -121,10 +122,11 @@ class HospitalAdmin(admin.ModelAdmin):
     def has_view_permission(self, request, obj=None):
         return request.user.is_authenticated
 
-# Register all models with the custom admin site
+# Register all models with the custom admin site. The changelists print each
+# row's __str__, which follows these relations; join them instead of one query per row.
 custom_admin_site.register(Patient)
-custom_admin_site.register(Doctor)
+custom_admin_site.register(Doctor, list_select_related=('user',))
 custom_admin_site.register(Hospital, HospitalAdmin)
-custom_admin_site.register(PatientRecord)
-custom_admin_site.register(HospitalAdminModel)
-custom_admin_site.register(Clinic)
\ No newline at end of file
+custom_admin_site.register(PatientRecord, list_select_related=('patient',))
+custom_admin_site.register(HospitalAdminModel, list_select_related=('user', 'hospital'))
+custom_admin_site.register(Clinic, list_select_related=('hospital',))
\ No newline at end of file
@@ -13,16 +13,15 @@ class CustomAdminSite(admin.AdminSite):
     
     @staff_member_required
     def admin_dashboard(self, request):
-        from .models import Patient, Doctor, Hospital, PatientRecord  # Import here to avoid circular imports
+        from . import fragments, roles, stats  # Import here to avoid circular imports
         context = {
-            'patient_count': Patient.objects.count(),
-            'doctor_count': Doctor.objects.count(),
-            'hospital_count': Hospital.objects.count(),
-            'record_count': PatientRecord.objects.count(),
+            'counts': fragments.lazy(stats.global_counts),
+            'fragment_version': fragments.version(roles.Role(roles.STAFF), 'counts'),
             **self.each_context(request),
             'title': 'Admin Dashboard',
         }
-        return render(request, 'admin/custom_dashboard.html', context)
+        with fragments.reads_for('counts'):
+            return render(request, 'admin/custom_dashboard.html', context)
 
 # Then register models after class definition
 custom_admin_site = CustomAdminSite(name='custom_admin')
@@ -0,0 +1,214 @@
+"""
+Read-only JSON API (``/api/v1/<resource>/``).
+
+Rows are serialized straight from ``values()`` (no model instances) and
+paged with the keyset cursors from ``core.pagination``. ``?fields=a,b``
+selects columns and ``?after=`` / ``?before=`` walk the pages.
+
+Each resource depends on a few models whose last-write stamps are kept by
+``core.stamps`` (bumped by ``core.signals`` via ``touch``). ETag and
+Last-Modified are derived from those stamps alone, so a client polling an
+unchanged resource gets a 304 without any query beyond authentication, and
+the same answer from every worker.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.http import JsonResponse
+from django.views.decorators.http import condition
+
+from . import roles, stamps
+from .models import Clinic, Doctor, Hospital, Patient, PatientRecord
+from .pagination import InvalidCursor, clamp_page_size, keyset_paginate
+
+VERSION = 'v1'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class Resource:
+    """
+    ``fields`` maps public names to ORM paths. ``order`` are the keyset
+    columns (which must be exposed under their own names); ``unscoped_order``
+    replaces it when no hospital or patient filter narrows the rows and
+    ``order`` has no index of its own.
+    """
+
+    def __init__(self, model, fields, order=('id',), hospital_path=None, patient_path=None,
+                 depends=(), unscoped_order=None):
+        self.model = model
+        self.fields = fields
+        self.order = order
+        self.unscoped_order = unscoped_order or order
+        self.hospital_path = hospital_path
+        self.patient_path = patient_path
+        self.depends = (model, *depends)
+
+    def values(self, queryset, selected, order):
+        columns = dict.fromkeys([*selected, *order])
+        plain = [name for name in columns if self.fields[name] == name]
+        renamed = {name: F(self.fields[name]) for name in columns if self.fields[name] != name}
+        return queryset.values(*plain, **renamed)
+
+
+RESOURCES = {
+    'hospitals': Resource(Hospital, {
+        'id': 'id', 'name': 'name', 'registration_number': 'registration_number', 'hospital_type': 'hospital_type',
+        'city': 'city', 'state': 'state', 'country': 'country', 'contact_number': 'contact_number',
+        'email': 'email', 'registration_date': 'registration_date',
+    }, hospital_path='id'),
+    'clinics': Resource(Clinic, {
+        'id': 'id', 'name': 'name', 'clinic_type': 'clinic_type', 'registration_number': 'registration_number',
+        'hospital_id': 'hospital_id', 'specialization': 'specialization', 'city': 'city',
+        'contact_number': 'contact_number', 'email': 'email', 'registration_date': 'registration_date',
+    }, hospital_path='hospital'),
+    'doctors': Resource(Doctor, {
+        'id': 'id', 'first_name': 'user__first_name', 'last_name': 'user__last_name',
+        'specialization': 'specialization', 'license_number': 'license_number', 'contact_number': 'contact_number',
+        'clinic_id': 'clinic_id', 'hospital_id': 'clinic__hospital_id', 'join_date': 'join_date',
+    }, hospital_path='clinic__hospital', depends=(User, Clinic)),
+    'patients': Resource(Patient, {
+        'id': 'id', 'mr_number': 'mr_number', 'first_name': 'first_name', 'last_name': 'last_name',
+        'date_of_birth': 'date_of_birth', 'gender': 'gender', 'blood_group': 'blood_group', 'address': 'address',
+        'contact_number': 'contact_number', 'email': 'email', 'hospital_id': 'registered_at_id',
+        'registration_date': 'registration_date',
+    }, order=('registration_date', 'id'), hospital_path='registered_at'),
+    'records': Resource(PatientRecord, {
+        'id': 'id', 'mr_number': 'patient__mr_number', 'hospital_id': 'hospital_id', 'doctor_id': 'doctor_id',
+        'visit_date': 'visit_date', 'symptoms': 'symptoms', 'diagnosis': 'diagnosis',
+        'prescription': 'prescription', 'notes': 'notes', 'next_visit': 'next_visit',
+    }, order=('visit_date', 'id'), unscoped_order=('id',), hospital_path='hospital',
+        patient_path='patient__mr_number', depends=(Patient,)),
+}
+
+
+def _version_key(model):
+    return f'api_version:{model._meta.label_lower}'
+
+
+def touch(model):
+    """Record that ``model`` changed (in the writing transaction)."""
+    stamps.touch(_version_key(model))
+
+
+def versions(models):
+    return stamps.get([_version_key(m) for m in models])
+
+
+def _error(status, message):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _scope(request):
+    """None for every hospital, a hospital id for hospital admins, False if no API access."""
+    role = roles.get_role(request)
+    if role.is_hospital_admin:
+        return role.hospital_id
+    if request.user.is_staff:
+        return None
+    return False
+
+
+def _etag(request, resource, pk=None):
+    current = versions(RESOURCES[resource].depends)
+    raw = f'{VERSION}|{current}|{request.api_scope}|{request.get_full_path()}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _last_modified(request, resource, pk=None):
+    return datetime.fromtimestamp(max(versions(RESOURCES[resource].depends)), tz=dt_timezone.utc)
+
+
+def api_view(view):
+    @wraps(view)
+    def wrapped(request, resource, *args, **kwargs):
+        if resource not in RESOURCES:
+            return _error(404, f'Unknown resource "{resource}"')
+        if not request.user.is_authenticated:
+            return _error(401, 'Authentication required')
+        scope = _scope(request)
+        if scope is False:
+            return _error(403, 'The API is limited to administrators')
+        request.api_scope = scope
+        return view(request, resource, *args, **kwargs)
+    return wrapped
+
+
+def _selected_fields(request, resource):
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(resource.fields)
+    selected = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in resource.fields]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(resource.fields)}')
+    return selected
+
+
+def _scoped_queryset(request, resource):
+    queryset = resource.model.objects.all()
+    hospital = request.api_scope
+    if hospital is None and request.GET.get('hospital'):
+        try:
+            hospital = int(request.GET['hospital'])
+        except ValueError:
+            raise ValueError('hospital must be an id')
+    if hospital is not None:
+        queryset = queryset.filter(**{resource.hospital_path: hospital})
+    patient = request.GET.get('patient') if resource.patient_path else None
+    if patient:
+        queryset = queryset.filter(**{resource.patient_path: patient})
+    narrowed = hospital is not None or bool(patient)
+    return queryset, narrowed
+
+
+def _page_url(request, **cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query.update(cursor)
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+@api_view
+@condition(etag_func=_etag, last_modified_func=_last_modified)
+def resource_list(request, resource):
+    resource = RESOURCES[resource]
+    try:
+        selected = _selected_fields(request, resource)
+        queryset, narrowed = _scoped_queryset(request, resource)
+    except ValueError as e:
+        return _error(400, str(e))
+    order = resource.order if narrowed else resource.unscoped_order
+    try:
+        page = keyset_paginate(
+            resource.values(queryset, selected, order), order,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=clamp_page_size(request.GET.get('page_size'), default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE),
+        )
+    except InvalidCursor:
+        return _error(400, 'Invalid page cursor')
+    return JsonResponse({
+        'results': [{name: row[name] for name in selected} for row in page],
+        'next': _page_url(request, after=page.next_cursor) if page.has_next else None,
+        'previous': _page_url(request, before=page.previous_cursor) if page.has_previous else None,
+    })
+
+
+@api_view
+@condition(etag_func=_etag, last_modified_func=_last_modified)
+def resource_detail(request, resource, pk):
+    resource = RESOURCES[resource]
+    try:
+        selected = _selected_fields(request, resource)
+        queryset, _ = _scoped_queryset(request, resource)
+    except ValueError as e:
+        return _error(400, str(e))
+    row = resource.values(queryset.filter(pk=pk), selected, ()).first()
+    if row is None:
+        return _error(404, 'Not found')
+    return JsonResponse({name: row[name] for name in selected})
@@ -4,5 +4,6 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
-    # Remove any model imports from here
-    # Don't override ready() unless absolutely necessary
\ No newline at end of file
+    def ready(self):
+        # Connect the signal handlers that keep derived tables (search index etc.) in sync
+        from . import signals  # noqa: F401
@@ -0,0 +1,49 @@
+"""
+SQLite backend tuned for serving concurrent requests.
+
+Every new connection gets ``DEFAULT_PRAGMAS`` (overridable per database with
+``OPTIONS['pragmas']``): WAL journaling so readers and the writer don't block
+each other, ``synchronous=NORMAL`` (durable at checkpoints, safe against
+corruption), a busy timeout, and larger page and mmap caches.
+
+``OPTIONS['transaction_mode']`` ('DEFERRED', 'IMMEDIATE' or 'EXCLUSIVE')
+sets how ``transaction.atomic`` begins, as the option of the same name does
+in Django 5.1+. With IMMEDIATE the write lock is taken at BEGIN, where the
+busy timeout can wait for it; a deferred transaction that reads and then
+writes fails at once with "database is locked" if another connection wrote
+in between, since SQLite cannot wait out that deadlock.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -16000,  # negative: KiB, i.e. 16 MB per connection
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is None:
+            return super()._start_transaction_under_autocommit()
+        if mode.upper() not in TRANSACTION_MODES:
+            raise ValueError(f'transaction_mode must be one of {", ".join(TRANSACTION_MODES)}')
+        self.cursor().execute(f'BEGIN {mode.upper()}')
@@ -0,0 +1,39 @@
+"""
+Helpers for bulk writes.
+
+``bulk_create`` skips model signals, so anything loading patients or visit
+records in bulk must do the signal handlers' work itself; ``patients_created``
+and ``records_created`` do that for one saved batch. Patient and visit dates
+set on the objects are kept (see ``core.models.GivenOrNowMixin``).
+"""
+from . import api, fragments, lookup, panels, record_index, search, stats
+from .models import Patient, PatientRecord
+
+
+def patients_created(patients):
+    """Index, count and invalidate caches for a batch of bulk-created patients."""
+    if not patients:
+        return
+    search.index_patients(patients, replace=False)
+    stats.adjust(Patient, len(patients))
+    api.touch(Patient)
+    for hospital_id in {p.registered_at_id for p in patients}:
+        stats.invalidate_hospital(hospital_id)
+    for patient in patients:
+        lookup.invalidate(patient.mr_number)
+
+
+def records_created(records):
+    """Index, fold into panels, count and invalidate caches for a batch of bulk-created records."""
+    if not records:
+        return
+    record_index.index_records(records)
+    panels.record_visits(records)
+    stats.adjust(PatientRecord, len(records))
+    api.touch(PatientRecord)
+    for hospital_id in {r.hospital_id for r in records}:
+        stats.invalidate_hospital(hospital_id)
+    for doctor_id in {r.doctor_id for r in records} - {None}:
+        fragments.touch(f'doctor:{doctor_id}')
+    for mr_number in {r.patient.mr_number for r in records}:
+        lookup.invalidate(mr_number)
@@ -0,0 +1,91 @@
+"""
+Prefix search over hospital and clinic names, for the autocomplete fields.
+
+Each process keeps a sorted index of every word-suffix of each name ("lahore
+general hospital", "general hospital", "hospital"), so a typed prefix is a
+binary search followed by a short scan, and a label for a chosen id is a
+dict lookup. Labels are unique within an index (a label shared by several
+facilities gets the id appended), since the browser maps a chosen label back
+to its id. An index is rebuilt (one query) when the API's last-write
+stamps of the models it depends on change; see ``core.api.touch``. Another
+worker's writes show up within ``CHANGE_STAMP_TTL``. Choices are still
+validated against the database by the form fields, so a stale index can
+only hide a brand-new facility for a moment, never let a deleted one
+through.
+"""
+import bisect
+import threading
+from collections import Counter
+
+from . import api
+from .models import Clinic, Hospital
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+class NameIndex:
+    def __init__(self, depends, load):
+        self.depends = depends
+        # load() -> iterable of (id, name, label, hospital_id)
+        self.load = load
+        self._built = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        stamps = api.versions(self.depends)
+        built = self._built
+        if built is None or built[0] != stamps:
+            with self._lock:
+                built = self._built
+                if built is None or built[0] != stamps:
+                    built = self._built = (stamps, *self._build())
+        return built
+
+    def _build(self):
+        keys, entries = [], {}
+        rows = list(self.load())
+        shared = Counter(label for _, _, label, _ in rows)
+        for pk, name, label, hospital_id in rows:
+            entries[pk] = (f'{label} #{pk}' if shared[label] > 1 else label, hospital_id)
+            words = name.lower().split()
+            keys.extend((' '.join(words[i:]), pk) for i in range(len(words)))
+        keys.sort()
+        return keys, entries
+
+    def search(self, query, limit=DEFAULT_LIMIT, hospital=None):
+        """``[(id, label)]`` of names with a word starting with ``query``, by label."""
+        query = ' '.join(query.lower().split())
+        if not query:
+            return []
+        _, keys, entries = self._current()
+        found = {}
+        for i in range(bisect.bisect_left(keys, (query,)), len(keys)):
+            key, pk = keys[i]
+            if not key.startswith(query) or len(found) >= limit:
+                break
+            if hospital is None or entries[pk][1] == hospital:
+                found[pk] = entries[pk][0]
+        return sorted(found.items(), key=lambda item: item[1].lower())
+
+    def label(self, pk):
+        entry = self._current()[2].get(pk)
+        return entry[0] if entry else None
+
+
+def _hospitals():
+    for pk, name, city in Hospital.objects.values_list('id', 'name', 'city').iterator():
+        yield pk, name, f'{name} - {city}' if city else name, pk
+
+
+def _clinics():
+    rows = Clinic.objects.values_list('id', 'name', 'clinic_type', 'hospital_id', 'hospital__name')
+    for pk, name, clinic_type, hospital_id, hospital_name in rows.iterator():
+        # Same text as Clinic.__str__
+        yield pk, name, f'{name} ({clinic_type}) - {hospital_name}', hospital_id
+
+
+INDEXES = {
+    'hospitals': NameIndex((Hospital,), _hospitals),
+    'clinics': NameIndex((Clinic, Hospital), _clinics),
+}
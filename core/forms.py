@@ -1,10 +1,51 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordResetForm, SetPasswordForm
 from django.contrib.auth.models import User
+from django.forms.models import construct_instance
+from django.forms.utils import flatatt
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import Patient, Doctor, Clinic, Hospital, PatientRecord, HospitalAdmin
+from . import facilities, mrn
+
+class AutocompleteInput(forms.Widget):
+    """
+    A text box suggesting facilities from ``/autocomplete/<kind>/`` (see
+    static/js/autocomplete.js) and a hidden input carrying the chosen id.
+    Only the selected facility's label is rendered, from the cached name
+    index, so the page and its queries do not grow with the number of
+    facilities; the id is validated by the form field as before.
+    """
+
+    class Media:
+        js = ('js/autocomplete.js',)
+
+    def __init__(self, kind, attrs=None):
+        self.kind = kind
+        super().__init__({'class': 'form-control', **(attrs or {})})
+
+    def selected_label(self, value):
+        try:
+            return facilities.INDEXES[self.kind].label(int(value)) or ''
+        except (TypeError, ValueError):
+            return ''
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        field_id = attrs.pop('id', None) or f'id_{name}'
+        return format_html(
+            '<input type="hidden" name="{}" value="{}" id="{}_value">'
+            '<input type="text" id="{}" value="{}" list="{}_options" data-autocomplete="{}" '
+            'data-autocomplete-value="{}_value" autocomplete="off"{}>'
+            '<datalist id="{}_options"></datalist>',
+            name, '' if value is None else value, field_id,
+            field_id, self.selected_label(value), field_id, reverse('facility_autocomplete', args=[self.kind]),
+            field_id, flatatt(attrs),
+            field_id,
+        )
 
 class PatientForm(forms.ModelForm):
-    mr_number = forms.CharField(max_length=20, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter MR number (min 5 characters)'}))
+    mr_number = forms.CharField(max_length=20, required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Leave blank to assign the next MR number'}))
     first_name = forms.CharField(max_length=100, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter first name'}))
     last_name = forms.CharField(max_length=100, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter last name'}))
     date_of_birth = forms.DateField(required=True, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
@@ -13,15 +54,16 @@ class PatientForm(forms.ModelForm):
     address = forms.CharField(required=True, widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Enter complete address'}))
     contact_number = forms.CharField(max_length=15, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter contact number'}))
     email = forms.EmailField(required=False, widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Enter email address'}))
-    registered_at = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=forms.Select(attrs={'class': 'form-control'}))
+    registered_at = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=AutocompleteInput('hospitals', attrs={'placeholder': 'Start typing a hospital name'}))
     
     class Meta:
         model = Patient
         fields = ['mr_number', 'first_name', 'last_name', 'date_of_birth', 'gender', 'blood_group', 'address', 'contact_number', 'email', 'registered_at']
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['registered_at'].empty_label = "Select Hospital"
+
+    def save(self, commit=True):
+        if not self.instance.mr_number:
+            self.instance.mr_number = mrn.allocate(self.instance.registered_at_id)
+        return super().save(commit)
 
 class DoctorForm(forms.ModelForm):
     class Meta:
@@ -141,7 +183,7 @@ class CustomSetPasswordForm(SetPasswordForm):
 class DoctorRegistrationForm(CustomUserCreationForm):
     specialization = forms.CharField(max_length=100, required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
     license_number = forms.CharField(max_length=50, required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
-    clinic = forms.ModelChoiceField(queryset=Clinic.objects.all(), required=True, widget=forms.Select(attrs={'class': 'form-control'}))
+    clinic = forms.ModelChoiceField(queryset=Clinic.objects.all(), required=True, widget=AutocompleteInput('clinics', attrs={'placeholder': 'Start typing a clinic or hospital name'}))
     
     class Meta(CustomUserCreationForm.Meta):
         fields = CustomUserCreationForm.Meta.fields + ('specialization', 'license_number', 'clinic')
@@ -187,7 +229,7 @@ class HospitalRegistrationForm(forms.ModelForm):
         return cleaned_data
 
 class HospitalAdminRegistrationForm(CustomUserCreationForm):
-    hospital = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=forms.Select(attrs={'class': 'form-control'}))
+    hospital = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=AutocompleteInput('hospitals', attrs={'placeholder': 'Start typing a hospital name'}))
     position = forms.CharField(max_length=100, required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
     contact_number = forms.CharField(max_length=20, required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
     
@@ -286,16 +328,12 @@ class PatientRegistrationForm(forms.ModelForm):
     confirm_password = forms.CharField(widget=forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Confirm password'}), required=True)
     
     # Hospital Registration
-    registered_at = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=forms.Select(attrs={'class': 'form-control'}))
+    registered_at = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=True, widget=AutocompleteInput('hospitals', attrs={'placeholder': 'Start typing a hospital name'}))
     
     class Meta:
         model = Patient
         fields = ['date_of_birth', 'gender', 'blood_group', 'contact_number', 'email', 'registered_at']
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['registered_at'].empty_label = "Select Hospital"
-    
     def clean(self):
         cleaned_data = super().clean()
         password = cleaned_data.get('password')
@@ -304,4 +342,85 @@ class PatientRegistrationForm(forms.ModelForm):
         if password and confirm_password and password != confirm_password:
             raise forms.ValidationError("Passwords do not match")
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class RecordSearchForm(forms.Form):
+    q = forms.CharField(max_length=200, required=True, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. dengue fever, or dengu* for a prefix'}))
+    hospital = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=False, widget=AutocompleteInput('hospitals', attrs={'placeholder': 'All hospitals'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("Start date must be before end date")
+
+        return cleaned_data
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')], required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    hospital = forms.ModelChoiceField(queryset=Hospital.objects.all(), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("Start date must be before end date")
+
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
+
+class HospitalKeyField(forms.Field):
+    """Resolves a hospital reference against a prebuilt ``{key: Hospital}`` map instead of the database."""
+
+    def __init__(self, hospitals, normalize=str, **kwargs):
+        self.hospitals = hospitals
+        self.normalize = normalize
+        super().__init__(**kwargs)
+
+    def clean(self, value):
+        value = super().clean(value)
+        if value in self.empty_values:
+            return None
+        key = self.normalize(value)
+        if key not in self.hospitals:
+            raise forms.ValidationError(f'Unknown hospital "{value}"')
+        if self.hospitals[key] is None:
+            raise forms.ValidationError(f'Hospital "{value}" matches more than one hospital')
+        return self.hospitals[key]
+
+class PatientImportForm(PatientForm):
+    # Bulk import variant of PatientForm: same field rules, but the hospital is
+    # resolved from an in-memory map and mr_number uniqueness is checked per
+    # batch by the importer, so validating a row costs no queries.
+    registration_date = forms.DateField(required=False)
+
+    def __init__(self, *args, hospitals=None, hospital_key=str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['registered_at'] = HospitalKeyField(hospitals or {}, normalize=hospital_key, required=True)
+
+    def rebind(self, data):
+        # Validating hundreds of thousands of rows, the per-form deepcopy of the
+        # declared fields costs as much as validation itself; reuse them instead.
+        self.data = data
+        self.is_bound = True
+        self._errors = None
+        self._bound_fields_cache = {}
+        return self
+
+    def _post_clean(self):
+        self.instance = construct_instance(self, Patient(), self._meta.fields, self._meta.exclude)
+        if self.cleaned_data.get('registration_date'):
+            self.instance.registration_date = self.cleaned_data['registration_date']
+        try:
+            exclude = self._get_validation_exclusions() | {'registered_at', 'registration_date'}
+            self.instance.full_clean(exclude=exclude, validate_unique=False)
+        except forms.ValidationError as e:
+            self._update_errors(e)
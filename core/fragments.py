@@ -0,0 +1,68 @@
+"""
+Versioned template fragment caching for the dashboards.
+
+The expensive blocks of the dashboards sit in ``{% cache %}`` tags whose
+key includes a version string from ``version()``: the viewer's role, the
+scopes the block shows (``hospital:<id>``, ``doctor:<id>``, ``counts``)
+and each scope's last-write stamp (kept by ``core.stamps``). A write bumps
+the stamps of the scopes it changes (``touch``, from ``core.stats`` and
+``core.signals``), so the next render simply misses under a new key; old
+fragments are never deleted, they expire after ``FRAGMENT_CACHE_TTL``. The
+writing worker sees the new stamp at once, other workers within
+``CHANGE_STAMP_TTL`` when the cache is per-process.
+
+Views hand the block's data to the template through ``lazy``, so a cached
+block costs no queries, and render inside ``reads_for`` so a block missed
+just after a write is rendered from the primary rather than from a replica
+that may not have the write yet (see ``core.replicas``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.functional import SimpleLazyObject
+
+from . import replicas, stamps
+
+TTL = getattr(settings, 'FRAGMENT_CACHE_TTL', 600)
+
+
+def _stamp_key(scope):
+    return f'fragment_version:{scope}'
+
+
+def touch(scope):
+    """Retire every fragment that shows ``scope`` (in the writing transaction)."""
+    key = _stamp_key(scope)
+    stamps.touch(key)
+    replicas.mark_changed(key)
+
+
+def stamp(scope):
+    """The last-write stamp of ``scope``, for data cached alongside its fragments."""
+    return stamps.get([_stamp_key(scope)])[0]
+
+
+def version(role, *scopes):
+    """The ``{% cache %}`` vary-on value for a block showing ``scopes`` to ``role``."""
+    return ':'.join([role.kind, *scopes, *map(repr, stamps.get([_stamp_key(scope) for scope in scopes]))])
+
+
+def reads_for(scope):
+    """Context to render a block showing ``scope`` in."""
+    return replicas.reads_for(_stamp_key(scope))
+
+
+def lazy(func, *args):
+    """``func(*args)``, computed only if the template uses it (a cached block doesn't)."""
+    return SimpleLazyObject(lambda: func(*args))
+
+
+async def acached(version, *names):
+    """Whether the ``{% cache %}`` blocks ``names`` are all cached under ``version``."""
+    keys = [make_template_fragment_key(name, [version]) for name in names]
+    return len(await cache.aget_many(keys)) == len(keys)
+
+
+def context(request):
+    """Context processor: ``fragment_ttl`` for the ``{% cache %}`` tags."""
+    return {'fragment_ttl': TTL}
@@ -0,0 +1,181 @@
+"""
+Finding a hospital by the name typed into the clinic registration form.
+
+``Hospital.normalized_name`` holds the name case-folded, with accents,
+punctuation and repeated whitespace removed, so "St. Mary's  Hospital" and
+"st marys hospital" are the same key and an exact lookup is an index seek.
+Failing that, the name's trigrams (``HospitalNameTrigram``) give the
+hospitals sharing the most trigrams with it, and the best of those is taken
+when its similarity (shared trigrams over all distinct trigrams of both
+names, as pg_trgm computes it) reaches ``HOSPITAL_NAME_SIMILARITY``.
+
+Clinic registration (``resolve``) only links an exact match; the fuzzy
+lookup is for ``dedupe_hospitals --fuzzy``. Both are maintained when a
+Hospital is saved (``core.signals``).
+``QuerySet.update()`` and raw loads bypass that; run ``manage.py
+dedupe_hospitals --reindex`` after them. ``merge`` folds a placeholder
+hospital created for a misspelt name into the real one.
+"""
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import api, stats
+from .models import Clinic, Hospital, HospitalAdmin, HospitalNameTrigram, Patient, PatientRecord, RecordTerm
+
+SIMILARITY_THRESHOLD = getattr(settings, 'HOSPITAL_NAME_SIMILARITY', 0.7)
+# Hospitals holding one of the name's rarest trigrams that are scored exactly
+MAX_CANDIDATES = 500
+
+# What register_clinic fills in for a hospital it had to create from a name
+PLACEHOLDER_CONTACT = '0000000000'
+PLACEHOLDER_EMAILS = ('temp@example.com', 'default@example.com')
+
+_separator_re = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(name):
+    name = unicodedata.normalize('NFKD', (name or '').casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    # Apostrophes join ("mary's" -> "marys"); other punctuation separates words
+    name = name.replace("'", '').replace('’', '')
+    return _separator_re.sub(' ', name).strip()[:Hospital._meta.get_field('normalized_name').max_length]
+
+
+def trigrams(normalized):
+    """Distinct trigrams of each word padded with two spaces in front and one behind."""
+    grams = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(a, b):
+    # a and b are trigram sets
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def similarity(a, b):
+    return _similarity(trigrams(a), trigrams(b))
+
+
+def index_hospital(hospital):
+    """Bring one hospital's trigram rows in line with its normalized name."""
+    wanted = trigrams(hospital.normalized_name)
+    with transaction.atomic():
+        existing = set(HospitalNameTrigram.objects.filter(hospital=hospital).values_list('trigram', flat=True))
+        stale = existing - wanted
+        if stale:
+            HospitalNameTrigram.objects.filter(hospital=hospital, trigram__in=stale).delete()
+        HospitalNameTrigram.objects.bulk_create([
+            HospitalNameTrigram(trigram=gram, hospital_id=hospital.pk) for gram in wanted - existing
+        ])
+
+
+def rebuild_index(batch_size=1000):
+    """Recompute every normalized name and trigram; returns the number of hospitals."""
+    total = 0
+    with transaction.atomic():
+        HospitalNameTrigram.objects.all().delete()
+        batch = []
+        for pk, name, normalized_name in Hospital.objects.values_list('id', 'name', 'normalized_name').iterator():
+            key = normalize(name)
+            if key != normalized_name:
+                Hospital.objects.filter(pk=pk).update(normalized_name=key)
+            batch.extend(HospitalNameTrigram(trigram=gram, hospital_id=pk) for gram in trigrams(key))
+            if len(batch) >= batch_size:
+                HospitalNameTrigram.objects.bulk_create(batch)
+                batch = []
+            total += 1
+        HospitalNameTrigram.objects.bulk_create(batch)
+    return total
+
+
+def is_placeholder(hospital):
+    return (
+        hospital.user_id is None
+        and hospital.contact_number == PLACEHOLDER_CONTACT
+        and hospital.email in PLACEHOLDER_EMAILS
+    )
+
+
+def similar(name, threshold=SIMILARITY_THRESHOLD, exclude=()):
+    """``[(hospital, similarity)]`` of hospitals named like ``name``, most similar first."""
+    key = normalize(name)
+    grams = trigrams(key)
+    if not grams:
+        return []
+    # A hospital at least ``threshold`` similar shares at least ``needed`` of
+    # the name's trigrams, so it has one of any ``len(grams) - needed + 1`` of
+    # them. Taking the rarest skips the postings of "hos", "pit", "al "...
+    needed = math.ceil(threshold * len(grams))
+    frequency = dict(
+        HospitalNameTrigram.objects.filter(trigram__in=grams).values('trigram').annotate(n=Count('id'))
+        .values_list('trigram', 'n')
+    )
+    rare = sorted(grams, key=lambda gram: frequency.get(gram, 0))[:len(grams) - needed + 1]
+    ids = (
+        HospitalNameTrigram.objects.filter(trigram__in=rare).exclude(hospital__in=exclude)
+        .values_list('hospital_id', flat=True).distinct()[:MAX_CANDIDATES]
+    )
+    scores = {}
+    for pk, normalized_name in Hospital.objects.filter(pk__in=list(ids)).values_list('id', 'normalized_name'):
+        score = _similarity(grams, trigrams(normalized_name))
+        if score >= threshold:
+            scores[pk] = score
+    hospitals = Hospital.objects.in_bulk(scores)
+    return sorted(((hospitals[pk], score) for pk, score in scores.items()), key=lambda item: (-item[1], item[0].pk))
+
+
+def find(name, threshold=SIMILARITY_THRESHOLD):
+    """``(hospital, similarity)`` of the hospital best matching ``name``, or ``(None, 0.0)``."""
+    key = normalize(name)
+    if not key:
+        return None, 0.0
+    exact = Hospital.objects.filter(normalized_name=key).order_by('id').first()
+    if exact is not None:
+        return exact, 1.0
+    matches = similar(key, threshold)
+    return matches[0] if matches else (None, 0.0)
+
+
+def resolve(name):
+    """The hospital whose normalized name is ``name``'s, created as a placeholder when there is none.
+
+    Never a fuzzy match: "City Hospital" and "City Hospital 2" are 0.875
+    similar but different hospitals. ``dedupe_hospitals --fuzzy`` merges
+    misspelt placeholders after review.
+    """
+    key = normalize(name)
+    hospital = Hospital.objects.filter(normalized_name=key).order_by('id').first() if key else None
+    if hospital is None:
+        hospital = Hospital.objects.create(
+            name=name.strip(),
+            contact_number=PLACEHOLDER_CONTACT,
+            email=PLACEHOLDER_EMAILS[0],
+        )
+    return hospital
+
+
+def merge(duplicate, into):
+    """Move everything of ``duplicate`` to ``into`` and delete ``duplicate``."""
+    with transaction.atomic():
+        Clinic.objects.filter(hospital=duplicate).update(hospital=into)
+        HospitalAdmin.objects.filter(hospital=duplicate).update(hospital=into)
+        Patient.objects.filter(registered_at=duplicate).update(registered_at=into)
+        PatientRecord.objects.filter(hospital=duplicate).update(hospital=into)
+        RecordTerm.objects.filter(hospital=duplicate).update(hospital=into)
+        # Moved without signals: drop what was derived from the old rows
+        for model in (Clinic, Patient, PatientRecord):
+            api.touch(model)
+        stats.invalidate_hospital(into.pk)
+        stats.invalidate_hospital(duplicate.pk)
+        duplicate.delete()
@@ -0,0 +1,139 @@
+"""
+Per-request query and template timing, with an N+1 detector.
+
+A sampled request (``INSTRUMENTATION_SAMPLE_RATE``) runs with a
+``connection.execute_wrapper`` on every database connection, counting
+queries, their total time and how often each statement shape (SQL with
+literals and IN lists folded) was executed. A SELECT shape repeated at least
+``INSTRUMENTATION_REPEAT_THRESHOLD`` times is flagged as a likely N+1, the
+signature of a related object dereferenced inside a loop.
+
+Results go to ``Server-Timing`` (db, tpl, total), ``X-DB-Queries`` and
+``X-N-Plus-One`` response headers and to one JSON line on the
+``core.instrumentation`` logger (WARNING when an N+1 is flagged).
+
+With a sample rate of 0 the middleware removes itself from the stack and
+template rendering is never wrapped, so it costs nothing. Queries issued
+outside the request's thread (the dashboards' query pool) and while a
+streaming response is consumed are not counted.
+"""
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+SAMPLE_RATE = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.0)
+REPEAT_THRESHOLD = getattr(settings, 'INSTRUMENTATION_REPEAT_THRESHOLD', 5)
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('instrumentation_request', default=None)
+_in_list_re = re.compile(r'\((?:%s, )+%s\)')
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """``sql`` with IN lists and inlined literals folded, so repeats of one statement compare equal."""
+    return _literal_re.sub('?', _in_list_re.sub('(%s, ...)', sql))
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self):
+        return [(sql, count) for sql, count in self.shapes.most_common()
+                if count >= REPEAT_THRESHOLD and sql.lstrip().upper().startswith('SELECT')]
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapped(self, context):
+        stats = _current.get()
+        if stats is None or stats.template_depth:
+            # Not sampled, or an {% include %} inside a template already being timed
+            return render(self, context)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.template_depth -= 1
+    wrapped.instrumented = True
+    return wrapped
+
+
+def install_template_timer():
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        install_template_timer()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= SAMPLE_RATE:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+        repeated = stats.repeated()
+
+        response['Server-Timing'] = (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'tpl;dur={stats.template_time * 1000:.1f}, total;dur={total * 1000:.1f}'
+        )
+        response['X-DB-Queries'] = str(stats.queries)
+        if repeated:
+            response['X-N-Plus-One'] = str(len(repeated))
+        match = request.resolver_match
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+            'method': request.method,
+            # The view name, never the path: paths carry MR numbers and ids
+            'view': match.view_name if match else '<unresolved>',
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000, 2),
+            'template_ms': round(stats.template_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'streaming': response.streaming,
+            'n_plus_one': [{'count': count, 'sql': sql[:500]} for sql, count in repeated],
+        }))
+        return response
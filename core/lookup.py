@@ -0,0 +1,64 @@
+"""
+Public MR-number lookup (``patient_record_lookup``).
+
+The rendered record summary is cached per MR number and dropped whenever
+the patient or one of their records is written (see ``core.signals``).
+Unknown MR numbers are cached as well, for ``MISS_TTL`` seconds, so guessing
+numbers doesn't reach the database.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import replicas
+from .models import Patient, PatientRecord
+
+SUMMARY_TTL = getattr(settings, 'PUBLIC_LOOKUP_TTL', 3600)
+MISS_TTL = getattr(settings, 'PUBLIC_LOOKUP_MISS_TTL', 60)
+BURST = getattr(settings, 'PUBLIC_LOOKUP_BURST', 10)
+RATE = getattr(settings, 'PUBLIC_LOOKUP_RATE', 0.2)
+
+MAX_LENGTH = Patient._meta.get_field('mr_number').max_length
+MISSING = ''
+
+
+def _key(mr_number):
+    # MR numbers come straight from the query string; hash them into a safe key
+    return 'mr_lookup:' + hashlib.sha1(mr_number.encode()).hexdigest()
+
+
+def render_summary(mr_number):
+    patient = Patient.objects.filter(mr_number=mr_number).only('mr_number', 'first_name', 'last_name').first()
+    if patient is None:
+        return MISSING
+    records = (
+        PatientRecord.objects.filter(patient=patient)
+        .only('visit_date', 'symptoms', 'diagnosis', 'prescription', 'next_visit')
+        .order_by('-visit_date')
+    )
+    return render_to_string('core/includes/patient_record_summary.html', {'patient': patient, 'records': records})
+
+
+def record_summary(mr_number):
+    """The rendered summary for ``mr_number``, or None if there is no such patient."""
+    if not mr_number or len(mr_number) > MAX_LENGTH:
+        return None
+    key = _key(mr_number)
+    html = cache.get(key)
+    if html is None:
+        with replicas.reads_for(key):
+            html = render_summary(mr_number)
+        cache.set(key, html, SUMMARY_TTL if html else MISS_TTL)
+    return mark_safe(html) if html else None
+
+
+def invalidate(mr_number):
+    if not mr_number:
+        return
+    # As with the hospital snapshots, only drop the entry once the write is visible
+    transaction.on_commit(lambda: cache.delete(_key(mr_number)))
+    replicas.mark_changed(_key(mr_number))
@@ -0,0 +1,181 @@
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+
+from core import fragments, stats
+from core.models import HospitalAdmin
+from core.synthetic import create_patients, create_records, make_doctors, make_hospitals
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Compare dashboard latency under the WSGI and ASGI handlers, and of the async variants '
+            'under ASGI, with concurrent users (runs against a throwaway database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Concurrent users')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per user')
+        parser.add_argument('--patients', type=int, default=50000, help='Patients in the benchmarked hospital')
+        parser.add_argument('--visits', type=int, default=4, help='Visit records per patient')
+
+    def handle(self, *args, **options):
+        self.users = options['users']
+        self.per_user = options['requests']
+        # Requests run on other threads and connections, so the data has to be
+        # committed; build it in a temporary database rather than the real one.
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.populate(options['patients'], options['visits'])
+            self.report()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def populate(self, patients, visits):
+        started = time.perf_counter()
+        hospital = make_hospitals(1)[0]
+        doctors = make_doctors(hospital, 20)
+        for batch in create_patients([hospital], 0, patients, 10000):
+            for _ in create_records(batch, doctors, visits):
+                pass
+        stats.reconcile()
+        admin = User.objects.create(username='bench-hospital-admin')
+        HospitalAdmin.objects.create(user=admin, hospital=hospital, position='Admin', contact_number='0')
+        staff = User.objects.create(username='bench-staff', is_staff=True)
+        self.cookies = {'hospital': self.session_cookie(admin), 'staff': self.session_cookie(staff)}
+        self.stdout.write(f'Loaded {patients} patients and {patients * visits} visits in {time.perf_counter() - started:.1f}s')
+
+    def session_cookie(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def report(self):
+        # (label, sync view, async variant, user, cache TTL); the sync view
+        # runs under both handlers, the async variant only under ASGI
+        cases = [
+            ('hospital dashboard, uncached', 'hospital_admin_dashboard', 'hospital_admin_dashboard_async',
+             'hospital', 0),
+            ('hospital dashboard, cached', 'hospital_admin_dashboard', 'hospital_admin_dashboard_async',
+             'hospital', stats.HOSPITAL_SNAPSHOT_TTL),
+            ('admin dashboard', 'admin_dashboard', 'admin_dashboard_async', 'staff', stats.HOSPITAL_SNAPSHOT_TTL),
+        ]
+        self.stdout.write(f'{self.users} users x {self.per_user} requests each')
+        self.stdout.write(f"{'view':<30} {'handler':<11} {'p50':>9} {'p99':>9} {'req/s':>7}")
+        ttls = stats.HOSPITAL_SNAPSHOT_TTL, fragments.TTL
+        try:
+            for label, url_name, async_url_name, user, cache_ttl in cases:
+                # Zero timeouts make every request render the page and recompute the snapshot
+                stats.HOSPITAL_SNAPSHOT_TTL = cache_ttl
+                fragments.TTL = cache_ttl and ttls[1]
+                runs = (
+                    ('wsgi', self.run_wsgi, url_name),
+                    ('asgi', self.run_asgi, url_name),
+                    ('asgi async', self.run_asgi, async_url_name),
+                )
+                for handler, run, name in runs:
+                    path = reverse(name)
+                    run(path, self.cookies[user])  # warm up connections and caches
+                    started = time.perf_counter()
+                    samples = run(path, self.cookies[user])
+                    elapsed = time.perf_counter() - started
+                    samples.sort()
+                    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+                    self.stdout.write(f'{label:<30} {handler:<11} {statistics.median(samples):>7.1f}ms '
+                                      f'{p99:>7.1f}ms {len(samples) / elapsed:>7.0f}')
+        finally:
+            stats.HOSPITAL_SNAPSHOT_TTL, fragments.TTL = ttls
+
+    def run_wsgi(self, path, cookie):
+        application = WSGIHandler()
+        samples = []
+        lock = threading.Lock()
+
+        def start_response(status, headers, exc_info=None):
+            if not status.startswith('200'):
+                raise RuntimeError(f'{path} answered {status}')
+
+        def user():
+            for _ in range(self.per_user):
+                environ = {
+                    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                    'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                    'HTTP_HOST': HOST, 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+                    'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+                }
+                started = time.perf_counter()
+                response = application(environ, start_response)
+                b''.join(response)
+                response.close()  # sends request_finished, which closes the connection
+                with lock:
+                    samples.append((time.perf_counter() - started) * 1000)
+
+        with ThreadPoolExecutor(max_workers=self.users) as pool:
+            for future in [pool.submit(user) for _ in range(self.users)]:
+                future.result()
+        return samples
+
+    def run_asgi(self, path, cookie):
+        application = ASGIHandler()
+        samples = []
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+
+        async def request():
+            body_sent = False
+            status = None
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait()  # the client never disconnects
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            await application(dict(scope), receive, send)
+            if status != 200:
+                raise RuntimeError(f'{path} answered {status}')
+
+        async def user():
+            for _ in range(self.per_user):
+                started = time.perf_counter()
+                await request()
+                samples.append((time.perf_counter() - started) * 1000)
+
+        async def main():
+            await asyncio.gather(*(user() for _ in range(self.users)))
+
+        asyncio.run(main())
+        return samples
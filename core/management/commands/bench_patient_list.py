@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from core.models import Patient
+from core.pagination import encode_cursor
+from core.synthetic import Rollback, create_patients, make_hospitals
+from core.views import patient_list
+
+
+class Command(BaseCommand):
+    help = 'Benchmark patient_list latency as the Patient table grows (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma separated table sizes to measure at')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per measurement')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(','))
+        self.repeat = options['repeat']
+        self.batch_size = options['batch_size']
+        self.factory = RequestFactory()
+
+        self.stdout.write(f"{'patients':>10} {'first page':>12} {'middle page':>12} {'last page':>12} {'offset (middle)':>16}")
+        try:
+            with transaction.atomic():
+                self.user = User(username='bench', is_staff=True)
+                hospitals = make_hospitals(20)
+                inserted = 0
+                for size in sizes:
+                    self.populate(hospitals, inserted, size)
+                    inserted = size
+                    self.report(size)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, hospitals, start, end):
+        for _ in create_patients(hospitals, start, end, self.batch_size):
+            pass
+
+    def time_view(self, params):
+        samples = []
+        for _ in range(self.repeat):
+            request = self.factory.get('/patients/', params)
+            request.user = self.user
+            started = time.perf_counter()
+            patient_list(request)
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def time_offset(self, offset):
+        samples = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            list(Patient.objects.select_related('registered_at').order_by('-registration_date', '-id')[offset:offset + 25])
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def cursor_at(self, offset):
+        row = Patient.objects.order_by('-registration_date', '-id').values_list('registration_date', 'id')[offset]
+        return encode_cursor(row)
+
+    def report(self, size):
+        middle = size // 2
+        first = self.time_view({})
+        mid = self.time_view({'after': self.cursor_at(middle)})
+        last = self.time_view({'after': self.cursor_at(size - 26)})
+        offset = self.time_offset(middle)
+        self.stdout.write(f'{size:>10} {first:>10.2f}ms {mid:>10.2f}ms {last:>10.2f}ms {offset:>14.2f}ms')
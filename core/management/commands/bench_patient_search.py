@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import search
+from core.synthetic import Rollback, create_patients, make_hospitals
+
+QUERIES = [
+    'BENCH000123',      # exact MR number
+    'BENCH00001',       # MR prefix
+    'Fatima',           # common first name
+    'ayesha qureshi',   # first + last name
+    'Hass Mal',         # two short prefixes
+    '0300012',          # phone prefix
+    '0300-012',         # phone prefix as typed
+    'patient4567',      # email local part
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text patient search latency at a given table size (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Patient search requires the SQLite backend with FTS5')
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                hospitals = make_hospitals(20)
+                for batch in create_patients(hospitals, 0, options['size'], options['batch_size']):
+                    search.index_patients(batch, replace=False)
+                self.stdout.write(f"Loaded and indexed {options['size']} patients in {time.perf_counter() - started:.1f}s")
+                self.report(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, repeat):
+        self.stdout.write(f"{'query':<20} {'hits':>5} {'p50':>9} {'p95':>9}")
+        for query in QUERIES:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                results = search.search_patients(query, limit=25)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            self.stdout.write(f'{query:<20} {len(results):>5} {statistics.median(samples):>7.2f}ms {p95:>7.2f}ms')
@@ -0,0 +1,110 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import login
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core import sessions
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'core.sessions',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+class Command(BaseCommand):
+    help = ('Per-request overhead of loading (and sometimes saving) an authenticated session with each '
+            'session engine (runs against a throwaway database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--write-every', type=int, default=10,
+                            help='Change the session on every Nth request (0: never)')
+
+    def handle(self, *args, **options):
+        # Session writes must really commit to be measured, so no rollback here
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # core.sessions needs a shared cache; the file cache is the one available without a server
+        cache_dir = tempfile.mkdtemp()
+        shared = override_settings(CACHES=dict(settings.CACHES, **{settings.SESSION_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir,
+        }}))
+        shared.enable()
+        try:
+            self.user = User.objects.create_user('bench-sessions', password='unused')
+            self.stdout.write(f"{options['requests']} requests, session changed every "
+                              f"{options['write_every'] or 'never'}; write-behind interval "
+                              f"{sessions.WRITE_BEHIND_INTERVAL}s")
+            self.stdout.write(f"{'engine':<10} {'p50':>9} {'p95':>9} {'mean':>9} {'session queries/request':>24}")
+            for name, engine in ENGINES.items():
+                with override_settings(SESSION_ENGINE=engine):
+                    caches[settings.SESSION_CACHE_ALIAS].clear()
+                    self.run(name, options['requests'], options['write_every'])
+        finally:
+            shared.disable()
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self, name, requests, write_every):
+        factory = RequestFactory()
+
+        def sign_in(request):
+            login(request, self.user, backend=settings.AUTHENTICATION_BACKENDS[0])
+            return HttpResponse()
+
+        def page(request):
+            if not request.user.is_authenticated:
+                raise RuntimeError('session lost')
+            if write_every and request.n % write_every == 0:
+                request.session['last_page'] = request.n
+            return HttpResponse()
+
+        def send(view, cookie, n=0):
+            request = factory.get('/')
+            request.n = n
+            if cookie:
+                request.COOKIES[settings.SESSION_COOKIE_NAME] = cookie
+            response = SessionMiddleware(AuthenticationMiddleware(view))(request)
+            # What the request_finished receiver does after the response is sent
+            sessions.flush_due()
+            morsel = response.cookies.get(settings.SESSION_COOKIE_NAME)
+            return morsel.value if morsel else cookie
+
+        session_queries = 0
+
+        def count_session_queries(execute, sql, params, many, context):
+            nonlocal session_queries
+            session_queries += 'django_session' in sql
+            return execute(sql, params, many, context)
+
+        cookie = send(sign_in, None)
+        samples = []
+        with connection.execute_wrapper(count_session_queries):
+            for n in range(1, requests + 1):
+                started = time.perf_counter()
+                cookie = send(page, cookie, n)
+                samples.append((time.perf_counter() - started) * 1e6)
+            sessions.flush()
+        samples.sort()
+        self.stdout.write(f"{name:<10} {statistics.median(samples):>7.0f}us "
+                          f"{samples[int(len(samples) * 0.95)]:>7.0f}us {statistics.mean(samples):>7.0f}us "
+                          f"{session_queries / requests:>24.3f}")
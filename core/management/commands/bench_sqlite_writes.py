@@ -0,0 +1,129 @@
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.db.utils import load_backend
+
+from core import stats
+from core.models import Patient, PatientRecord
+from core.synthetic import create_patients, make_doctors, make_hospitals
+
+CONFIGURATIONS = {
+    # What settings.DATABASES used to be: rollback journal, DEFERRED
+    # transactions, Python's default 5s timeout, a connection per request
+    'stock': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}, 'CONN_MAX_AGE': 0},
+    'tuned': {'ENGINE': 'core.backends.sqlite3', 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}, 'CONN_MAX_AGE': 600},
+}
+
+
+class Command(BaseCommand):
+    help = ('Concurrent visit-record writes (as add_patient_record does) alongside readers, on the stock and '
+            'the tuned SQLite configuration (runs against a throwaway database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--patients', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark compares SQLite configurations')
+        self.options = options
+        workdir = tempfile.mkdtemp()
+        template = os.path.join(workdir, 'template.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = template
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.populate(options['patients'])
+            self.settings_dict = dict(connection.settings_dict)
+            connection.close()
+            self.stdout.write(f"{options['writers']} writers, {options['readers']} readers, {options['seconds']:.0f}s each")
+            self.stdout.write(f"{'config':<6} {'journal':<8} {'writes/s':>9} {'reads/s':>8} {'write p50':>10} {'write p99':>10} {'locked':>7}")
+            for name, config in CONFIGURATIONS.items():
+                path = os.path.join(workdir, f'{name}.sqlite3')
+                shutil.copy(template, path)
+                self.run(name, {**self.settings_dict, **config, 'NAME': path})
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def populate(self, patients):
+        hospital = make_hospitals(1)[0]
+        self.doctor_ids = [d.pk for d in make_doctors(hospital, 10)]
+        for _ in create_patients([hospital], 0, patients, 5000):
+            pass
+        self.patient_ids = list(Patient.objects.values_list('id', flat=True))
+        self.hospital_id = hospital.pk
+        stats.reconcile()
+        # Copies start from a rollback journal; the tuned backend switches its copy to WAL
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = DELETE')
+
+    def run(self, name, settings_dict):
+        wrapper_class = load_backend(settings_dict['ENGINE']).DatabaseWrapper
+        deadline = time.monotonic() + self.options['seconds']
+        lock = threading.Lock()
+        results = {'latencies': [], 'reads': 0, 'locked': 0}
+
+        def request(work):
+            # One request: Django closes the connection afterwards unless
+            # CONN_MAX_AGE keeps it
+            close_old_connections()
+            try:
+                work()
+            finally:
+                close_old_connections()
+
+        def write(n):
+            patient_id = self.patient_ids[n % len(self.patient_ids)]
+            PatientRecord(patient=Patient.objects.get(pk=patient_id), doctor_id=self.doctor_ids[n % len(self.doctor_ids)],
+                          symptoms=f'Fever and cough {n}', diagnosis='Viral infection', prescription='Rest and fluids').save()
+
+        def read(n):
+            list(PatientRecord.objects.filter(hospital=self.hospital_id).order_by('-visit_date', '-id')[:25])
+            stats.compute_hospital_snapshot(self.hospital_id)
+
+        def worker(work, seed, is_writer):
+            connections['default'] = wrapper_class(settings_dict, 'default')
+            n = seed
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    request(lambda: work(n))
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    with lock:
+                        results['locked'] += 1
+                else:
+                    with lock:
+                        if is_writer:
+                            results['latencies'].append((time.perf_counter() - started) * 1000)
+                        else:
+                            results['reads'] += 1
+                n += 1000
+            connections['default'].close()
+
+        threads = [threading.Thread(target=worker, args=(write, i, True)) for i in range(self.options['writers'])]
+        threads += [threading.Thread(target=worker, args=(read, i, False)) for i in range(self.options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(results['latencies']) or [0]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        with sqlite3.connect(settings_dict['NAME']) as check:
+            journal = check.execute('PRAGMA journal_mode').fetchone()[0]
+        self.stdout.write(f"{name:<6} {journal:<8} {len(results['latencies']) / elapsed:>9.0f} "
+                          f"{results['reads'] / elapsed:>8.0f} {statistics.median(latencies):>8.1f}ms {p99:>8.1f}ms "
+                          f"{results['locked']:>7}")
@@ -0,0 +1,228 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from core import metrics, urls as core_urls
+from core.models import Clinic, Doctor, Hospital, HospitalAdmin, Patient, PatientRecord
+from core.synthetic import Rollback
+
+HOST = 'localhost'
+
+
+class Scenario:
+    """One request to benchmark: ``args`` and ``params``/``data`` may be callables taking the fixture dict."""
+
+    def __init__(self, url_name, role, args=(), params=None, method='get', data=None, label=None, extra=None):
+        self.url_name = url_name
+        self.role = role
+        self.args = args
+        self.params = params or {}
+        self.method = method
+        self.data = data
+        self.extra = extra or {}
+        self.label = label or (url_name if method == 'get' else f'{url_name} ({method.upper()})')
+
+    def resolve(self, value, fixture, n):
+        return value(fixture, n) if callable(value) else value
+
+
+SCENARIOS = [
+    Scenario('doctor_login', 'anonymous'),
+    Scenario('admin_login', 'anonymous'),
+    Scenario('hospital_admin_login', 'anonymous'),
+    Scenario('dashboard', 'user'),
+    Scenario('patient_list', 'staff'),
+    Scenario('add_patient', 'hospital_admin'),
+    Scenario('add_patient', 'hospital_admin', method='post', data=lambda f, n: {
+        'first_name': 'Bench', 'last_name': f'Patient{n}', 'date_of_birth': '1990-01-01', 'gender': 'F',
+        'address': 'House 1, Street 1', 'contact_number': '03001234567', 'registered_at': f['hospital'].pk,
+    }),
+    Scenario('patient_search', 'staff', params={'q': 'fatima khan'}),
+    Scenario('patient_detail', 'doctor', args=lambda f, n: [f['patient'].mr_number]),
+    Scenario('add_patient_record', 'doctor', args=lambda f, n: [f['patient'].mr_number]),
+    Scenario('add_patient_record', 'doctor', args=lambda f, n: [f['patient'].mr_number], method='post', data={
+        'symptoms': 'Fever and cough', 'diagnosis': 'Viral fever', 'prescription': 'Paracetamol',
+    }),
+    Scenario('patient_timeline', 'doctor', args=lambda f, n: [f['patient'].mr_number]),
+    Scenario('patient_visit', 'doctor', args=lambda f, n: [f['patient'].mr_number, f['record'].pk]),
+    Scenario('register', 'anonymous'),
+    Scenario('register_doctor', 'anonymous'),
+    Scenario('register_hospital', 'anonymous'),
+    Scenario('register_clinic', 'anonymous'),
+    Scenario('register_admin', 'anonymous'),
+    Scenario('register_patient', 'anonymous'),
+    Scenario('admin_dashboard', 'staff'),
+    Scenario('hospital_admin_dashboard', 'hospital_admin'),
+    Scenario('admin_dashboard_async', 'staff'),
+    Scenario('hospital_admin_dashboard_async', 'hospital_admin'),
+    Scenario('patient_record_lookup', 'anonymous', params=lambda f, n: {'mr_number': f['patient'].mr_number}),
+    Scenario('record_search', 'staff', params={'q': 'dengue fever'}),
+    Scenario('export_patients', 'hospital_admin'),
+    Scenario('export_records', 'hospital_admin', params={'date_from': '2024-01-01'}),
+    Scenario('doctor_dashboard', 'doctor'),
+    Scenario('api_list', 'staff', args=['patients'], label='api_list (patients)'),
+    Scenario('api_list', 'hospital_admin', args=['records'], label='api_list (records)'),
+    Scenario('api_detail', 'staff', args=lambda f, n: ['patients', f['patient'].pk]),
+    Scenario('metrics', 'anonymous',
+             extra={'REMOTE_ADDR': '127.0.0.1', 'HTTP_AUTHORIZATION': f'Bearer {metrics.TOKEN}'}),
+    Scenario('facility_autocomplete', 'anonymous', args=['hospitals'], params={'q': 'gen'},
+             label='facility_autocomplete (hospitals)'),
+    Scenario('facility_autocomplete', 'anonymous', args=['clinics'], params={'q': 'card'},
+             label='facility_autocomplete (clinics)'),
+]
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Request every URL in core/urls.py with the test client and report throughput, p50/p95/p99 '
+            'latency and query counts per view as JSON (writes are rolled back)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', action='append', help='Run only scenarios with this URL name (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', help='Earlier JSON report to print p50/p95 changes against')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['only'] or s.url_name in options['only']]
+        if not metrics.ENABLED:
+            # /metrics is a 404 until METRICS_ENABLED is set
+            scenarios = [s for s in scenarios if s.url_name != 'metrics']
+        covered = {s.url_name for s in SCENARIOS}
+        uncovered = sorted(p.name for p in core_urls.urlpatterns if isinstance(p, URLPattern) and p.name not in covered)
+        report = {'meta': self.meta(options), 'uncovered_urls': uncovered, 'views': {}}
+        try:
+            with transaction.atomic():
+                fixture = self.fixture()
+                clients = self.clients(fixture)
+                for scenario in scenarios:
+                    report['views'][scenario.label] = self.measure(scenario, clients, fixture, options)
+                    if options['output']:
+                        self.stderr.write(self.summary_line(scenario.label, report['views'][scenario.label]))
+                raise Rollback
+        except Rollback:
+            pass
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if uncovered:
+            self.stderr.write(f'No scenario for: {", ".join(uncovered)}')
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def meta(self, options):
+        try:
+            revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                      timeout=10).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            revision = None
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': revision,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'requests_per_view': options['requests'],
+            'rows': {model._meta.label: model.objects.count()
+                     for model in (Hospital, Clinic, Doctor, Patient, PatientRecord)},
+        }
+
+    def fixture(self):
+        record = (
+            PatientRecord.objects.filter(doctor__isnull=False).select_related('patient', 'doctor__user')
+            .order_by('-id').first()
+        )
+        if record is None:
+            raise CommandError('No visit records to benchmark against; run "manage.py seed" first')
+        hospital = Hospital.objects.get(pk=record.patient.registered_at_id)
+        staff = User.objects.create(username='bench-urls-staff', is_staff=True)
+        admin = User.objects.create(username='bench-urls-hospital-admin')
+        HospitalAdmin.objects.create(user=admin, hospital=hospital, position='Admin', contact_number='0')
+        user = User.objects.create(username='bench-urls-user')
+        return {
+            'hospital': hospital, 'patient': record.patient, 'record': record,
+            'users': {'staff': staff, 'hospital_admin': admin, 'doctor': record.doctor.user, 'user': user},
+        }
+
+    def clients(self, fixture):
+        clients = {'anonymous': Client(HTTP_HOST=HOST)}
+        for role, user in fixture['users'].items():
+            clients[role] = Client(HTTP_HOST=HOST)
+            clients[role].force_login(user)
+        return clients
+
+    def request(self, scenario, client, fixture, n):
+        url = reverse(scenario.url_name, args=scenario.resolve(scenario.args, fixture, n))
+        # A distinct address per request keeps the public lookup's rate limit out of the numbers
+        extra = {'REMOTE_ADDR': f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}', **scenario.extra}
+        if scenario.method == 'post':
+            response = client.post(url, scenario.resolve(scenario.data, fixture, n), **extra)
+        else:
+            response = client.get(url, scenario.resolve(scenario.params, fixture, n), **extra)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def measure(self, scenario, clients, fixture, options):
+        client = clients[scenario.role]
+        cache.clear()
+        caches['local'].clear()
+        for n in range(options['warmup']):
+            self.request(scenario, client, fixture, n)
+        samples, queries, statuses = [], [], {}
+        started = time.perf_counter()
+        for n in range(options['warmup'], options['warmup'] + options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                begun = time.perf_counter()
+                status = self.request(scenario, client, fixture, n)
+                samples.append((time.perf_counter() - begun) * 1000)
+            queries.append(len(captured))
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        elapsed = time.perf_counter() - started
+        samples.sort()
+        return {
+            'url': scenario.url_name,
+            'method': scenario.method.upper(),
+            'role': scenario.role,
+            'status': statuses,
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(percentile(samples, 0.95), 2),
+            'p99_ms': round(percentile(samples, 0.99), 2),
+            'queries': {'median': statistics.median(queries), 'max': max(queries)},
+        }
+
+    def summary_line(self, label, result):
+        return (f"{label:<32} {result['p50_ms']:>9.2f}ms {result['p95_ms']:>9.2f}ms {result['p99_ms']:>9.2f}ms "
+                f"{result['queries']['median']:>5} queries")
+
+    def compare(self, path, report):
+        with open(path) as f:
+            baseline = json.load(f)['views']
+        self.stderr.write(f"{'view':<32} {'p50 before':>11} {'after':>9} {'p95 before':>11} {'after':>9}")
+        for label, result in report['views'].items():
+            old = baseline.get(label)
+            if old is None:
+                continue
+            self.stderr.write(f"{label:<32} {old['p50_ms']:>9.2f}ms {result['p50_ms']:>7.2f}ms "
+                              f"{old['p95_ms']:>9.2f}ms {result['p95_ms']:>7.2f}ms")
@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core import hospital_names
+from core.models import Hospital
+
+
+class Command(BaseCommand):
+    help = ('Merge the placeholder hospitals clinic registration created for a name into the hospital '
+            'of the same (normalized) name; real hospitals are never merged')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be merged without writing')
+        parser.add_argument('--fuzzy', action='store_true',
+                            help='Also merge a placeholder into the most similar other hospital '
+                                 f'(trigram similarity >= {hospital_names.SIMILARITY_THRESHOLD})')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Recompute normalized names and trigrams first (after bulk loads)')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            total = hospital_names.rebuild_index()
+            self.stdout.write(f'Reindexed {total} hospitals')
+
+        groups = defaultdict(list)
+        for hospital in Hospital.objects.order_by('id'):
+            groups[hospital.normalized_name].append(hospital)
+
+        merges = []
+        for key, hospitals in groups.items():
+            if not key:
+                continue
+            # The oldest real hospital survives; failing that, the oldest placeholder
+            real = [h for h in hospitals if not hospital_names.is_placeholder(h)]
+            survivor = (real or hospitals)[0]
+            merges.extend((h, survivor, 1.0) for h in hospitals if h != survivor and hospital_names.is_placeholder(h))
+            if len(real) > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'{len(real)} registered hospitals are named {real[0].name!r}; left alone'
+                ))
+
+        if options['fuzzy']:
+            merged = {duplicate.pk for duplicate, _, _ in merges}
+            for hospitals in groups.values():
+                # Only a name nobody registered for real is a likely misspelling
+                if any(not hospital_names.is_placeholder(h) for h in hospitals):
+                    continue
+                exclude = merged | {h.pk for h in hospitals}
+                for match, score in hospital_names.similar(hospitals[0].name, exclude=exclude):
+                    if not hospital_names.is_placeholder(match):
+                        merges.append((hospitals[0], match, score))
+                        merged.add(hospitals[0].pk)
+                        break
+
+        for duplicate, into, score in merges:
+            self.stdout.write(f'{duplicate.pk} {duplicate.name!r} -> {into.pk} {into.name!r} (similarity {score:.2f})')
+            if not options['dry_run']:
+                hospital_names.merge(duplicate, into)
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(merges)} placeholder hospital(s) to merge; nothing written (dry run)')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Merged {len(merges)} placeholder hospital(s)'))
+
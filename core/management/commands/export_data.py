@@ -0,0 +1,51 @@
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+from core.models import Hospital
+
+
+class Command(BaseCommand):
+    help = 'Stream a gzip-compressed patient or visit record extract, optionally for one hospital and date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--hospital', type=int, help='Hospital id (default: all hospitals)')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--output', help="Output file, or '-' for stdout (default: a dated file name)")
+        parser.add_argument('--no-gzip', action='store_true', help='Write plain text instead of gzip')
+
+    def handle(self, *args, **options):
+        hospital = None
+        if options['hospital'] is not None:
+            try:
+                hospital = Hospital.objects.get(pk=options['hospital'])
+            except Hospital.DoesNotExist:
+                raise CommandError(f"Hospital {options['hospital']} does not exist")
+        if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+            raise CommandError('--from must not be after --to')
+
+        kind, fmt, compress = options['kind'], options['format'], not options['no_gzip']
+        chunks = exports.export_chunks(
+            kind, fmt, compress=compress,
+            hospital=hospital, date_from=options['date_from'], date_to=options['date_to'],
+        )
+        output = options['output'] or exports.filename(kind, fmt, hospital, compress)
+        started = time.perf_counter()
+        written = 0
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if output != '-':
+                stream.close()
+        if output != '-':
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written:,} bytes to {output} in {elapsed:.1f}s'))
@@ -0,0 +1,201 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core import bulk, mrn
+from core.forms import PatientImportForm
+from core.models import Hospital, Patient
+
+HOSPITAL_KEYS = {
+    'id': lambda value: str(value).strip(),
+    'registration_number': lambda value: str(value).strip(),
+    'name': lambda value: ' '.join(str(value).split()).casefold(),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream patients from a CSV or NDJSON file (optionally .gz) into the database. '
+        'Rows are validated with the PatientForm rules and rows without an MR number get the hospital\'s next one; '
+        'rejected rows are written to a reject file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk_create/transaction')
+        parser.add_argument('--hospital-key', choices=sorted(HOSPITAL_KEYS), default='id',
+                            help='Which Hospital column the registered_at values refer to')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: <path>.rejects.<format>)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, write nothing')
+        parser.add_argument('--progress-every', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self.guess_format(path)
+        self.batch_size = max(1, options['batch_size'])
+        self.dry_run = options['dry_run']
+        self.normalize = HOSPITAL_KEYS[options['hospital_key']]
+        self.hospitals = self.load_hospitals(options['hospital_key'])
+        self.form = PatientImportForm({}, hospitals=self.hospitals, hospital_key=self.normalize)
+
+        rejects_path = options['rejects'] or (f'reject.{fmt}' if path == '-' else f'{path}.rejects.{fmt}')
+        self.read = self.imported = self.rejected = 0
+        self.seen = set()
+        self.started = time.perf_counter()
+
+        with self.open_input(path) as source, open(rejects_path, 'w', newline='', encoding='utf-8') as rejects:
+            self.rejects = RejectWriter(rejects, fmt)
+            pending = []
+            for row in self.rows(source, fmt):
+                self.read += 1
+                patient = self.validate(row)
+                if patient is not None:
+                    pending.append((row, patient))
+                if len(pending) >= self.batch_size:
+                    self.flush(pending)
+                    pending = []
+                if options['progress_every'] and self.read % options['progress_every'] == 0:
+                    self.stdout.write(self.progress())
+            self.flush(pending)
+
+        self.stdout.write(self.style.SUCCESS(self.progress(final=True)))
+        if self.rejected:
+            self.stdout.write(self.style.WARNING(f'{self.rejected} rejected row(s) written to {rejects_path}'))
+
+    def guess_format(self, path):
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith(('.ndjson', '.jsonl', '.json')):
+            return 'ndjson'
+        if name.endswith('.csv') or path == '-':
+            return 'csv'
+        raise CommandError('Cannot tell the input format from the file name; pass --format')
+
+    def open_input(self, path):
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+        return open(path, encoding='utf-8-sig', newline='')
+
+    def rows(self, source, fmt):
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {'_line': line_number, '_raw': line}
+                self.read += 1
+                self.reject(row, {'__all__': [f'Invalid JSON: {e}']})
+                continue
+            if not isinstance(row, dict):
+                self.read += 1
+                self.reject({'_line': line_number, '_raw': line}, {'__all__': ['Expected a JSON object']})
+                continue
+            yield {key: '' if value is None else str(value) for key, value in row.items()}
+
+    def load_hospitals(self, key):
+        hospitals = {}
+        column = 'pk' if key == 'id' else key
+        for hospital in Hospital.objects.only('id', 'name', 'registration_number').iterator():
+            normalized = self.normalize(getattr(hospital, column))
+            # A key shared by several hospitals can't be resolved safely
+            hospitals[normalized] = None if normalized in hospitals else hospital
+        return hospitals
+
+    def validate(self, row):
+        form = self.form.rebind(row)
+        if not form.is_valid():
+            self.reject(row, form.errors)
+            return None
+        patient = form.instance
+        if not patient.mr_number:
+            if self.dry_run:
+                return patient
+            patient.mr_number = mrn.allocate(patient.registered_at_id)
+        if patient.mr_number in self.seen:
+            self.reject(row, {'mr_number': ['Duplicate MR number within the file']})
+            return None
+        self.seen.add(patient.mr_number)
+        return patient
+
+    def flush(self, pending):
+        if not pending:
+            return
+        existing = set(
+            Patient.objects.filter(mr_number__in=[p.mr_number for _, p in pending]).values_list('mr_number', flat=True)
+        )
+        batch = []
+        for row, patient in pending:
+            if patient.mr_number in existing:
+                self.reject(row, {'mr_number': ['Patient with this MR number already exists']})
+            else:
+                batch.append((row, patient))
+        if not batch or self.dry_run:
+            self.imported += len(batch)
+            return
+
+        today = date.today()
+        for _, patient in batch:
+            if patient.registration_date is None:
+                patient.registration_date = today
+        try:
+            with transaction.atomic():
+                created = Patient.objects.bulk_create([p for _, p in batch])
+                bulk.patients_created(created)
+            self.imported += len(created)
+        except IntegrityError:
+            # Lost a race with another writer; fall back to row by row for this batch
+            for row, patient in batch:
+                self.insert_one(row, patient)
+
+    def insert_one(self, row, patient):
+        patient.pk = None
+        try:
+            with transaction.atomic():
+                Patient.objects.bulk_create([patient])
+                bulk.patients_created([patient])
+            self.imported += 1
+        except IntegrityError as e:
+            self.reject(row, {'__all__': [str(e)]})
+
+    def reject(self, row, errors):
+        self.rejected += 1
+        self.rejects.write(row, errors)
+
+    def progress(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.read / elapsed if elapsed else 0
+        label = 'Done' if final else 'Progress'
+        verb = 'validated' if self.dry_run else 'imported'
+        return (f'{label}: {self.read} read, {self.imported} {verb}, {self.rejected} rejected '
+                f'in {elapsed:.1f}s ({rate:,.0f} rows/s)')
+
+
+class RejectWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.csv = None
+
+    def write(self, row, errors):
+        messages = '; '.join(f'{field}: {" ".join(str(m) for m in msgs)}' for field, msgs in errors.items())
+        if self.fmt == 'ndjson':
+            self.stream.write(json.dumps({**row, '_errors': messages}) + '\n')
+            return
+        if self.csv is None:
+            self.csv = csv.DictWriter(self.stream, fieldnames=[*row.keys(), '_errors'], extrasaction='ignore')
+            self.csv.writeheader()
+        self.csv.writerow({**row, '_errors': messages})
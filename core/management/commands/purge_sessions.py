@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Delete expired sessions in small batches, so a large purge never holds the '
+            'database write lock for long (unlike clearsessions)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, letting requests write')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.signed_cookies':
+            self.stdout.write('Sessions are signed cookies; there is nothing stored to purge')
+            return
+        started = time.perf_counter()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)
+                        [:options['batch_size']])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired sessions in {time.perf_counter() - started:.1f}s'
+        ))
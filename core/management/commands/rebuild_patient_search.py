@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text patient search index from the Patient table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Patient search requires the SQLite backend with FTS5')
+        started = time.perf_counter()
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} patients in {elapsed:.1f}s'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+from core.models import StatCounter
+
+
+class Command(BaseCommand):
+    help = 'Recount the dashboard counters from their tables and correct any drift (safe to run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing corrections')
+
+    def handle(self, *args, **options):
+        stored = dict(StatCounter.objects.values_list('name', 'value'))
+        if options['dry_run']:
+            actual = {name: model.objects.count() for name, model in stats.COUNTED_MODELS.items()}
+        else:
+            actual = stats.reconcile()
+
+        drifted = 0
+        for name, value in actual.items():
+            before = stored.get(name)
+            if before == value:
+                self.stdout.write(f'{name}: {value}')
+            else:
+                drifted += 1
+                self.stdout.write(self.style.WARNING(f'{name}: stored {before}, actual {value}'))
+
+        if options['dry_run']:
+            self.stdout.write(f'{drifted} counter(s) drifted; nothing written (dry run)')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {len(actual)} counter(s), {drifted} corrected'))
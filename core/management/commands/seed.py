@@ -0,0 +1,59 @@
+import time
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import api, bulk, stats
+from core.models import Clinic, Doctor, Hospital, Patient
+from core.synthetic import create_patients, create_records, seed_clinics, seed_doctors, seed_hospitals
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic hospitals, clinics, doctors, patients and visit records with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type=int, default=20)
+        parser.add_argument('--clinics', type=int, default=5, help='Clinics per hospital')
+        parser.add_argument('--doctors', type=int, default=4, help='Doctors per clinic')
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--visits', type=int, default=5, help='Average visit records per patient')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            hospitals = seed_hospitals(options['hospitals'], start=Hospital.objects.count())
+            clinics = seed_clinics(hospitals, options['clinics'])
+            doctors = seed_doctors(clinics, options['doctors'])
+        doctors_by_hospital = defaultdict(list)
+        clinic_hospital = {clinic.pk: clinic.hospital_id for clinic in clinics}
+        for doctor in doctors:
+            doctors_by_hospital[clinic_hospital[doctor.clinic_id]].append(doctor)
+        self.stdout.write(f'{len(hospitals)} hospitals, {len(clinics)} clinics, {len(doctors)} doctors')
+
+        # Synthetic MR numbers are numbered; carry on after any earlier seed
+        start = Patient.objects.filter(mr_number__startswith='BENCH').count()
+        patients = records = 0
+        for batch in create_patients(hospitals, start, start + options['patients'], batch_size):
+            with transaction.atomic():
+                bulk.patients_created(batch)
+                by_hospital = defaultdict(list)
+                for patient in batch:
+                    by_hospital[patient.registered_at_id].append(patient)
+                for hospital_id, group in by_hospital.items():
+                    for saved in create_records(group, doctors_by_hospital[hospital_id], options['visits'],
+                                                batch_size, vary=True):
+                        bulk.records_created(saved)
+                        records += len(saved)
+            patients += len(batch)
+            self.stdout.write(f'{patients} patients, {records} visit records ({time.perf_counter() - started:.0f}s)')
+
+        stats.adjust(Hospital, len(hospitals))
+        stats.adjust(Doctor, len(doctors))
+        for model in (Hospital, Clinic, Doctor, User):
+            api.touch(model)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Seeded {patients} patients and {records} visit records in {elapsed:.1f}s'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the default SQLite database into the read replicas (a local stand-in for replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='aliases',
+                            help='Replica alias to refresh (repeatable; default: REPLICA_DATABASES)')
+        parser.add_argument('--interval', type=float,
+                            help='Keep refreshing every INTERVAL seconds, which then is the replication lag')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas.REPLICAS
+        if not aliases:
+            raise CommandError('No replicas: set REPLICA_DATABASES or pass --database')
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if alias not in connections or connections[alias].vendor != 'sqlite':
+                raise CommandError(f'"{alias}" is not a configured SQLite database')
+        while True:
+            started = time.perf_counter()
+            replicas.sync(targets=aliases)
+            self.stdout.write(f'Synced {", ".join(aliases)} in {(time.perf_counter() - started) * 1000:.0f}ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
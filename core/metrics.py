@@ -0,0 +1,339 @@
+"""
+Prometheus metrics for ``/metrics``.
+
+Every worker process keeps its values in its own memory-mapped file under
+``METRICS_DIR`` (``<pid>.db``), so recording a sample is a dict lookup and an
+in-place float update under a per-process lock, with nothing shared between
+processes. A scrape reads every file in the directory and adds the values
+up, which is what lets one worker answer for all of them. Empty the
+directory when the server is (re)started; counters of exited workers are
+otherwise kept, as Prometheus expects of a counter.
+
+Recorded:
+
+* requests by view, method and status, and their latency per view
+  (``MetricsMiddleware``; streamed responses are timed up to the first byte)
+* every SQL query's duration per database alias (a wrapper installed on each
+  connection, see ``core.signals``)
+* cache reads by cache and hit/miss (the ``LocMemCache`` backend below)
+* successful and failed logins (``core.signals``)
+
+Row counts of the core tables are read when scraped.
+
+Off unless ``METRICS_ENABLED``. Scrapes are answered only from
+``METRICS_ALLOWED_NETWORKS`` and, when ``METRICS_TOKEN`` is set, only with
+that bearer token: behind a reverse proxy on the same host every request
+comes from 127.0.0.1.
+"""
+import bisect
+import hmac
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache.backends import locmem
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+
+ENABLED = getattr(settings, 'METRICS_ENABLED', False)
+DIRECTORY = os.fspath(getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'health_system_metrics')))
+ALLOWED_NETWORKS = [ipaddress.ip_network(net) for net in getattr(settings, 'METRICS_ALLOWED_NETWORKS', [
+    '127.0.0.0/8', '::1/128',
+])]
+TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_HEADER = struct.Struct('<Q')  # bytes of the file in use
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 1 << 16
+
+
+def _entries(data, used):
+    """``(key, value, offset of value)`` for each entry of a values file."""
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        key_start = position + _LENGTH.size
+        value_at = key_start + length + (-(key_start + length) % 8)
+        yield data[key_start:key_start + length].decode(), _VALUE.unpack_from(data, value_at)[0], value_at
+        position = value_at + _VALUE.size
+
+
+class ValuesFile:
+    """One process's samples: ``key -> float`` entries appended to an mmap."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(os.path.join(directory, f'{self.pid}.db'), 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._offsets = {key: offset for key, _, offset in _entries(self._map, self._used)}
+
+    def _append(self, key):
+        encoded = key.encode()
+        key_start = self._used + _LENGTH.size
+        value_at = key_start + len(encoded) + (-(key_start + len(encoded)) % 8)
+        end = value_at + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        _LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[key_start:key_start + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, value_at, 0.0)
+        # Publish the entry only once it is complete; scrapes read up to here
+        _HEADER.pack_into(self._map, 0, end)
+        self._used = end
+        self._offsets[key] = value_at
+        return value_at
+
+    def inc(self, key, amount):
+        with self._lock:
+            offset = self._offsets.get(key) or self._append(key)
+            _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+
+_values = None
+_values_lock = threading.Lock()
+
+
+def _process_values():
+    global _values
+    values = _values
+    # A forked worker must not keep writing into its parent's file
+    if values is None or values.pid != os.getpid() or values.directory != DIRECTORY:
+        with _values_lock:
+            values = _values
+            if values is None or values.pid != os.getpid() or values.directory != DIRECTORY:
+                values = _values = ValuesFile(DIRECTORY)
+    return values
+
+
+def collect():
+    """Values of every process's file, summed: ``{(name, labels): value}``."""
+    totals = defaultdict(float)
+    try:
+        names = sorted(os.listdir(DIRECTORY))
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not name.endswith('.db'):
+            continue
+        try:
+            with open(os.path.join(DIRECTORY, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+        for key, value, _ in _entries(data, used):
+            metric, labels = json.loads(key)
+            totals[metric, tuple(map(tuple, labels))] += value
+    return totals
+
+
+@lru_cache(maxsize=4096)
+def _key(metric, labels):
+    return json.dumps([metric, labels])
+
+
+REGISTRY = []
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _labels(self, labels):
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def _inc(self, metric, labels, amount):
+        if ENABLED:
+            _process_values().inc(_key(metric, labels), amount)
+
+    def samples(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._inc(self.name, self._labels(labels), amount)
+
+    def samples(self, values):
+        for labels, value in sorted((labels, value) for (name, labels), value in values.items() if name == self.name):
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+        self._bounds = [repr(b) for b in self.buckets] + ['+Inf']
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        # Buckets are stored per interval and summed into "le" buckets when scraped
+        bound = self._bounds[bisect.bisect_left(self.buckets, value)]
+        self._inc(f'{self.name}_bucket', labels + (('le', bound),), 1)
+        self._inc(f'{self.name}_sum', labels, value)
+
+    def samples(self, values):
+        series = defaultdict(dict)
+        sums = {}
+        for (name, labels), value in values.items():
+            if name == f'{self.name}_bucket':
+                series[labels[:-1]][labels[-1][1]] = value
+            elif name == f'{self.name}_sum':
+                sums[labels] = value
+        for labels in sorted(series):
+            total = 0
+            for bound in self._bounds:
+                total += series[labels].get(bound, 0)
+                yield f'{self.name}_bucket', labels + (('le', bound),), total
+            yield f'{self.name}_count', labels, total
+            yield f'{self.name}_sum', labels, sums.get(labels, 0)
+
+
+REQUESTS = Counter('django_http_requests_total', 'HTTP requests by view, method and status code.',
+                   ('view', 'method', 'status'))
+REQUEST_DURATION = Histogram('django_http_request_duration_seconds', 'Time from request to response, by view.',
+                             ('view',))
+DB_QUERY_DURATION = Histogram('django_db_query_duration_seconds', 'SQL statement execution time, by database alias.',
+                              ('alias',), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+CACHE_READS = Counter('django_cache_reads_total', 'Cache reads by cache and result (hit or miss).', ('cache', 'result'))
+LOGINS = Counter('django_logins_total', 'Login attempts by result (success or failure).', ('result',))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{label}="{_escape(text)}"' for label, text in labels) + '}'
+    return f'{name} {value!r}'
+
+
+def table_rows():
+    """Current row counts of the core tables, ``{model label: rows}``."""
+    # Imported here: this module is also the cache backend, which may load before the app registry
+    from . import stats
+    from .models import Clinic, HospitalAdmin
+
+    rows = {stats.COUNTED_MODELS[name]._meta.label: value for name, value in stats.global_counts().items()}
+    # Small tables without a maintained counter
+    for model in (Clinic, HospitalAdmin):
+        rows[model._meta.label] = model.objects.count()
+    return rows
+
+
+def render():
+    values = collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(_format(*sample) for sample in metric.samples(values))
+    lines.append('# HELP core_table_rows Rows in each core table.')
+    lines.append('# TYPE core_table_rows gauge')
+    lines.extend(_format('core_table_rows', (('model', label),), float(rows))
+                 for label, rows in sorted(table_rows().items()))
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    if not any(address in network for network in ALLOWED_NETWORKS):
+        return False
+    if TOKEN:
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {TOKEN}')
+    return True
+
+
+def metrics_view(request):
+    if not ENABLED:
+        return HttpResponseNotFound()
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        # The view name, never the path: paths carry MR numbers and ids
+        view = match.view_name if match else '<unresolved>'
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_DURATION.observe(elapsed, view=view)
+        return response
+
+
+def observe_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, alias=context['connection'].alias)
+
+
+def instrument_connection(connection):
+    if ENABLED and observe_query not in connection.execute_wrappers:
+        # First in line: execute_wrapper() blocks entered later pop the last wrapper
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+_missing = object()
+
+
+class LocMemCache(locmem.LocMemCache):
+    """Django's local-memory cache, counting hits and misses of ``get``."""
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._metrics_name = name
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        CACHE_READS.inc(cache=self._metrics_name, result='miss' if value is _missing else 'hit')
+        return default if value is _missing else value
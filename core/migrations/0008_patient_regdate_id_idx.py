@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hospital_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['registration_date', 'id'], name='patient_regdate_id_idx'),
+        ),
+    ]
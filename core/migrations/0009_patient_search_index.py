@@ -0,0 +1,48 @@
+import re
+
+from django.db import migrations
+
+
+def insert_rows(cursor, rows):
+    cursor.executemany(
+        "INSERT INTO core_patient_fts (rowid, mr_number, first_name, last_name, contact_number, email) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        rows,
+    )
+
+
+def create_index(apps, schema_editor, batch_size=10000):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS core_patient_fts USING fts5("
+        "mr_number, first_name, last_name, contact_number, email, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+    )
+    Patient = apps.get_model('core', 'Patient')
+    rows = Patient.objects.values_list('id', 'mr_number', 'first_name', 'last_name', 'contact_number', 'email')
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, mr_number, first_name, last_name, contact_number, email in rows.iterator(chunk_size=batch_size):
+            batch.append((pk, mr_number, first_name, last_name, re.sub(r'\D', '', contact_number or ''), email or ''))
+            if len(batch) >= batch_size:
+                insert_rows(cursor, batch)
+                batch = []
+        insert_rows(cursor, batch)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS core_patient_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_patient_regdate_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:35
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of core.record_index's tokenizer as it stood for this migration
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from had has have he her his if in is it its no not of on or
+    she so that the their there they this to was were which with mg ml per day days times
+""".split())
+
+
+def insert_rows(cursor, rows):
+    cursor.executemany(
+        "INSERT INTO core_recordterm (term, record_id, hospital_id, visit_date) VALUES (%s, %s, %s, %s)",
+        rows,
+    )
+
+
+def backfill_terms(apps, schema_editor, batch_size=5000):
+    PatientRecord = apps.get_model('core', 'PatientRecord')
+    adapt = schema_editor.connection.ops.adapt_datetimefield_value
+    rows = PatientRecord.objects.order_by().values_list(
+        'id', 'patient__registered_at', 'visit_date', 'symptoms', 'diagnosis', 'prescription', 'notes',
+    )
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, hospital_id, visit_date, *texts in rows.iterator(chunk_size=batch_size):
+            terms = {
+                token[:64] for text in texts for token in re.findall(r'\w+', (text or '').lower())
+                if len(token) >= 2 and token not in STOPWORDS
+            }
+            visit_date = adapt(visit_date)
+            batch.extend((term, pk, hospital_id, visit_date) for term in terms)
+            if len(batch) >= batch_size:
+                insert_rows(cursor, batch)
+                batch = []
+        insert_rows(cursor, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_patient_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('visit_date', models.DateTimeField()),
+                ('hospital', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.hospital')),
+                ('record', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='core.patientrecord')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'hospital', 'visit_date', 'record'], name='recordterm_term_hosp_date_idx'), models.Index(fields=['term', 'visit_date', 'record'], name='recordterm_term_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recordterm',
+            constraint=models.UniqueConstraint(fields=('record', 'term'), name='recordterm_record_term_uniq'),
+        ),
+        migrations.RunPython(backfill_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    StatCounter = apps.get_model('core', 'StatCounter')
+    for name, model in [('patient_count', 'Patient'), ('doctor_count', 'Doctor'),
+                        ('hospital_count', 'Hospital'), ('record_count', 'PatientRecord')]:
+        StatCounter.objects.create(name=name, value=apps.get_model('core', model).objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_record_term_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:37
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+import django.db.models.deletion
+
+
+def backfill_panels(apps, schema_editor):
+    PatientRecord = apps.get_model('core', 'PatientRecord')
+    DoctorPatientPanel = apps.get_model('core', 'DoctorPatientPanel')
+    rows = (
+        PatientRecord.objects.filter(doctor__isnull=False).order_by()
+        .values('doctor_id', 'patient_id')
+        .annotate(first_seen=Min('visit_date'), last_seen=Max('visit_date'), visit_count=Count('id'))
+    )
+    DoctorPatientPanel.objects.bulk_create((DoctorPatientPanel(**row) for row in rows.iterator()), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_stat_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorPatientPanel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('visit_count', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='panel', to='core.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'last_seen', 'id'], name='panel_doctor_last_seen_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctorpatientpanel',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='panel_doctor_patient_uniq'),
+        ),
+        migrations.RunPython(backfill_panels, migrations.RunPython.noop),
+    ]
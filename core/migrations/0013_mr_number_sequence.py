@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_doctor_patient_panel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MRNumberSequence',
+            fields=[
+                ('hospital', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='core.hospital')),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:50
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_record_hospital(apps, schema_editor):
+    Patient = apps.get_model('core', 'Patient')
+    PatientRecord = apps.get_model('core', 'PatientRecord')
+    PatientRecord.objects.update(
+        hospital_id=Subquery(Patient.objects.filter(pk=OuterRef('patient_id')).values('registered_at_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_mr_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientrecord',
+            name='hospital',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.hospital'),
+        ),
+        migrations.RunPython(backfill_record_hospital, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='patient',
+            name='registered_at',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.hospital'),
+        ),
+        migrations.AlterField(
+            model_name='patientrecord',
+            name='doctor',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.doctor'),
+        ),
+        migrations.AlterField(
+            model_name='patientrecord',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['registered_at', 'registration_date', 'id'], name='patient_hosp_regdate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientrecord',
+            index=models.Index(fields=['patient', 'visit_date'], name='record_patient_visit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientrecord',
+            index=models.Index(fields=['doctor', 'visit_date'], name='record_doctor_visit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientrecord',
+            index=models.Index(fields=['hospital', 'visit_date', 'id'], name='record_hosp_visit_idx'),
+        ),
+    ]
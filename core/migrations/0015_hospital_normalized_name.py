@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:43
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copies of core.hospital_names.normalize/trigrams as of this migration, so
+# later changes to the app code don't change what it does
+def normalize(name):
+    name = unicodedata.normalize('NFKD', (name or '').casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = name.replace("'", '').replace('’', '')
+    return re.sub(r'[\W_]+', ' ', name).strip()[:200]
+
+
+def trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def backfill_names(apps, schema_editor, batch_size=1000):
+    Hospital = apps.get_model('core', 'Hospital')
+    HospitalNameTrigram = apps.get_model('core', 'HospitalNameTrigram')
+    hospitals, rows = [], []
+    for hospital in Hospital.objects.only('id', 'name').iterator(chunk_size=batch_size):
+        hospital.normalized_name = normalize(hospital.name)
+        hospitals.append(hospital)
+        rows.extend(HospitalNameTrigram(trigram=gram, hospital_id=hospital.pk)
+                    for gram in trigrams(hospital.normalized_name))
+        if len(hospitals) >= batch_size:
+            Hospital.objects.bulk_update(hospitals, ['normalized_name'])
+            HospitalNameTrigram.objects.bulk_create(rows)
+            hospitals, rows = [], []
+    Hospital.objects.bulk_update(hospitals, ['normalized_name'])
+    HospitalNameTrigram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='normalized_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.CreateModel(
+            name='HospitalNameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('hospital', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.hospital')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'hospital'], name='hospitaltrigram_trigram_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hospitalnametrigram',
+            constraint=models.UniqueConstraint(fields=('hospital', 'trigram'), name='hospitaltrigram_hosp_trigram_uniq'),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+    ]
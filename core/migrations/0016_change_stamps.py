@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_hospital_normalized_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeStamp',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('stamp', models.FloatField()),
+            ],
+        ),
+    ]
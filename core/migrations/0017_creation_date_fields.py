@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:39
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_change_stamps'),
+    ]
+
+    # Only the Python-side save behaviour changes; the columns stay as they
+    # are (SQLite would otherwise rebuild both tables)
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='patient',
+                    name='registration_date',
+                    field=core.models.CreationDateField(auto_now_add=True),
+                ),
+                migrations.AlterField(
+                    model_name='patientrecord',
+                    name='visit_date',
+                    field=core.models.CreationDateTimeField(auto_now_add=True),
+                ),
+            ],
+        ),
+    ]
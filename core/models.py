@@ -5,6 +5,21 @@ from django.utils import timezone
 
 User = get_user_model()  # Use this instead of direct User import
 
+class GivenOrNowMixin:
+    # auto_now_add that keeps a value set before the row is first saved, so
+    # bulk loads (core/bulk.py) can carry historical dates
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if add and value is not None:
+            return value
+        return super().pre_save(model_instance, add)
+
+class CreationDateField(GivenOrNowMixin, models.DateField):
+    pass
+
+class CreationDateTimeField(GivenOrNowMixin, models.DateTimeField):
+    pass
+
 class Hospital(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     HOSPITAL_TYPES = [
@@ -16,6 +31,9 @@ class Hospital(models.Model):
     ]
     
     name = models.CharField(max_length=200)
+    # name case-folded, without punctuation or repeated spaces; set on save
+    # (see core/hospital_names.py) so a name lookup is an index seek
+    normalized_name = models.CharField(max_length=200, default='', editable=False, db_index=True)
     registration_number = models.CharField(max_length=50, default='REG-00000')  # Removed unique=True temporarily
     hospital_type = models.CharField(max_length=20, choices=HOSPITAL_TYPES, default='private')
     
@@ -112,22 +130,40 @@ class Patient(models.Model):
     address = models.TextField()
     contact_number = models.CharField(max_length=15)
     email = models.EmailField(blank=True)
-    registered_at = models.ForeignKey(Hospital, on_delete=models.CASCADE)
-    registration_date = models.DateField(auto_now_add=True)
+    registered_at = models.ForeignKey(Hospital, on_delete=models.CASCADE, db_index=False)  # covered by patient_hosp_regdate_idx
+    registration_date = CreationDateField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination in patient_list seeks on (registration_date, id)
+            models.Index(fields=['registration_date', 'id'], name='patient_regdate_id_idx'),
+            # A hospital's patients, newest first (dashboard snapshot, exports)
+            models.Index(fields=['registered_at', 'registration_date', 'id'], name='patient_hosp_regdate_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name} (MR: {self.mr_number})"
 
 class PatientRecord(models.Model):
-    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
-    doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True)
-    visit_date = models.DateTimeField(auto_now_add=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, db_index=False)  # covered by record_patient_visit_idx
+    doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, db_index=False)  # covered by record_doctor_visit_idx
+    # Copied from patient.registered_at on save (see core/signals.py) so a
+    # hospital's visits, newest first, are one index range scan.
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, editable=False, db_index=False, related_name='+')
+    visit_date = CreationDateTimeField(auto_now_add=True)
     symptoms = models.TextField()
     diagnosis = models.TextField()
     prescription = models.TextField()
     notes = models.TextField(blank=True)
     next_visit = models.DateField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'visit_date'], name='record_patient_visit_idx'),
+            models.Index(fields=['doctor', 'visit_date'], name='record_doctor_visit_idx'),
+            models.Index(fields=['hospital', 'visit_date', 'id'], name='record_hosp_visit_idx'),
+        ]
+
     def __str__(self):
         return f"Record for {self.patient} on {self.visit_date}"
 
@@ -139,4 +175,90 @@ class HospitalAdmin(models.Model):
     join_date = models.DateField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.user.get_full_name()} - {self.hospital.name} Administrator"
\ No newline at end of file
+        return f"{self.user.get_full_name()} - {self.hospital.name} Administrator"
+
+class RecordTerm(models.Model):
+    # Inverted index over PatientRecord free text (see core/record_index.py).
+    # hospital and visit_date are copied from the record so a search for a term
+    # within one hospital and date range is a single index range scan.
+    term = models.CharField(max_length=64)
+    record = models.ForeignKey(PatientRecord, on_delete=models.CASCADE, db_index=False, related_name='terms')  # covered by the unique constraint
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, db_index=False, related_name='+')
+    visit_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'hospital', 'visit_date', 'record'], name='recordterm_term_hosp_date_idx'),
+            models.Index(fields=['term', 'visit_date', 'record'], name='recordterm_term_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'term'], name='recordterm_record_term_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> record {self.record_id}"
+
+class HospitalNameTrigram(models.Model):
+    # Trigrams of Hospital.normalized_name (see core/hospital_names.py), so
+    # hospitals with a similar name are found without reading every name.
+    trigram = models.CharField(max_length=3)
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, db_index=False, related_name='+')  # covered by the unique constraint
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram', 'hospital'], name='hospitaltrigram_trigram_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['hospital', 'trigram'], name='hospitaltrigram_hosp_trigram_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram!r} -> hospital {self.hospital_id}"
+
+class StatCounter(models.Model):
+    # Running row counts kept up to date by signals (see core/stats.py) so
+    # dashboards never run COUNT(*) over the big tables.
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class ChangeStamp(models.Model):
+    # Time of the last write to what ``key`` names (see core/stamps.py), so
+    # every worker derives the same ETags and cache versions from it.
+    key = models.CharField(max_length=100, primary_key=True)
+    stamp = models.FloatField()
+
+    def __str__(self):
+        return f"{self.key}: {self.stamp}"
+
+class DoctorPatientPanel(models.Model):
+    # One row per doctor/patient pair, maintained from PatientRecord writes
+    # (see core/panels.py) so the doctor dashboard never scans visit history.
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, db_index=False, related_name='panel')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    visit_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'last_seen', 'id'], name='panel_doctor_last_seen_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='panel_doctor_patient_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} - {self.patient}"
+
+class MRNumberSequence(models.Model):
+    # Next unreserved MR sequence number per hospital. Worker processes
+    # reserve blocks from it (see core/mrn.py) rather than one number at a time.
+    hospital = models.OneToOneField(Hospital, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.hospital_id}: {self.next_value}"
@@ -0,0 +1,89 @@
+"""
+MR number allocation.
+
+Numbers look like ``<hospital id>-<sequence><check digit>``, e.g. ``4-00001236``.
+The dash keeps them from ever colliding with legacy MR numbers (plain digits
+or hex) or across hospitals, and the Luhn check digit catches mistyped
+digits and most swapped pairs at lookup time.
+
+Each process reserves ``MR_NUMBER_BLOCK_SIZE`` sequence numbers at a time
+from the hospital's MRNumberSequence row and hands them out from memory, so
+most registrations don't touch the sequence table. Numbers from a block a
+process never uses are simply skipped, leaving gaps but no duplicates.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MRNumberSequence
+
+BLOCK_SIZE = getattr(settings, 'MR_NUMBER_BLOCK_SIZE', 100)
+SEQUENCE_WIDTH = 7
+
+_lock = threading.Lock()
+_blocks = {}  # (pid, hospital_id) -> [next, end)
+
+
+def check_digit(digits):
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        d = int(d)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return str((10 - total % 10) % 10)
+
+
+def format_mr_number(hospital_id, sequence):
+    body = f'{sequence:0{SEQUENCE_WIDTH}d}'
+    return f'{hospital_id}-{body}{check_digit(f"{hospital_id}{body}")}'
+
+
+def is_valid(mr_number):
+    """True if ``mr_number`` is in the allocated format and its check digit matches."""
+    hospital, sep, rest = mr_number.partition('-')
+    if not sep or not hospital.isdigit() or not rest.isdigit() or len(rest) < 2:
+        return False
+    return check_digit(hospital + rest[:-1]) == rest[-1]
+
+
+def reserve(hospital_id, count):
+    """Reserve ``count`` sequence numbers for a hospital; returns the first one."""
+    sequence = MRNumberSequence.objects.filter(hospital_id=hospital_id)
+    with transaction.atomic():
+        # Write before reading: the UPDATE takes the row (on SQLite, database)
+        # write lock, so the value read back is ours alone until commit. A read
+        # first would leave SQLite unable to upgrade the lock under contention.
+        if not sequence.update(next_value=F('next_value') + count):
+            try:
+                with transaction.atomic():
+                    MRNumberSequence.objects.create(hospital_id=hospital_id, next_value=1 + count)
+            except IntegrityError:
+                sequence.update(next_value=F('next_value') + count)
+        end = sequence.values_list('next_value', flat=True).get()
+    return end - count
+
+
+def allocate(hospital_id):
+    """Return a new, unused MR number for the hospital."""
+    key = (os.getpid(), hospital_id)  # a forked worker must not reuse its parent's block
+    with _lock:
+        block = _blocks.get(key)
+        if block and block[0] < block[1]:
+            sequence = block[0]
+            block[0] += 1
+            return format_mr_number(hospital_id, sequence)
+    if transaction.get_connection().in_atomic_block:
+        # A block reserved here would be rolled back with the caller's
+        # transaction while we still held it, and handed out again elsewhere.
+        # Reserve just this one number so it rolls back together with its use.
+        return format_mr_number(hospital_id, reserve(hospital_id, 1))
+    start = reserve(hospital_id, BLOCK_SIZE)
+    with _lock:
+        _blocks[key] = [start + 1, start + BLOCK_SIZE]
+    return format_mr_number(hospital_id, start)
@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are addressed by the sort key of the last row seen rather than by an
+OFFSET, so fetching page 1000 costs the same as fetching page 1 as long as
+the ordering is backed by an index.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(raw, list) or len(raw) != len(fields):
+        raise InvalidCursor(cursor)
+    try:
+        return [model._meta.get_field(f).to_python(v) for f, v in zip(fields, raw)]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _seek_filter(fields, values, lookup):
+    # (a, b, c) < (x, y, z)  ==>  a < x OR (a = x AND b < y) OR (a = x AND b = y AND c < z)
+    condition = Q()
+    for i, field in enumerate(fields):
+        branch = Q(**{f'{field}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            branch &= Q(**{prev_field: prev_value})
+        condition |= branch
+    # The redundant bound on the leading column lets SQLite turn the OR chain
+    # into an index range seek instead of scanning from the start of the index.
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, page_size):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.page_size = page_size
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_paginate(queryset, fields, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered descending by ``fields``.
+
+    ``fields`` must end with a unique column (normally ``id``) so the ordering
+    is total. ``after`` continues towards older rows, ``before`` walks back
+    towards newer ones. Cursors are opaque strings produced by this function.
+    """
+    model = queryset.model
+    fields = list(fields)
+
+    if before:
+        values = decode_cursor(before, model, fields)
+        queryset = queryset.filter(_seek_filter(fields, values, 'gt'))
+        rows = list(queryset.order_by(*fields)[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_newer, has_older = more, True
+    else:
+        if after:
+            values = decode_cursor(after, model, fields)
+            queryset = queryset.filter(_seek_filter(fields, values, 'lt'))
+        rows = list(queryset.order_by(*[f'-{f}' for f in fields])[:page_size + 1])
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = bool(after)
+
+    def key(row):
+        if isinstance(row, dict):
+            return [row[f] for f in fields]
+        return [getattr(row, model._meta.get_field(f).attname) for f in fields]
+
+    next_cursor = encode_cursor(key(rows[-1])) if rows and has_older else None
+    previous_cursor = encode_cursor(key(rows[0])) if rows and has_newer else None
+    return KeysetPage(rows, next_cursor, previous_cursor, page_size)
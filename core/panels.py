@@ -0,0 +1,97 @@
+"""
+Maintenance of the DoctorPatientPanel table.
+
+A new visit is folded into its panel row with a single UPDATE. Edits and
+deletes recompute the affected (doctor, patient) rows from that patient's
+records, which is a handful of rows even for chronic patients.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min
+from django.db.models.functions import Greatest, Least
+
+from .models import DoctorPatientPanel, PatientRecord
+
+
+def record_visit(record):
+    if record.doctor_id is None:
+        return
+    panel = DoctorPatientPanel.objects.filter(doctor_id=record.doctor_id, patient_id=record.patient_id)
+    updated = panel.update(
+        visit_count=F('visit_count') + 1,
+        first_seen=Least('first_seen', record.visit_date),
+        last_seen=Greatest('last_seen', record.visit_date),
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DoctorPatientPanel.objects.create(
+                doctor_id=record.doctor_id, patient_id=record.patient_id,
+                first_seen=record.visit_date, last_seen=record.visit_date, visit_count=1,
+            )
+    except IntegrityError:
+        # Another request created the row between our UPDATE and INSERT
+        record_visit(record)
+
+
+def record_visits(records, batch_size=500):
+    """``record_visit`` for a batch of bulk-created records."""
+    summary = {}
+    for record in records:
+        if record.doctor_id is None:
+            continue
+        key = (record.doctor_id, record.patient_id)
+        first_seen, last_seen, visit_count = summary.get(key, (record.visit_date, record.visit_date, 0))
+        summary[key] = (min(first_seen, record.visit_date), max(last_seen, record.visit_date), visit_count + 1)
+    patient_ids = sorted({patient_id for _, patient_id in summary})
+    existing = set()
+    for i in range(0, len(patient_ids), batch_size):
+        existing.update(
+            DoctorPatientPanel.objects.filter(patient_id__in=patient_ids[i:i + batch_size])
+            .values_list('doctor_id', 'patient_id')
+        )
+    new = []
+    for (doctor_id, patient_id), (first_seen, last_seen, visit_count) in summary.items():
+        if (doctor_id, patient_id) in existing:
+            DoctorPatientPanel.objects.filter(doctor_id=doctor_id, patient_id=patient_id).update(
+                visit_count=F('visit_count') + visit_count,
+                first_seen=Least('first_seen', first_seen),
+                last_seen=Greatest('last_seen', last_seen),
+            )
+        else:
+            new.append(DoctorPatientPanel(doctor_id=doctor_id, patient_id=patient_id, first_seen=first_seen,
+                                          last_seen=last_seen, visit_count=visit_count))
+    DoctorPatientPanel.objects.bulk_create(new, batch_size=batch_size)
+
+
+def refresh(doctor_id, patient_id):
+    """Recompute one panel row from the visit history (or drop it if none is left)."""
+    if doctor_id is None:
+        return
+    summary = PatientRecord.objects.filter(doctor_id=doctor_id, patient_id=patient_id).aggregate(
+        first_seen=Min('visit_date'), last_seen=Max('visit_date'), visit_count=Count('id'),
+    )
+    if not summary['visit_count']:
+        DoctorPatientPanel.objects.filter(doctor_id=doctor_id, patient_id=patient_id).delete()
+        return
+    DoctorPatientPanel.objects.update_or_create(doctor_id=doctor_id, patient_id=patient_id, defaults=summary)
+
+
+def rebuild(batch_size=5000):
+    with transaction.atomic():
+        DoctorPatientPanel.objects.all().delete()
+        rows = (
+            PatientRecord.objects.filter(doctor__isnull=False).order_by()
+            .values('doctor_id', 'patient_id')
+            .annotate(first_seen=Min('visit_date'), last_seen=Max('visit_date'), visit_count=Count('id'))
+        )
+        batch, total = [], 0
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(DoctorPatientPanel(**row))
+            if len(batch) >= batch_size:
+                DoctorPatientPanel.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        DoctorPatientPanel.objects.bulk_create(batch)
+        total += len(batch)
+    return total
@@ -0,0 +1,164 @@
+"""
+Inverted index over PatientRecord symptoms, diagnosis, prescription and notes.
+
+Each distinct term of a record becomes one RecordTerm posting carrying the
+record's hospital and visit date, so "dengue at hospital X in the last 14 days"
+is answered from the (term, hospital, visit_date) index without touching the
+PatientRecord text columns at all.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .models import PatientRecord, RecordTerm
+
+INDEXED_FIELDS = ('symptoms', 'diagnosis', 'prescription', 'notes')
+MAX_TERM_LENGTH = 64
+MAX_RESULTS = 200
+
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from had has have he her his if in is it its no not of on or
+    she so that the their there they this to was were which with mg ml per day days times
+""".split())
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    terms = set()
+    for token in _token_re.findall((text or '').lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        terms.add(token[:MAX_TERM_LENGTH])
+    return terms
+
+
+def record_terms(record):
+    terms = set()
+    for field in INDEXED_FIELDS:
+        terms |= tokenize(getattr(record, field))
+    return terms
+
+
+def index_record(record):
+    """Bring the postings for one record in line with its current text."""
+    hospital_id = record.patient.registered_at_id
+    wanted = record_terms(record)
+    with transaction.atomic():
+        existing = set(RecordTerm.objects.filter(record=record).values_list('term', flat=True))
+        stale = existing - wanted
+        if stale:
+            RecordTerm.objects.filter(record=record, term__in=stale).delete()
+        RecordTerm.objects.bulk_create([
+            RecordTerm(term=term, record_id=record.pk, hospital_id=hospital_id, visit_date=record.visit_date)
+            for term in wanted - existing
+        ])
+
+
+def _insert_postings(rows):
+    # Loads insert a dozen or more postings per record; building a model
+    # instance for each costs several times the INSERT itself
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {RecordTerm._meta.db_table} (term, record_id, hospital_id, visit_date) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+
+def index_records(records, batch_size=5000):
+    """Bulk-index records that have no postings yet (initial load / rebuild)."""
+    adapt = connection.ops.adapt_datetimefield_value
+    postings = []
+    for record in records:
+        hospital_id = record.patient.registered_at_id
+        visit_date = adapt(record.visit_date)
+        for term in record_terms(record):
+            postings.append((term, record.pk, hospital_id, visit_date))
+        if len(postings) >= batch_size:
+            _insert_postings(postings)
+            postings = []
+    _insert_postings(postings)
+
+
+def rebuild(batch_size=2000):
+    total = 0
+    with transaction.atomic():
+        RecordTerm.objects.all().delete()
+        records = (
+            PatientRecord.objects.select_related('patient')
+            .only('visit_date', 'patient__registered_at', *INDEXED_FIELDS)
+            .order_by()
+        )
+        batch = []
+        for record in records.iterator(chunk_size=batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                index_records(batch)
+                total += len(batch)
+                batch = []
+        index_records(batch)
+        total += len(batch)
+    return total
+
+
+def move_patient(patient):
+    """Re-point postings after a patient moves to another hospital."""
+    RecordTerm.objects.filter(record__patient=patient).exclude(hospital_id=patient.registered_at_id).update(
+        hospital_id=patient.registered_at_id
+    )
+
+
+def parse_query(text):
+    """
+    Split free text into (term, is_prefix) pairs. A trailing ``*`` asks for a
+    prefix match ("dengu*"); everything else must match a whole term.
+    """
+    parsed = []
+    for raw in (text or '').lower().split():
+        prefix = raw.endswith('*')
+        for token in _token_re.findall(raw):
+            if len(token) < 2 or token in STOPWORDS:
+                continue
+            parsed.append((token[:MAX_TERM_LENGTH], False))
+        if prefix and parsed:
+            parsed[-1] = (parsed[-1][0], True)
+    return parsed
+
+
+def _postings(term, prefix, hospital, date_from, date_to):
+    if prefix:
+        # A range on the indexed column instead of LIKE, which SQLite won't seek on
+        qs = RecordTerm.objects.filter(term__gte=term, term__lt=term + '\uffff')
+    else:
+        qs = RecordTerm.objects.filter(term=term)
+    if hospital is not None:
+        qs = qs.filter(hospital=hospital)
+    if date_from is not None:
+        qs = qs.filter(visit_date__gte=date_from)
+    if date_to is not None:
+        qs = qs.filter(visit_date__lt=date_to)
+    return qs
+
+
+def search_records(text, hospital=None, date_from=None, date_to=None, limit=MAX_RESULTS):
+    """
+    Records containing every query term, newest visit first.
+
+    ``hospital`` is a Hospital or id, matched against the patient's
+    ``registered_at``; ``date_from`` is inclusive and ``date_to`` exclusive.
+    """
+    terms = parse_query(text)
+    if not terms:
+        return []
+    first, rest = terms[0], terms[1:]
+    postings = _postings(*first, hospital, date_from, date_to)
+    for term in rest:
+        postings = postings.filter(record_id__in=_postings(*term, hospital, date_from, date_to).values('record_id'))
+    ids = postings.order_by('-visit_date', '-record_id').values_list('record_id', flat=True)
+    if first[1]:
+        # Several terms sharing the prefix can point at the same record
+        ids = ids.distinct()
+    ids = list(ids[:min(limit, MAX_RESULTS)])
+    records = PatientRecord.objects.select_related('patient', 'doctor__user').in_bulk(ids)
+    return [records[pk] for pk in ids if pk in records]
@@ -0,0 +1,144 @@
+"""
+Read replicas for read-only paths.
+
+Nothing is sent to a replica unless it is listed in ``REPLICA_DATABASES`` and
+the code path opted in: views decorated with ``replica_reads`` (dashboards,
+patient list, exports, public lookup) read from a replica while they run,
+everything else reads and writes ``default``. Querysets that are evaluated
+after the view returns (streamed exports) must pass ``using=read_alias()``
+explicitly.
+
+Read-your-writes: ``ReplicaPinMiddleware`` notes requests that wrote to a
+core model and pins that session to ``default`` for ``REPLICA_MAX_LAG``
+seconds, so a doctor sees the record they just added. Cached values that
+are dropped after a write are likewise recomputed from ``default`` for that
+long (``mark_changed`` / ``reads_for``); otherwise a lagging replica could
+put the old value straight back into the cache.
+
+Locally a replica is a second SQLite file that ``manage.py sync_replica``
+refreshes from ``default`` (a stand-in for real replication).
+"""
+import asyncio
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+REPLICAS = getattr(settings, 'REPLICA_DATABASES', [])
+MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 5)
+
+PIN_SESSION_KEY = '_replica_pin_until'
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+_request_writes = ContextVar('replica_request_writes', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None and model._meta.app_label == 'core':
+            writes.add(model._meta.label)
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        return False if db in REPLICAS else None
+
+
+def read_alias():
+    """The alias replica-safe reads should use right now."""
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reads_from(alias):
+    """Route reads in the block to ``alias`` (None: back to ``default``)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _changed_key(key):
+    return f'replica_changed:{key}'
+
+
+def mark_changed(key):
+    """The data behind cache key ``key`` was written; recompute it from the primary for a while."""
+    if REPLICAS:
+        transaction.on_commit(lambda: cache.set(_changed_key(key), True, MAX_LAG))
+
+
+def reads_for(key):
+    """Context for recomputing the value cached under ``key``."""
+    if REPLICAS and _read_alias.get() and cache.get(_changed_key(key)):
+        return reads_from(None)
+    return nullcontext()
+
+
+async def areads_for(key):
+    if REPLICAS and _read_alias.get() and await cache.aget(_changed_key(key)):
+        return reads_from(None)
+    return nullcontext()
+
+
+def _replica_for(request):
+    if not REPLICAS:
+        return None
+    session = getattr(request, 'session', None)
+    if session is not None and session.get(PIN_SESSION_KEY, 0) > time.time():
+        return None
+    return random.choice(REPLICAS)
+
+
+def replica_reads(view):
+    """Let ``view`` (sync or async) read from a replica unless its session is pinned."""
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            with reads_from(await sync_to_async(_replica_for)(request)):
+                return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            with reads_from(_replica_for(request)):
+                return view(request, *args, **kwargs)
+    return wrapped
+
+
+class ReplicaPinMiddleware:
+    """Pin a session to ``default`` after a request that wrote core data."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = set()
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        if writes and REPLICAS and hasattr(request, 'session'):
+            request.session[PIN_SESSION_KEY] = time.time() + MAX_LAG
+        return response
+
+
+def sync(source=DEFAULT_DB_ALIAS, targets=None):
+    """Copy ``source`` into each replica with SQLite's online backup (the local replication stand-in)."""
+    primary = connections[source]
+    primary.ensure_connection()
+    for alias in targets or REPLICAS:
+        replica = connections[alias]
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
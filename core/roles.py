@@ -0,0 +1,167 @@
+"""
+The signed-in user's role, resolved once and kept in the session.
+
+Whether a user is a doctor, a hospital administrator or a hospital's own
+account is decided by reverse one-to-one relations, and ``hasattr(user,
+'doctor')`` costs a query each time it is asked. ``resolve`` answers all of
+it in one query when the user logs in (``core.signals``) and the result is
+stored in the session with the profile ids, so ``get_role`` and the
+``role_required`` decorator cost nothing beyond the session and user loads
+every authenticated request already does.
+
+A stored role is re-resolved after ``ROLE_SESSION_TTL`` seconds, which
+bounds how long a profile added or removed in the admin goes unnoticed by a
+session that is already signed in.
+"""
+import asyncio
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+ROLE_SESSION_TTL = getattr(settings, 'ROLE_SESSION_TTL', 300)
+
+SESSION_KEY = '_core_role'
+
+DOCTOR = 'doctor'
+HOSPITAL_ADMIN = 'hospital_admin'
+STAFF = 'staff'
+USER = 'user'
+ANONYMOUS = 'anonymous'
+
+
+class Role:
+    def __init__(self, kind, doctor_id=None, hospital_admin_id=None, hospital_id=None, account_hospital_id=None):
+        self.kind = kind
+        self.doctor_id = doctor_id
+        self.hospital_admin_id = hospital_admin_id
+        # The hospital a hospital admin administers
+        self.hospital_id = hospital_id
+        # The Hospital whose own login this user is (Hospital.user)
+        self.account_hospital_id = account_hospital_id
+
+    @property
+    def is_doctor(self):
+        return self.doctor_id is not None
+
+    @property
+    def is_hospital_admin(self):
+        return self.hospital_admin_id is not None
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return f'<Role {self.kind}>'
+
+
+def _kind(user, doctor_id, hospital_admin_id):
+    # Same precedence as the dashboards always used
+    if doctor_id is not None:
+        return DOCTOR
+    if hospital_admin_id is not None:
+        return HOSPITAL_ADMIN
+    if user.is_staff:
+        return STAFF
+    return USER
+
+
+def resolve(user):
+    """``user``'s Role, from the database (one query, then remembered on ``user``)."""
+    if not user.is_authenticated:
+        return Role(ANONYMOUS)
+    role = getattr(user, '_core_role', None)
+    if role is None:
+        ids = User.objects.filter(pk=user.pk).values(
+            'doctor__id', 'hospitaladmin__id', 'hospitaladmin__hospital_id', 'hospital__id'
+        ).first() or {}
+        role = Role(
+            _kind(user, ids.get('doctor__id'), ids.get('hospitaladmin__id')),
+            doctor_id=ids.get('doctor__id'),
+            hospital_admin_id=ids.get('hospitaladmin__id'),
+            hospital_id=ids.get('hospitaladmin__hospital_id'),
+            account_hospital_id=ids.get('hospital__id'),
+        )
+        user._core_role = role
+    return role
+
+
+def remember(request, user, role):
+    request.session[SESSION_KEY] = {'user': user.pk, 'at': time.time(), **role.as_dict()}
+    request._core_role = role
+
+
+def get_role(request):
+    """The Role of ``request.user``, from the session when it holds a fresh one."""
+    role = getattr(request, '_core_role', None)
+    if role is not None:
+        return role
+    user = request.user
+    if not user.is_authenticated:
+        return Role(ANONYMOUS)
+    stored = request.session.get(SESSION_KEY)
+    if stored and stored['user'] == user.pk and time.time() - stored['at'] < ROLE_SESSION_TTL:
+        stored = {key: value for key, value in stored.items() if key not in ('user', 'at')}
+        role = request._core_role = Role(**stored)
+        return role
+    role = resolve(user)
+    remember(request, user, role)
+    return role
+
+
+def has_role(request, kind):
+    """Whether ``request.user`` acts as ``kind`` (a doctor who also administers a hospital is both)."""
+    if not request.user.is_authenticated:
+        return kind == ANONYMOUS
+    if kind == STAFF:
+        return request.user.is_staff
+    role = get_role(request)
+    if kind == DOCTOR:
+        return role.is_doctor
+    if kind == HOSPITAL_ADMIN:
+        return role.is_hospital_admin
+    return kind == USER
+
+
+def _check(request, kinds):
+    # None when allowed, otherwise the response to send
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not any(has_role(request, kind) for kind in kinds):
+        return redirect('login')
+    return None
+
+
+def role_required(*kinds):
+    """
+    Let signed-in users who have one of the roles ``kinds`` into the view
+    (sync or async); anonymous users go to the login page with ``next``,
+    others are sent back to login. Use ``get_role(request)`` in the view for the ids.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                denied = await sync_to_async(_check)(request, kinds)
+                if denied is not None:
+                    return denied
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapped(request, *args, **kwargs):
+                denied = _check(request, kinds)
+                if denied is not None:
+                    return denied
+                return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def context(request):
+    """Context processor: the viewer's ``role``, resolved only if a template uses it."""
+    return {'role': SimpleLazyObject(lambda: get_role(request))}
@@ -0,0 +1,136 @@
+"""
+Patient search backed by an SQLite FTS5 index.
+
+The ``core_patient_fts`` virtual table holds one row per patient (rowid is the
+patient id) and is kept in sync by the signal handlers in ``core.signals``.
+Bulk loaders that bypass signals should call ``index_patients`` themselves or
+run ``manage.py rebuild_patient_search`` afterwards.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Patient
+
+FTS_TABLE = 'core_patient_fts'
+FTS_COLUMNS = ('mr_number', 'first_name', 'last_name', 'contact_number', 'email')
+# bm25() weights in FTS_COLUMNS order: an MR number hit beats a name hit
+FTS_WEIGHTS = (10.0, 4.0, 4.0, 2.0, 1.0)
+
+MIN_TOKEN_LENGTH = 2
+MAX_RESULTS = 100
+# Most matches scored per query (the newest ones, when there are more)
+RANK_WINDOW = getattr(settings, 'PATIENT_SEARCH_RANK_WINDOW', 10000)
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+# A phone number typed with punctuation or spaces: digit runs starting with 0
+# or +, so MR numbers ("<hospital id>-<sequence>") and other tokens stay apart
+_phone_re = re.compile(r'(?<![\w+])(?:\+|(?=0))\d+(?:[\s\-./()]+\d+)+(?!\w)')
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def _digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def _row(pk, mr_number, first_name, last_name, contact_number, email):
+    # Phone numbers are indexed digits-only, and build_match_query joins typed
+    # ones, so "0300-555", "0300 555" and "0300555" all match 0300-5551234
+    return (pk, mr_number, first_name, last_name, _digits(contact_number), email or '')
+
+
+def index_patients(rows, replace=True):
+    """Upsert ``(id, mr_number, first_name, last_name, contact_number, email)`` tuples or Patients."""
+    if not is_available():
+        return
+    rows = [
+        _row(r.pk, r.mr_number, r.first_name, r.last_name, r.contact_number, r.email) if isinstance(r, Patient) else _row(*r)
+        for r in rows
+    ]
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * (len(FTS_COLUMNS) + 1))
+    with connection.cursor() as cursor:
+        if replace:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(r[0],) for r in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES ({placeholders})", rows
+        )
+
+
+def index_patient(patient):
+    index_patients([patient])
+
+
+def remove_patient(pk):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index(batch_size=10000):
+    """Repopulate the whole index from ``core_patient``; returns the number of rows indexed."""
+    if not is_available():
+        return 0
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        rows = Patient.objects.order_by().values_list('id', *FTS_COLUMNS)
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index_patients(batch, replace=False)
+                total += len(batch)
+                batch = []
+        index_patients(batch, replace=False)
+        total += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 MATCH expression: every token must match as a
+    prefix. Phone numbers typed with punctuation or spaces are joined first,
+    to match the digits-only phone numbers in the index. Tokens are quoted so
+    user input can never inject FTS syntax.
+    """
+    text = _phone_re.sub(lambda m: _digits(m.group()), text or '')
+    tokens = [t for t in _token_re.findall(text) if len(t) >= MIN_TOKEN_LENGTH]
+    return ' AND '.join(f'"{t}"*' for t in tokens)
+
+
+def search_patient_ids(text, limit=MAX_RESULTS):
+    match = build_match_query(text)
+    if not match:
+        return []
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    # bm25 costs about a microsecond per scored row, so a lone common term
+    # (a popular first name) can't be scored in full at 1M patients. The
+    # newest RANK_WINDOW matches are scored in the one pass that finds them
+    # (FTS5 walks rowids newest first), so every match is ranked when there
+    # are fewer; ties go to the newest patient.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM (SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s) ORDER BY score, rowid DESC LIMIT %s',
+            [match, RANK_WINDOW, min(limit, MAX_RESULTS)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_patients(text, limit=MAX_RESULTS):
+    """Return matching patients best match first, with ``registered_at`` preloaded."""
+    if not is_available():
+        return []
+    ids = search_patient_ids(text, limit)
+    patients = Patient.objects.select_related('registered_at').in_bulk(ids)
+    return [patients[pk] for pk in ids if pk in patients]
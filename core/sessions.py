@@ -0,0 +1,132 @@
+"""
+Sessions served from the cache, with changes written to the database behind
+the request.
+
+Django's ``db`` engine reads ``django_session`` on every authenticated
+request and writes it whenever the session changes; ``cached_db`` avoids the
+read but still writes through. This engine (``SESSION_ENGINE =
+'core.sessions'``) reads from ``SESSION_CACHE_ALIAS`` and falls back to the
+table only on a miss. A new session (login) is inserted at once, so any
+worker can find it. Changes to an existing session go to the cache at once
+and are queued in the process; the queue is written as one transaction
+after a response has been sent (``request_finished``), at most once every
+``SESSION_WRITE_BEHIND_INTERVAL`` seconds, and when the process exits.
+
+The queue only ever updates rows that exist, and a queued change is only
+served for a session whose row still exists, so a session deleted meanwhile
+(logout, ``cycle_key``, purge) is not brought back. Login, logout and key
+changes write through; a worker killed outright loses up to one interval of
+other session changes (the role cached in the session is then looked up
+again).
+
+``SESSION_CACHE_ALIAS`` must be a cache every worker shares (memcached,
+redis, or the file cache on a single host): with a per-process cache, a
+worker that still holds a copy of a session would keep accepting it after
+logout. ``SessionStore`` refuses a local-memory cache.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+WRITE_BEHIND_INTERVAL = getattr(settings, 'SESSION_WRITE_BEHIND_INTERVAL', 5)
+
+KEY_PREFIX = 'core.sessions'
+
+logger = logging.getLogger(__name__)
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def pending():
+    """Session keys with changes not yet in the database."""
+    with _pending_lock:
+        return set(_pending)
+
+
+def flush():
+    """Write queued session changes to the database. Returns how many were written."""
+    global _last_flush
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    now = timezone.now()
+    batch = {key: item for key, item in batch.items() if item[1] > now}
+    if not batch:
+        return 0
+    try:
+        with transaction.atomic():
+            for session_key, (session_data, expire_date) in batch.items():
+                Session.objects.filter(session_key=session_key).update(
+                    session_data=session_data, expire_date=expire_date
+                )
+    except DatabaseError:
+        logger.exception('Writing %d queued sessions failed; retrying later', len(batch))
+        with _pending_lock:
+            for session_key, item in batch.items():
+                # Anything queued since is newer
+                _pending.setdefault(session_key, item)
+        return 0
+    return len(batch)
+
+
+def flush_due():
+    if _pending and time.monotonic() - _last_flush >= WRITE_BEHIND_INTERVAL:
+        flush()
+
+
+atexit.register(flush)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        if isinstance(self._cache, LocMemCache):
+            raise ImproperlyConfigured(
+                f'core.sessions needs a cache shared by all workers; CACHES[{settings.SESSION_CACHE_ALIAS!r}] '
+                'is per-process. Use SESSION_BACKEND=db or point it at memcached, redis or the file cache.'
+            )
+
+    def _get_session_from_db(self):
+        session = super()._get_session_from_db()
+        if session is None:
+            # Deleted or expired: a queued change must not bring it back
+            return None
+        with _pending_lock:
+            queued = _pending.get(self.session_key)
+        if queued is not None and queued[1] > timezone.now():
+            # Evicted from the cache before its change reached the table
+            session.session_data, session.expire_date = queued
+        return session
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if must_create:
+            # New sessions go straight to the table: other workers must find them
+            return super().save(must_create=True)
+        data = self._get_session()
+        expire_date = self.get_expiry_date()
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+        with _pending_lock:
+            _pending[self.session_key] = (self.encode(data), expire_date)
+
+    def delete(self, session_key=None):
+        key = self.session_key if session_key is None else session_key
+        if key is not None:
+            with _pending_lock:
+                _pending.pop(key, None)
+        super().delete(session_key)
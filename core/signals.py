@@ -0,0 +1,233 @@
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+
+from . import api, fragments, hospital_names, lookup, metrics, panels, record_index, roles, search, sessions, stats
+from .models import Clinic, Doctor, DoctorPatientPanel, Hospital, Patient, PatientRecord
+
+
+@receiver(post_save, sender=Patient)
+def index_patient_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_patient(instance)
+    if not kwargs.get('created'):
+        record_index.move_patient(instance)
+
+
+@receiver(post_delete, sender=Patient)
+def unindex_patient_on_delete(sender, instance, **kwargs):
+    search.remove_patient(instance.pk)
+
+
+@receiver(pre_save, sender=PatientRecord)
+def stamp_record_hospital(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.hospital_id = instance.patient.registered_at_id
+
+
+@receiver(pre_save, sender=Hospital)
+def normalize_hospital_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.normalized_name = hospital_names.normalize(instance.name)
+
+
+@receiver(post_save, sender=Hospital)
+def index_hospital_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        hospital_names.index_hospital(instance)
+
+
+@receiver(post_save, sender=Patient)
+def move_patient_records(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    PatientRecord.objects.filter(patient=instance).exclude(hospital_id=instance.registered_at_id).update(
+        hospital_id=instance.registered_at_id
+    )
+
+
+@receiver(post_save, sender=PatientRecord)
+def index_record_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_index.index_record(instance)
+
+
+def count_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust(sender, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    stats.adjust(sender, -1)
+
+
+for _model in stats.COUNTED_MODELS.values():
+    post_save.connect(count_created, sender=_model, dispatch_uid=f'count_created_{_model.__name__}')
+    post_delete.connect(count_deleted, sender=_model, dispatch_uid=f'count_deleted_{_model.__name__}')
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_hospital(sender, instance, **kwargs):
+    stats.invalidate_hospital(instance.registered_at_id)
+    previous = getattr(instance, '_previous_hospital_id', None)
+    if previous != instance.registered_at_id:
+        # Moved: the old hospital stops counting the patient and their visits
+        stats.invalidate_hospital(previous)
+
+
+@receiver(post_save, sender=PatientRecord)
+@receiver(post_delete, sender=PatientRecord)
+def invalidate_record_hospital(sender, instance, **kwargs):
+    stats.invalidate_hospital(instance.hospital_id)
+
+
+@receiver(pre_save, sender=Patient)
+def remember_patient_mr_number_and_hospital(sender, instance, raw=False, **kwargs):
+    # A changed MR number must stop serving the summary under the old one,
+    # and a move to another hospital must refresh both hospitals' dashboards
+    if instance.pk and not raw:
+        instance._previous_mr_number, instance._previous_hospital_id = (
+            Patient.objects.filter(pk=instance.pk).values_list('mr_number', 'registered_at_id').first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_lookup(sender, instance, **kwargs):
+    # Also clears a cached miss when a new patient takes the MR number
+    lookup.invalidate(instance.mr_number)
+    previous = getattr(instance, '_previous_mr_number', None)
+    if previous and previous != instance.mr_number:
+        lookup.invalidate(previous)
+
+
+@receiver(post_save, sender=PatientRecord)
+@receiver(post_delete, sender=PatientRecord)
+def invalidate_record_lookup(sender, instance, **kwargs):
+    lookup.invalidate(instance.patient.mr_number)
+
+
+@receiver(pre_save, sender=Doctor)
+def remember_doctor_hospital(sender, instance, raw=False, **kwargs):
+    # A move to a clinic of another hospital changes both hospitals' doctor counts
+    if instance.pk and not raw:
+        instance._previous_hospital_id = (
+            Doctor.objects.filter(pk=instance.pk).values_list('clinic__hospital_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_hospital(sender, instance, **kwargs):
+    hospital_id = instance.clinic.hospital_id if instance.clinic_id else None
+    stats.invalidate_hospital(hospital_id)
+    previous = getattr(instance, '_previous_hospital_id', None)
+    if previous != hospital_id:
+        stats.invalidate_hospital(previous)
+
+
+@receiver(pre_save, sender=Clinic)
+def remember_clinic_hospital(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_hospital_id = (
+            Clinic.objects.filter(pk=instance.pk).values_list('hospital_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def invalidate_clinic_hospital(sender, instance, **kwargs):
+    # The clinic's doctors count towards its hospital
+    previous = getattr(instance, '_previous_hospital_id', None)
+    if previous != instance.hospital_id:
+        stats.invalidate_hospital(instance.hospital_id)
+        stats.invalidate_hospital(previous)
+
+
+@receiver(pre_save, sender=PatientRecord)
+def remember_record_doctor(sender, instance, raw=False, **kwargs):
+    # An edit may move the visit to another doctor; both panels need refreshing
+    if instance.pk and not raw:
+        instance._previous_doctor_id = (
+            PatientRecord.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=PatientRecord)
+def update_panel_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        panels.record_visit(instance)
+        return
+    panels.refresh(instance.doctor_id, instance.patient_id)
+    previous = getattr(instance, '_previous_doctor_id', None)
+    if previous != instance.doctor_id:
+        panels.refresh(previous, instance.patient_id)
+
+
+@receiver(post_delete, sender=PatientRecord)
+def update_panel_on_delete(sender, instance, **kwargs):
+    panels.refresh(instance.doctor_id, instance.patient_id)
+
+
+@receiver(post_save, sender=PatientRecord)
+@receiver(post_delete, sender=PatientRecord)
+def invalidate_doctor_fragments(sender, instance, **kwargs):
+    for doctor_id in {instance.doctor_id, getattr(instance, '_previous_doctor_id', None)} - {None}:
+        fragments.touch(f'doctor:{doctor_id}')
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_patient_doctor_fragments(sender, instance, created=False, raw=False, **kwargs):
+    # Doctor dashboards list their patients by name
+    if created or raw:
+        return
+    for doctor_id in DoctorPatientPanel.objects.filter(patient=instance).values_list('doctor_id', flat=True):
+        fragments.touch(f'doctor:{doctor_id}')
+
+
+def touch_api_version(sender, instance, **kwargs):
+    # Logging in only bumps last_login, which no API resource exposes
+    if kwargs.get('update_fields') == frozenset({'last_login'}):
+        return
+    api.touch(sender)
+
+
+for _model in (Hospital, Clinic, Doctor, Patient, PatientRecord, User):
+    post_save.connect(touch_api_version, sender=_model, dispatch_uid=f'touch_api_{_model.__name__}')
+    post_delete.connect(touch_api_version, sender=_model, dispatch_uid=f'touch_api_delete_{_model.__name__}')
+
+
+@receiver(connection_created, dispatch_uid='metrics_instrument_connection')
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrument_connection(connection)
+
+
+@receiver(user_logged_in, dispatch_uid='remember_role')
+def remember_role(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        roles.remember(request, user, roles.resolve(user))
+
+
+@receiver(user_logged_in, dispatch_uid='metrics_login_success')
+def count_login(sender, request, user, **kwargs):
+    metrics.LOGINS.inc(result='success')
+
+
+@receiver(user_login_failed, dispatch_uid='metrics_login_failure')
+def count_failed_login(sender, credentials, request=None, **kwargs):
+    metrics.LOGINS.inc(result='failure')
+
+
+@receiver(request_finished, dispatch_uid='flush_queued_sessions')
+def flush_queued_sessions(sender, **kwargs):
+    sessions.flush_due()
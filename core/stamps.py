@@ -0,0 +1,55 @@
+"""
+Last-write stamps shared by every worker process.
+
+``touch(key)`` records the time of a write to whatever ``key`` names (an API
+resource's model, a dashboard scope) in the ``ChangeStamp`` table, inside
+the writing transaction, so the stamp becomes visible together with the
+write. ``get(keys)`` reads stamps through the cache: a worker trusts a
+cached stamp for ``CHANGE_STAMP_TTL`` seconds before reading it again, which
+bounds how late it notices another worker's write when the cache is
+per-process (with a shared cache, writes are seen at once).
+
+A stamp only changes when something is written, so ETags and cache
+versions built from stamps stay valid however long nothing changes.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import ChangeStamp
+
+TTL = getattr(settings, 'CHANGE_STAMP_TTL', 5)
+
+
+def _cache_key(key):
+    return f'change_stamp:{key}'
+
+
+def touch(key):
+    stamp = time.time()
+    ChangeStamp.objects.bulk_create(
+        [ChangeStamp(key=key, stamp=stamp)], update_conflicts=True, unique_fields=['key'], update_fields=['stamp'],
+    )
+    # This worker sees its own write at once
+    transaction.on_commit(lambda: cache.set(_cache_key(key), stamp, TTL))
+
+
+def get(keys):
+    """The stamps of ``keys``, in order."""
+    cache_keys = {key: _cache_key(key) for key in keys}
+    found = cache.get_many(cache_keys.values())
+    stamps = {key: found[cache_key] for key, cache_key in cache_keys.items() if cache_key in found}
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        stored = ChangeStamp.objects.using(DEFAULT_DB_ALIAS)
+        stamps.update(stored.filter(key__in=missing).values_list('key', 'stamp'))
+        unknown = [key for key in missing if key not in stamps]
+        if unknown:
+            # Nothing written yet: start now, once, for every worker
+            now = time.time()
+            stored.bulk_create([ChangeStamp(key=key, stamp=now) for key in unknown], ignore_conflicts=True)
+            stamps.update(stored.filter(key__in=unknown).values_list('key', 'stamp'))
+        cache.set_many({cache_keys[key]: stamps[key] for key in missing}, TTL)
+    return [stamps[key] for key in keys]
@@ -0,0 +1,174 @@
+"""
+Fingerprinted, precompressed static files served from inside the app.
+
+``collectstatic`` (the build step) copies every asset into ``STATIC_ROOT``
+through ``CompressedManifestStaticFilesStorage``: Django's manifest storage
+names each file after a hash of its content (``css/custom.3f2a9c1b.css``,
+with ``url()`` references inside CSS rewritten to match), and this storage
+then writes ``.gz`` and, when the ``brotli`` package is installed, ``.br``
+variants of every compressible file next to it, so nothing is compressed
+per request.
+
+``StaticFilesMiddleware`` answers ``STATIC_URL`` requests straight from an
+index of ``STATIC_ROOT`` built when the worker starts: no URL resolving,
+sessions or database. It picks the brotli or gzip variant the client
+accepts, answers revalidation with 304, and marks hashed names ``immutable``
+for a year, since a changed file gets a new name. Unhashed names (anything
+linked without ``{% static %}``) get ``STATIC_MAX_AGE`` and are revalidated.
+Until ``collectstatic`` has run, ``{% static %}`` links the plain names and
+``runserver`` serves them from the app directories as usual.
+"""
+import gzip
+import mimetypes
+import os
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+ENABLED = getattr(settings, 'STATIC_HANDLER_ENABLED', True)
+MAX_AGE = getattr(settings, 'STATIC_MAX_AGE', 60)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico')
+# A variant must save at least this much to be worth a separate file
+MIN_SAVING = 0.05
+# Preference order when the client accepts several
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(path):
+    """Write the ``.gz`` (and ``.br``) variants of ``path`` that are smaller; returns their paths."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = []
+    candidates = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        candidates.append(('.br', lambda: brotli.compress(data)))
+    for suffix, encode in candidates:
+        compressed = encode()
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            variants.append(path + suffix)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                for variant in compress(self.path(name)):
+                    yield name, os.path.relpath(variant, self.location), True
+
+    def stored_name(self, name):
+        # No manifest yet (collectstatic hasn't run): link the plain name
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        # Weak: the same tag stands for each encoding of the file
+        self.etag = f'W/"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.cache_control = (f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if immutable
+                              else f'public, max-age={MAX_AGE}')
+        self.variants = [(encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)]
+
+    def pick(self, accept_encoding):
+        """``(encoding or None, path)`` of the variant to send."""
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding, path in self.variants:
+            if encoding in accepted:
+                return encoding, path
+        return None, self.path
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().partition('=')[2] if params.strip().startswith('q=') else '1'
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+def build_index(root, prefix):
+    """``{url path: StaticFile}`` for every file under ``root`` (compressed variants are not listed)."""
+    storage = CompressedManifestStaticFilesStorage(location=root)
+    hashed = set(storage.hashed_files.values())
+    index = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if name.endswith(('.gz', '.br')) and os.path.isfile(path[:-3]):
+                continue
+            if name == storage.manifest_name:
+                continue
+            index[prefix + name] = StaticFile(path, immutable=name in hashed)
+    return index
+
+
+class StaticFilesMiddleware:
+    def __init__(self, get_response):
+        root = getattr(settings, 'STATIC_ROOT', None)
+        if not ENABLED or not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.files = build_index(root, self.prefix)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        static = self.files.get(request.path_info)
+        if static is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, static)
+
+    def serve(self, request, static):
+        headers = {
+            'Cache-Control': static.cache_control,
+            'ETag': static.etag,
+            'Last-Modified': static.last_modified,
+        }
+        if static.variants:
+            headers['Vary'] = 'Accept-Encoding'
+        if static.etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            return HttpResponseNotModified(headers=headers)
+        encoding, path = static.pick(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=static.content_type, headers=headers)
+            response['Content-Length'] = os.path.getsize(path)
+            return response
+        # FileResponse hands the file to the server's wsgi.file_wrapper (sendfile) where there is one
+        response = FileResponse(open(path, 'rb'), content_type=static.content_type, headers=headers)
+        del response['Content-Disposition']
+        return response
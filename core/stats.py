@@ -0,0 +1,196 @@
+"""
+Global dashboard statistics served from the StatCounter table.
+
+Signal handlers in ``core.signals`` call ``adjust`` on every create/delete of
+a counted model, so reading the four dashboard numbers is one primary-key
+lookup instead of four COUNT(*) scans. Anything that bypasses signals
+(``bulk_create``, ``QuerySet.delete`` on raw SQL, manual DB edits) causes
+drift, which ``manage.py reconcile_counters`` corrects.
+
+Per-hospital dashboard numbers come from ``hospital_snapshot``, which is
+computed in two queries and cached under the hospital's fragment stamp, so
+it is recomputed once a patient, record or doctor under that hospital is
+written (which also retires the dashboard's cached fragments, see
+``core.fragments``), in every worker within ``CHANGE_STAMP_TTL``.
+``ahospital_snapshot`` is the async variant: on a cache miss it runs the two
+queries at the same time on a small thread pool, each on that thread's own
+database connection.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import fragments, replicas
+from .models import Doctor, Hospital, Patient, PatientRecord, StatCounter
+
+HOSPITAL_SNAPSHOT_TTL = getattr(settings, 'HOSPITAL_SNAPSHOT_TTL', 300)
+QUERY_THREADS = getattr(settings, 'DASHBOARD_QUERY_THREADS', 4)
+RECENT_LIMIT = 10
+
+COUNTED_MODELS = {
+    'patient_count': Patient,
+    'doctor_count': Doctor,
+    'hospital_count': Hospital,
+    'record_count': PatientRecord,
+}
+COUNTER_FOR_MODEL = {model: name for name, model in COUNTED_MODELS.items()}
+
+
+def adjust(model, delta):
+    name = COUNTER_FOR_MODEL.get(model)
+    if name is None or not delta:
+        return
+    if not StatCounter.objects.filter(name=name).update(value=F('value') + delta):
+        # First write since the counter table was emptied: count once instead of guessing
+        reconcile([name])
+    fragments.touch('counts')
+
+
+def global_counts():
+    """``{'patient_count': ..., 'doctor_count': ..., 'hospital_count': ..., 'record_count': ...}``"""
+    counts = dict(StatCounter.objects.filter(name__in=COUNTED_MODELS).values_list('name', 'value'))
+    missing = [name for name in COUNTED_MODELS if name not in counts]
+    if missing:
+        counts.update(reconcile(missing))
+    return {name: counts[name] for name in COUNTED_MODELS}
+
+
+def reconcile(names=None):
+    """
+    Recount the given counters (all by default) from their tables and store
+    the result. Returns ``{name: actual}``.
+    """
+    actual = {}
+    with transaction.atomic():
+        for name in names or COUNTED_MODELS:
+            actual[name] = COUNTED_MODELS[name].objects.count()
+            StatCounter.objects.update_or_create(
+                name=name, defaults={'value': actual[name], 'reconciled_at': timezone.now()}
+            )
+    fragments.touch('counts')
+    return actual
+
+
+def _snapshot_key(hospital_id):
+    return f'hospital_snapshot:{hospital_id}'
+
+
+def _count(queryset, group_by):
+    # Scalar subquery; SQLite evaluates it once and answers it from the index
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(n=Count('id')).values('n')), 0)
+
+
+def recent_patients(hospital_id):
+    return list(
+        Patient.objects.filter(registered_at=hospital_id)
+        .only('mr_number', 'first_name', 'last_name', 'registration_date')
+        .annotate(
+            total=_count(Patient.objects.filter(registered_at=hospital_id), 'registered_at'),
+            doctors=_count(Doctor.objects.filter(clinic__hospital=hospital_id), 'clinic__hospital'),
+        )
+        .order_by('-registration_date', '-id')[:RECENT_LIMIT]
+    )
+
+
+def recent_records(hospital_id):
+    return list(
+        PatientRecord.objects.filter(hospital=hospital_id)
+        .select_related('patient', 'doctor__user')
+        .only('visit_date', 'patient__mr_number', 'patient__first_name', 'patient__last_name',
+              'doctor__user__first_name', 'doctor__user__last_name')
+        .annotate(total=_count(PatientRecord.objects.filter(hospital=hospital_id), 'hospital'))
+        .order_by('-visit_date', '-id')[:RECENT_LIMIT]
+    )
+
+
+def doctor_count(hospital_id):
+    return Doctor.objects.filter(clinic__hospital=hospital_id).count()
+
+
+def _snapshot(patients, records, doctors=None):
+    return {
+        'patient_count': patients[0].total if patients else 0,
+        'doctor_count': patients[0].doctors if patients else doctors,
+        'record_count': records[0].total if records else 0,
+        'recent_patients': patients,
+        'recent_records': records,
+    }
+
+
+def compute_hospital_snapshot(hospital_id):
+    """
+    Counts and recent activity for one hospital in two queries. The totals
+    ride along with the recent lists as scalar COUNT subqueries, so each
+    query is an index range scan with no sort.
+    """
+    patients = recent_patients(hospital_id)
+    records = recent_records(hospital_id)
+    return _snapshot(patients, records, None if patients else doctor_count(hospital_id))
+
+
+def hospital_snapshot(hospital_id):
+    key = _snapshot_key(hospital_id)
+    version = fragments.stamp(f'hospital:{hospital_id}')
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with replicas.reads_for(key):
+        snapshot = compute_hospital_snapshot(hospital_id)
+    cache.set(key, (version, snapshot), HOSPITAL_SNAPSHOT_TTL)
+    return snapshot
+
+
+def invalidate_hospital(hospital_id):
+    if hospital_id is None:
+        return
+    # Drop the cache only once the write is visible, or a concurrent reader
+    # could re-cache the pre-commit state straight away.
+    transaction.on_commit(lambda: cache.delete(_snapshot_key(hospital_id)))
+    replicas.mark_changed(_snapshot_key(hospital_id))
+    fragments.touch(f'hospital:{hospital_id}')
+
+
+_executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix='dashboard-query')
+
+
+def _pooled(func):
+    # Pool threads keep their connections between calls like a request thread
+    # would; close_old_connections applies CONN_MAX_AGE around each query.
+    def run(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False, executor=_executor)
+
+
+async def acompute_hospital_snapshot(hospital_id):
+    """``compute_hospital_snapshot`` with both queries in flight at once."""
+    if await sync_to_async(lambda: connections[replicas.read_alias()].in_atomic_block)():
+        # Other connections can't see this transaction's writes; stay on it
+        return await sync_to_async(compute_hospital_snapshot)(hospital_id)
+    patients, records = await asyncio.gather(
+        _pooled(recent_patients)(hospital_id),
+        _pooled(recent_records)(hospital_id),
+    )
+    return _snapshot(patients, records, None if patients else await _pooled(doctor_count)(hospital_id))
+
+
+async def ahospital_snapshot(hospital_id):
+    key = _snapshot_key(hospital_id)
+    version = await sync_to_async(fragments.stamp)(f'hospital:{hospital_id}')
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with await replicas.areads_for(key):
+        snapshot = await acompute_hospital_snapshot(hospital_id)
+    await cache.aset(key, (version, snapshot), HOSPITAL_SNAPSHOT_TTL)
+    return snapshot
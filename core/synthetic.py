@@ -0,0 +1,166 @@
+"""
+Synthetic data used by ``manage.py seed`` and the benchmark commands.
+
+Everything is derived from row numbers, so the same arguments always produce
+the same data.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from . import hospital_names
+from .models import Clinic, Doctor, Hospital, HospitalNameTrigram, Patient, PatientRecord
+
+FIRST_NAMES = ['Ali', 'Ahmed', 'Fatima', 'Ayesha', 'Usman', 'Zainab', 'Hassan', 'Maryam', 'Bilal', 'Sana',
+               'Omar', 'Hira', 'Imran', 'Nadia', 'Kamran', 'Amina', 'Tariq', 'Sadia', 'Faisal', 'Rabia']
+LAST_NAMES = ['Khan', 'Malik', 'Hussain', 'Qureshi', 'Butt', 'Sheikh', 'Chaudhry', 'Raza', 'Siddiqui', 'Mirza',
+              'Abbasi', 'Javed', 'Iqbal', 'Aslam', 'Rehman', 'Akhtar', 'Baig', 'Ansari', 'Hashmi', 'Zafar']
+
+CITIES = [('Lahore', 'Punjab'), ('Karachi', 'Sindh'), ('Islamabad', 'Islamabad Capital Territory'),
+          ('Rawalpindi', 'Punjab'), ('Faisalabad', 'Punjab'), ('Multan', 'Punjab'), ('Peshawar', 'Khyber Pakhtunkhwa'),
+          ('Quetta', 'Balochistan'), ('Hyderabad', 'Sindh'), ('Sialkot', 'Punjab')]
+SPECIALIZATIONS = ['General Medicine', 'Pediatrics', 'Cardiology', 'Dermatology', 'Orthopedics', 'Gynecology',
+                   'ENT', 'Neurology', 'Ophthalmology', 'Psychiatry']
+VISITS = [
+    # (symptoms, diagnosis, prescription)
+    ('Fever and cough for three days', 'Viral upper respiratory infection', 'Paracetamol 500mg, fluids, rest'),
+    ('High fever, body aches, low platelets', 'Dengue fever', 'Paracetamol, oral rehydration, platelet monitoring'),
+    ('Persistent fever and abdominal pain', 'Typhoid fever', 'Azithromycin 500mg for 7 days'),
+    ('Headache and dizziness', 'Hypertension', 'Amlodipine 5mg once daily, low salt diet'),
+    ('Frequent urination and thirst', 'Type 2 diabetes mellitus', 'Metformin 500mg twice daily'),
+    ('Wheezing and shortness of breath', 'Bronchial asthma', 'Salbutamol inhaler as needed'),
+    ('Itchy red rash on forearms', 'Contact dermatitis', 'Hydrocortisone cream, antihistamine'),
+    ('Knee pain on climbing stairs', 'Osteoarthritis of knee', 'Physiotherapy, ibuprofen as needed'),
+    ('Loose stools and vomiting', 'Acute gastroenteritis', 'ORS, zinc, probiotics'),
+    ('Burning epigastric pain after meals', 'Gastritis', 'Omeprazole 20mg before breakfast'),
+    ('Sore throat and difficulty swallowing', 'Streptococcal pharyngitis', 'Amoxicillin 500mg for 10 days'),
+    ('Fatigue and pallor', 'Iron deficiency anaemia', 'Ferrous sulphate 200mg daily'),
+]
+
+BASE_DATE = date(2015, 1, 1)
+
+
+class Rollback(Exception):
+    """Raised inside ``transaction.atomic()`` to throw benchmark data away."""
+
+
+def make_hospitals(count, prefix='Bench Hospital'):
+    return [
+        Hospital.objects.create(name=f'{prefix} {i}', contact_number='0000000000', email='bench@example.com')
+        for i in range(count)
+    ]
+
+
+def synthetic_patient(n, hospital):
+    return Patient(
+        mr_number=f'BENCH{n:09d}',
+        first_name=FIRST_NAMES[n % len(FIRST_NAMES)] + (str(n % 97) if n % 5 == 0 else ''),
+        last_name=LAST_NAMES[(n // len(FIRST_NAMES)) % len(LAST_NAMES)],
+        date_of_birth=BASE_DATE - timedelta(days=(n * 31) % 30000),
+        gender='MFO'[n % 3],
+        address=f'House {n % 500}, Street {n % 40}',
+        contact_number=f'03{n % 10**9:09d}',
+        email=f'patient{n}@example.com' if n % 2 else '',
+        registered_at=hospital,
+        registration_date=BASE_DATE + timedelta(days=(n * 7919) % 3650),
+    )
+
+
+def create_patients(hospitals, start, end, batch_size=5000):
+    """Bulk insert patients numbered ``start`` .. ``end - 1``; yields each saved batch."""
+    for offset in range(start, end, batch_size):
+        batch = [
+            synthetic_patient(n, hospitals[n % len(hospitals)])
+            for n in range(offset, min(offset + batch_size, end))
+        ]
+        yield Patient.objects.bulk_create(batch)
+
+
+def make_doctors(hospital, count):
+    clinic = Clinic.objects.create(name=f'{hospital.name} OPD', hospital=hospital, registration_number=f'BENCH-C{hospital.pk}',
+                                   contact_number='0000000000', specialization='General')
+    doctors = []
+    for i in range(count):
+        user = User.objects.create(username=f'bench-doctor-{hospital.pk}-{i}', first_name=FIRST_NAMES[i % len(FIRST_NAMES)],
+                                   last_name=LAST_NAMES[i % len(LAST_NAMES)])
+        doctors.append(Doctor.objects.create(user=user, clinic=clinic, specialization='General',
+                                             license_number=f'BENCH-L{user.pk}', contact_number='0000000000'))
+    return doctors
+
+
+def seed_hospitals(count, start=0):
+    hospitals = []
+    for n in range(start, start + count):
+        city, state = CITIES[n % len(CITIES)]
+        hospital_type = Hospital.HOSPITAL_TYPES[n % len(Hospital.HOSPITAL_TYPES)][0]
+        name = f'{city} {LAST_NAMES[n % len(LAST_NAMES)]} Hospital {n}'
+        hospitals.append(Hospital(
+            name=name, normalized_name=hospital_names.normalize(name), registration_number=f'SEED-H{n:05d}',
+            hospital_type=hospital_type, city=city, state=state, country='Pakistan',
+            contact_number=f'04{n:08d}', email=f'hospital{n}@example.com',
+        ))
+    hospitals = Hospital.objects.bulk_create(hospitals)
+    # bulk_create skips the save signals that index names (core.signals)
+    HospitalNameTrigram.objects.bulk_create([
+        HospitalNameTrigram(trigram=gram, hospital_id=hospital.pk)
+        for hospital in hospitals for gram in hospital_names.trigrams(hospital.normalized_name)
+    ], batch_size=1000)
+    return hospitals
+
+
+def seed_clinics(hospitals, per_hospital):
+    clinics = []
+    for hospital in hospitals:
+        for i in range(per_hospital):
+            specialization = SPECIALIZATIONS[i % len(SPECIALIZATIONS)]
+            clinics.append(Clinic(
+                name=f'{specialization} Clinic', hospital=hospital, registration_number=f'SEED-C{hospital.pk}-{i}',
+                clinic_type=Clinic.CLINIC_TYPES[i % len(Clinic.CLINIC_TYPES)][0], specialization=specialization,
+                city=hospital.city, contact_number=f'05{hospital.pk:05d}{i:03d}',
+            ))
+    return Clinic.objects.bulk_create(clinics)
+
+
+def seed_doctors(clinics, per_clinic):
+    """Bulk insert doctors (and their users, who cannot log in with a password) for each clinic."""
+    password = make_password(None)
+    users, doctors = [], []
+    for clinic in clinics:
+        for i in range(per_clinic):
+            n = clinic.pk * per_clinic + i
+            users.append(User(username=f'seed-doctor-{clinic.pk}-{i}', password=password,
+                              first_name=FIRST_NAMES[n % len(FIRST_NAMES)], last_name=LAST_NAMES[n % len(LAST_NAMES)]))
+    users = User.objects.bulk_create(users)
+    for n, user in enumerate(users):
+        clinic = clinics[n // per_clinic]
+        doctors.append(Doctor(user=user, clinic=clinic, specialization=clinic.specialization,
+                              license_number=f'PMDC-{user.pk:06d}', contact_number=f'03{user.pk:09d}'))
+    return Doctor.objects.bulk_create(doctors)
+
+
+def create_records(patients, doctors, per_patient=1, batch_size=5000, vary=False):
+    """
+    Bulk insert ``per_patient`` visits for each patient (with ``vary``,
+    anywhere from none to twice that, averaging ``per_patient``); yields each
+    saved batch.
+    """
+    start = datetime.combine(BASE_DATE, datetime.min.time(), tzinfo=timezone.utc)
+    batch = []
+    for i, patient in enumerate(patients):
+        visits = (patient.pk * 2654435761) % (2 * per_patient + 1) if vary else per_patient
+        for v in range(visits):
+            n = i * per_patient + v
+            symptoms, diagnosis, prescription = VISITS[(patient.pk + v) % len(VISITS)]
+            batch.append(PatientRecord(
+                patient=patient, doctor=doctors[n % len(doctors)], hospital_id=patient.registered_at_id,
+                visit_date=start + timedelta(minutes=(n * 7919) % (3650 * 24 * 60)),
+                symptoms=symptoms, diagnosis=diagnosis, prescription=prescription,
+                notes='Follow up if symptoms persist' if v % 3 == 0 else '',
+                next_visit=BASE_DATE + timedelta(days=(n * 7919) % 3650 + 14) if v % 2 else None,
+            ))
+            if len(batch) >= batch_size:
+                yield PatientRecord.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        yield PatientRecord.objects.bulk_create(batch)
@@ -0,0 +1,52 @@
+"""
+Template warm-up for worker processes.
+
+``warm()`` compiles every template under the template directories into the
+cached loader (which Django puts in front of the default loaders), so a
+fresh worker's first requests don't each pay for reading and parsing
+``base.html`` and the page templates. The WSGI and ASGI entry points call
+it when ``TEMPLATE_WARMUP`` is on.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+
+ENABLED = getattr(settings, 'TEMPLATE_WARMUP', True)
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    """Names of the ``.html`` templates in every template directory, project ones first."""
+    directories = [os.fspath(d) for engine in settings.TEMPLATES for d in engine.get('DIRS', [])]
+    directories += [os.fspath(d) for d in get_app_template_dirs('templates')]
+    seen = set()
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for filename in sorted(files):
+                if filename.endswith('.html'):
+                    name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                    if name not in seen:
+                        seen.add(name)
+                        yield name
+
+
+def warm():
+    """Compile every template into each engine's loader cache; returns how many were compiled."""
+    started = time.perf_counter()
+    compiled = 0
+    for engine in engines.all():
+        for name in template_names():
+            try:
+                engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError):
+                # Partials meant for other engines or never used on their own
+                logger.debug('Not warming template %s', name, exc_info=True)
+                continue
+            compiled += 1
+    logger.info('Compiled %d templates in %.0f ms', compiled, (time.perf_counter() - started) * 1000)
+    return compiled
@@ -1,3 +1,1671 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from unittest import mock, skipUnless
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .models import (
+    Clinic, Doctor, DoctorPatientPanel, Hospital, HospitalAdmin, HospitalNameTrigram, MRNumberSequence, Patient,
+    PatientRecord, RecordTerm, StatCounter,
+)
+from .forms import PatientForm
+from .pagination import keyset_paginate, clamp_page_size, MAX_PAGE_SIZE
+from . import api, bulk, search, record_index, stats, panels, mrn, lookup, replicas, throttle, instrumentation, metrics, roles, sessions, hospital_names, fragments, templating, staticfiles, synthetic, stamps, views
+
+# Queued session writes would otherwise be flushed by whichever test's request
+# happens to finish once the interval is up, and show in its query counts
+_session_flushes = mock.patch.object(sessions, 'WRITE_BEHIND_INTERVAL', float('inf'))
+
+
+def setUpModule():
+    _session_flushes.start()
+
+
+def tearDownModule():
+    _session_flushes.stop()
+    # Left queued, the exit-time flush would write to the real database
+    sessions._pending.clear()
+
+
+def make_hospital(name='General Hospital'):
+    return Hospital.objects.create(name=name, contact_number='0000000000', email='hospital@example.com')
+
+
+def make_patient(hospital, n, **kwargs):
+    fields = dict(
+        mr_number=f'MR{n:06d}', first_name=f'First{n}', last_name=f'Last{n}',
+        date_of_birth=date(1990, 1, 1), gender='M', address='Street 1',
+        contact_number='03001234567', registered_at=hospital,
+    )
+    fields.update(kwargs)
+    return Patient.objects.create(**fields)
+
+
+class PatientListPaginationTests(TestCase):
+    def setUp(self):
+        self.hospitals = [make_hospital(f'Hospital {i}') for i in range(3)]
+        for n in range(23):
+            make_patient(self.hospitals[n % 3], n)
+        # Several patients share each registration date so the id tie-breaker matters
+        for patient in Patient.objects.all():
+            Patient.objects.filter(pk=patient.pk).update(registration_date=date(2024, 1, 1) + timedelta(days=patient.pk % 4))
+        self.user = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_pages_cover_every_patient_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Patient.objects.all(), ('registration_date', 'id'), after=cursor, page_size=5)
+            seen.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Patient.objects.order_by('-registration_date', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_before_cursor_returns_previous_page(self):
+        first = keyset_paginate(Patient.objects.all(), ('registration_date', 'id'), page_size=5)
+        second = keyset_paginate(Patient.objects.all(), ('registration_date', 'id'), after=first.next_cursor, page_size=5)
+        back = keyset_paginate(Patient.objects.all(), ('registration_date', 'id'), before=second.previous_cursor, page_size=5)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(first.has_previous)
+
+    def test_hospital_is_fetched_in_the_same_query(self):
+        response = self.client.get(reverse('patient_list'), {'page_size': 5})
+        small = len(response.context['patients'])
+        with self.assertNumQueries(3):  # session, user, patients joined to hospital
+            response = self.client.get(reverse('patient_list'), {'page_size': 20})
+        self.assertEqual(len(response.context['patients']), 20)
+        self.assertEqual(small, 5)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(clamp_page_size('100000'), MAX_PAGE_SIZE)
+        self.assertEqual(clamp_page_size('0'), 1)
+        self.assertEqual(clamp_page_size('abc'), 25)
+
+    def test_bad_cursor_is_404(self):
+        response = self.client.get(reverse('patient_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        hospital = make_hospital()
+        self.ayesha = make_patient(hospital, 1, first_name='Ayesha', last_name='Qureshi', contact_number='0300-5551234')
+        self.ali = make_patient(hospital, 2, first_name='Ali', last_name='Khan', email='ali.khan@example.com')
+        self.user = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_prefix_match_on_names(self):
+        self.assertEqual(search.search_patients('ayes qur'), [self.ayesha])
+        self.assertEqual(search.search_patients('kha'), [self.ali])
+
+    def test_phone_numbers_match_without_punctuation(self):
+        self.assertEqual(search.search_patients('03005551'), [self.ayesha])
+        self.assertEqual(search.search_patients('0300-555'), [self.ayesha])
+        self.assertEqual(search.search_patients('ayesha 0300 5551'), [self.ayesha])
+
+    def test_allocated_mr_numbers_are_found(self):
+        patient = make_patient(self.ayesha.registered_at, 3, mr_number=mrn.allocate(self.ayesha.registered_at_id))
+        self.assertIn('-', patient.mr_number)
+        self.assertEqual(search.search_patients(patient.mr_number), [patient])
+        # Separate tokens are not run together
+        self.assertEqual(search.search_patients(f'{self.ali.mr_number} 0300'), [self.ali])
+
+    def test_best_match_is_found_among_many(self):
+        search.index_patients([(n, f'MR{n}', 'Ayesha', 'Khan', '', '') for n in range(1000, 4000)], replace=False)
+        # Matched by MR number, the heaviest column, and indexed after all the name matches
+        search.index_patients([(9000, 'AYESHA', 'Zara', 'Ali', '', '')], replace=False)
+        self.assertEqual(search.search_patient_ids('ayesha', limit=1), [9000])
+        # Ties go to the newest; past the window only the newest matches are ranked
+        search.index_patients([(500, 'KHAN', 'Sara', 'Ali', '', '')], replace=False)
+        self.assertEqual(search.search_patient_ids('khan', limit=2), [500, 3999])
+        with mock.patch.object(search, 'RANK_WINDOW', 100):
+            self.assertEqual(search.search_patient_ids('khan', limit=1), [3999])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.ali.last_name = 'Malik'
+        self.ali.save()
+        self.assertEqual(search.search_patients('khan'), [self.ali])  # still in the email
+        self.assertEqual(search.search_patients('malik'), [self.ali])
+        self.ali.delete()
+        self.assertEqual(search.search_patients('malik'), [])
+
+    def test_mr_number_outranks_other_columns(self):
+        other = make_patient(self.ayesha.registered_at, 3, first_name='MR000001')
+        self.assertEqual(search.search_patients('MR000001'), [self.ayesha, other])
+
+    def test_fts_syntax_in_input_is_not_interpreted(self):
+        self.assertEqual(search.search_patients('ali"* ^(:'), [self.ali])
+
+    def test_rebuild_index(self):
+        Patient.objects.filter(pk=self.ali.pk).update(first_name='Bilal')
+        self.assertEqual(search.rebuild_index(), 2)
+        self.assertEqual(search.search_patients('bilal'), [self.ali])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('patient_search'), {'q': 'ayesha'})
+        self.assertEqual(list(response.context['patients']), [self.ayesha])
+
+
+def make_record(patient, **kwargs):
+    fields = dict(symptoms='fever', diagnosis='viral fever', prescription='paracetamol', notes='')
+    fields.update(kwargs)
+    return PatientRecord.objects.create(patient=patient, **fields)
+
+
+class RecordIndexTests(TestCase):
+    def setUp(self):
+        self.lahore = make_hospital('Lahore General')
+        self.karachi = make_hospital('Karachi Civil')
+        self.p1 = make_patient(self.lahore, 1)
+        self.p2 = make_patient(self.karachi, 2)
+        self.dengue_lahore = make_record(self.p1, symptoms='High fever, joint pain', diagnosis='Dengue fever')
+        self.dengue_karachi = make_record(self.p2, diagnosis='Suspected dengue', prescription='ORS and rest')
+        self.flu = make_record(self.p1, diagnosis='Influenza')
+
+    def test_terms_are_indexed_on_save(self):
+        self.assertEqual(record_index.search_records('dengue'), [self.dengue_karachi, self.dengue_lahore])
+        self.dengue_lahore.diagnosis = 'Chikungunya'
+        self.dengue_lahore.save()
+        self.assertEqual(record_index.search_records('dengue'), [self.dengue_karachi])
+        self.assertFalse(RecordTerm.objects.filter(record=self.dengue_lahore, term='dengue').exists())
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(record_index.search_records('fever joint'), [self.dengue_lahore])
+        self.assertEqual(record_index.search_records('dengue influenza'), [])
+
+    def test_prefix_terms(self):
+        self.assertEqual(record_index.search_records('influ*'), [self.flu])
+        self.assertEqual(record_index.search_records('influ'), [])
+
+    def test_hospital_and_date_filters(self):
+        self.assertEqual(record_index.search_records('dengue', hospital=self.karachi), [self.dengue_karachi])
+        old = timezone.now() - timedelta(days=30)
+        PatientRecord.objects.filter(pk=self.dengue_karachi.pk).update(visit_date=old)
+        RecordTerm.objects.filter(record=self.dengue_karachi).update(visit_date=old)
+        since = timezone.now() - timedelta(days=14)
+        self.assertEqual(record_index.search_records('dengue', date_from=since), [self.dengue_lahore])
+        self.assertEqual(record_index.search_records('dengue', date_to=since), [self.dengue_karachi])
+
+    def test_postings_follow_patient_to_new_hospital(self):
+        self.p1.registered_at = self.karachi
+        self.p1.save()
+        self.assertEqual(record_index.search_records('influenza', hospital=self.karachi), [self.flu])
+
+    def test_rebuild(self):
+        RecordTerm.objects.all().delete()
+        self.assertEqual(record_index.rebuild(), 3)
+        self.assertEqual(record_index.search_records('ors'), [self.dengue_karachi])
+
+    def test_hospital_admin_is_limited_to_own_hospital(self):
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.karachi, position='Admin', contact_number='0')
+        self.client.force_login(user)
+        response = self.client.get(reverse('record_search'), {'q': 'dengue', 'hospital': self.lahore.pk})
+        self.assertEqual(response.context['records'], [self.dengue_karachi])
+
+    def test_other_users_cannot_search(self):
+        url = reverse('record_search')
+        self.assertRedirects(self.client.get(url, {'q': 'dengue'}), f"{reverse('login')}?next={url}%3Fq%3Ddengue",
+                             fetch_redirect_response=False)
+        for user in (User.objects.create_user('plain', password='secret'), make_doctor(self.lahore, 'doc').user):
+            self.client.force_login(user)
+            self.assertRedirects(self.client.get(url, {'q': 'dengue'}), reverse('login'), fetch_redirect_response=False)
+
+    def test_nav_links_only_to_those_who_can_search(self):
+        link = f'href="{reverse("record_search")}"'
+        self.client.force_login(make_doctor(self.lahore, 'doc').user)
+        self.assertNotContains(self.client.get(reverse('doctor_dashboard')), link)
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.karachi, position='Admin', contact_number='0')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('hospital_admin_dashboard')), link)
+
+
+class GlobalCounterTests(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        self.patients = [make_patient(self.hospital, n) for n in range(3)]
+        make_record(self.patients[0])
+
+    def test_counters_follow_creates_and_deletes(self):
+        self.assertEqual(stats.global_counts(), {'patient_count': 3, 'doctor_count': 0, 'hospital_count': 1, 'record_count': 1})
+        self.patients[0].delete()  # cascades to its record
+        self.assertEqual(stats.global_counts()['patient_count'], 2)
+        self.assertEqual(stats.global_counts()['record_count'], 0)
+
+    def test_dashboard_reads_counters_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats.global_counts()
+
+    def test_reconcile_corrects_drift(self):
+        StatCounter.objects.filter(name='patient_count').update(value=42)
+        Patient.objects.bulk_create([Patient(mr_number='BULK00001', first_name='B', last_name='C', date_of_birth=date(2000, 1, 1),
+                                             gender='F', address='-', contact_number='0', registered_at=self.hospital)])
+        self.assertEqual(stats.global_counts()['patient_count'], 42)
+        self.assertEqual(stats.reconcile()['patient_count'], 4)
+        self.assertEqual(stats.global_counts()['patient_count'], 4)
+
+    def test_missing_counter_rows_are_rebuilt(self):
+        StatCounter.objects.all().delete()
+        self.assertEqual(stats.global_counts()['hospital_count'], 1)
+        make_hospital('Second')
+        self.assertEqual(StatCounter.objects.get(name='hospital_count').value, 2)
+
+    def test_admin_dashboard(self):
+        user = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['counts']['patient_count'], 3)
+
+
+class HospitalSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        self.other = make_hospital('Other')
+        self.patients = [make_patient(self.hospital, n) for n in range(12)]
+        make_patient(self.other, 99)
+        clinic = Clinic.objects.create(name='OPD', hospital=self.hospital, registration_number='C1', contact_number='0', specialization='General')
+        doctor_user = User.objects.create_user('doc', password='secret', first_name='Sara', last_name='Ali')
+        self.doctor = Doctor.objects.create(user=doctor_user, clinic=clinic, specialization='GP', license_number='L1', contact_number='0')
+        for patient in self.patients[:3]:
+            PatientRecord.objects.create(patient=patient, doctor=self.doctor, symptoms='s', diagnosis='d', prescription='p')
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.hospital, position='Admin', contact_number='0')
+        self.client.force_login(user)
+
+    def test_snapshot_is_computed_in_two_queries(self):
+        with self.assertNumQueries(2):
+            snapshot = stats.compute_hospital_snapshot(self.hospital.pk)
+        self.assertEqual((snapshot['patient_count'], snapshot['doctor_count'], snapshot['record_count']), (12, 1, 3))
+        self.assertEqual(len(snapshot['recent_patients']), 10)
+
+    def test_dashboard_query_count(self):
+        url = reverse('hospital_admin_dashboard')
+        # session (with the role in it), user, hospital, the block's version stamp + two snapshot queries;
+        # rendering adds none
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, 'Dr. Sara Ali')
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_writes_invalidate_only_their_hospital(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stats.hospital_snapshot(self.hospital.pk)
+            stats.hospital_snapshot(self.other.pk)
+            make_patient(self.hospital, 50)
+        with self.assertNumQueries(0):
+            stats.hospital_snapshot(self.other.pk)
+        self.assertEqual(stats.hospital_snapshot(self.hospital.pk)['patient_count'], 13)
+
+    def test_moves_invalidate_both_hospitals(self):
+        def counts(hospital):
+            snapshot = stats.hospital_snapshot(hospital.pk)
+            return snapshot['patient_count'], snapshot['doctor_count'], snapshot['record_count']
+
+        self.assertEqual((counts(self.hospital), counts(self.other)), ((12, 1, 3), (1, 0, 0)))
+        patient = self.patients[0]
+        patient.registered_at = self.other
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.save()
+        self.assertEqual((counts(self.hospital), counts(self.other)), ((11, 1, 2), (2, 0, 1)))
+
+        clinic = self.doctor.clinic
+        clinic.hospital = self.other
+        with self.captureOnCommitCallbacks(execute=True):
+            clinic.save()
+        self.assertEqual((counts(self.hospital)[1], counts(self.other)[1]), (0, 1))
+
+        self.doctor.clinic = Clinic.objects.create(name='Ward', hospital=self.hospital, registration_number='C2',
+                                                   contact_number='0', specialization='General')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.save()
+        self.assertEqual((counts(self.hospital)[1], counts(self.other)[1]), (1, 0))
+
+    def test_new_record_invalidates(self):
+        stats.hospital_snapshot(self.hospital.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            PatientRecord.objects.create(patient=self.patients[5], symptoms='s', diagnosis='d', prescription='p')
+        self.assertEqual(stats.hospital_snapshot(self.hospital.pk)['record_count'], 4)
+
+    def test_empty_hospital(self):
+        snapshot = stats.compute_hospital_snapshot(make_hospital('Empty').pk)
+        self.assertEqual((snapshot['patient_count'], snapshot['doctor_count'], snapshot['record_count']), (0, 0, 0))
+
+
+def make_doctor(hospital, username):
+    clinic = Clinic.objects.create(name=f'{username} clinic', hospital=hospital, registration_number=f'C-{username}',
+                                   contact_number='0', specialization='General')
+    user = User.objects.create_user(username, password='secret', first_name='Dr', last_name=username)
+    return Doctor.objects.create(user=user, clinic=clinic, specialization='GP', license_number='L1', contact_number='0')
+
+
+class DoctorPanelTests(TestCase):
+    def setUp(self):
+        hospital = make_hospital()
+        self.doctor = make_doctor(hospital, 'house')
+        self.other = make_doctor(hospital, 'wilson')
+        self.patients = [make_patient(hospital, n) for n in range(4)]
+
+    def panel(self, doctor, patient):
+        return DoctorPatientPanel.objects.get(doctor=doctor, patient=patient)
+
+    def test_visits_are_folded_into_the_panel(self):
+        first = make_record(self.patients[0], doctor=self.doctor)
+        second = make_record(self.patients[0], doctor=self.doctor)
+        row = self.panel(self.doctor, self.patients[0])
+        self.assertEqual(row.visit_count, 2)
+        self.assertEqual((row.first_seen, row.last_seen), (first.visit_date, second.visit_date))
+
+    def test_reassigning_and_deleting_records(self):
+        record = make_record(self.patients[1], doctor=self.doctor)
+        make_record(self.patients[1], doctor=self.doctor)
+        record.doctor = self.other
+        record.save()
+        self.assertEqual(self.panel(self.doctor, self.patients[1]).visit_count, 1)
+        self.assertEqual(self.panel(self.other, self.patients[1]).visit_count, 1)
+        record.delete()
+        self.assertFalse(DoctorPatientPanel.objects.filter(doctor=self.other).exists())
+
+    def test_deleting_a_patient_drops_its_panels(self):
+        make_record(self.patients[2], doctor=self.doctor)
+        self.patients[2].delete()
+        self.assertFalse(DoctorPatientPanel.objects.exists())
+
+    def test_rebuild_matches_incremental_state(self):
+        for n, patient in enumerate(self.patients):
+            for _ in range(n + 1):
+                make_record(patient, doctor=self.doctor if n % 2 else self.other)
+        before = sorted(DoctorPatientPanel.objects.values_list('doctor', 'patient', 'first_seen', 'last_seen', 'visit_count'))
+        self.assertEqual(panels.rebuild(), 4)
+        after = sorted(DoctorPatientPanel.objects.values_list('doctor', 'patient', 'first_seen', 'last_seen', 'visit_count'))
+        self.assertEqual(before, after)
+
+    def test_dashboard_lists_most_recent_patients_first(self):
+        for patient in self.patients:
+            make_record(patient, doctor=self.doctor)
+        make_record(self.patients[0], doctor=self.doctor)
+        self.client.force_login(self.doctor.user)
+        response = self.client.get(reverse('doctor_dashboard'), {'page_size': 3})
+        page = response.context['patients']
+        self.assertEqual([entry.patient for entry in page], [self.patients[0], self.patients[3], self.patients[2]])
+        self.assertTrue(page.has_next)
+
+
+class ImportPatientsTests(TestCase):
+    header = ['mr_number', 'first_name', 'last_name', 'date_of_birth', 'gender', 'address', 'contact_number',
+              'email', 'registered_at', 'registration_date']
+
+    def setUp(self):
+        self.hospital = make_hospital('City  Hospital')
+        make_patient(self.hospital, 1, mr_number='EXIST01')
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def row(self, mr, **kwargs):
+        row = dict(mr_number=mr, first_name='Sana', last_name='Malik', date_of_birth='1985-06-15', gender='F',
+                   address='Street 9', contact_number='0300-1234567', email='', registered_at=str(self.hospital.pk),
+                   registration_date='2023-03-01')
+        row.update(kwargs)
+        return row
+
+    def write_csv(self, rows):
+        path = os.path.join(self.dir.name, 'patients.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.header)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def import_file(self, path, **options):
+        call_command('import_patients', path, stdout=io.StringIO(), **options)
+
+    def test_valid_rows_are_imported_and_bad_rows_rejected(self):
+        path = self.write_csv([
+            self.row('IMP00001'),
+            self.row('IMP00002', gender='Q'),
+            self.row('IMP00001'),
+            self.row('EXIST01'),
+            self.row('IMP00003', registered_at='999'),
+            self.row('IMP00004', registration_date=''),
+        ])
+        self.import_file(path, batch_size=2)
+        self.assertEqual(set(Patient.objects.filter(mr_number__startswith='IMP').values_list('mr_number', flat=True)),
+                         {'IMP00001', 'IMP00004'})
+        self.assertEqual(Patient.objects.get(mr_number='IMP00001').registration_date, date(2023, 3, 1))
+        self.assertEqual(Patient.objects.get(mr_number='IMP00004').registration_date, date.today())
+        with open(path + '.rejects.csv', newline='') as f:
+            rejects = {row['mr_number']: row['_errors'] for row in csv.DictReader(f)}
+        self.assertEqual(set(rejects), {'IMP00002', 'IMP00001', 'EXIST01', 'IMP00003'})
+        self.assertIn('gender', rejects['IMP00002'])
+        self.assertIn('already exists', rejects['EXIST01'])
+
+    def test_given_creation_dates_are_kept(self):
+        patient = make_patient(self.hospital, 2)
+        self.assertEqual(patient.registration_date, date.today())
+        old = timezone.now() - timedelta(days=400)
+        record, = PatientRecord.objects.bulk_create([
+            PatientRecord(patient=patient, visit_date=old, symptoms='s', diagnosis='d', prescription='p'),
+        ])
+        self.assertEqual(PatientRecord.objects.get(pk=record.pk).visit_date, old)
+        # Nothing is switched off on the shared fields while loading
+        self.assertTrue(PatientRecord._meta.get_field('visit_date').auto_now_add)
+
+    def test_bulk_import_keeps_derived_data_in_sync(self):
+        cache.clear()
+        self.assertIsNone(lookup.record_summary('IMP00000'))  # cached as a miss
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_file(self.write_csv([self.row(f'IMP{n:05d}', first_name='Zubair') for n in range(5)]))
+        self.assertEqual(stats.global_counts()['patient_count'], 6)
+        self.assertEqual(len(search.search_patients('zubair')), 5)
+        self.assertIn('Zubair', lookup.record_summary('IMP00000'))
+
+    def test_bulk_records_retire_doctor_fragments(self):
+        doctor = make_doctor(self.hospital, 'doc')
+        patient = Patient.objects.get(mr_number='EXIST01')
+        before = fragments.stamp(f'doctor:{doctor.pk}')
+        with self.captureOnCommitCallbacks(execute=True):
+            records = PatientRecord.objects.bulk_create([
+                PatientRecord(patient=patient, doctor=doctor, symptoms='s', diagnosis='d', prescription='p'),
+            ])
+            bulk.records_created(records)
+        self.assertNotEqual(fragments.stamp(f'doctor:{doctor.pk}'), before)
+
+    def test_ndjson_with_hospital_names(self):
+        path = os.path.join(self.dir.name, 'patients.ndjson')
+        with open(path, 'w') as f:
+            f.write(json.dumps(self.row('IMP00010', registered_at='city hospital')) + '\n')
+            f.write('not json\n')
+        self.import_file(path, hospital_key='name')
+        self.assertEqual(Patient.objects.get(mr_number='IMP00010').registered_at, self.hospital)
+        with open(path + '.rejects.ndjson') as f:
+            self.assertIn('Invalid JSON', json.loads(f.readline())['_errors'])
+
+    def test_dry_run_writes_nothing(self):
+        self.import_file(self.write_csv([self.row('IMP00020')]), dry_run=True)
+        self.assertFalse(Patient.objects.filter(mr_number='IMP00020').exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        self.other = make_hospital('Other Hospital')
+        self.patients = [make_patient(self.hospital, n) for n in range(3)] + [make_patient(self.other, 3)]
+        Patient.objects.filter(pk=self.patients[0].pk).update(registration_date=date(2024, 1, 1))
+        for patient in self.patients:
+            make_record(patient)
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def download(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        return gzip.decompress(b''.join(response.streaming_content)).decode()
+
+    def test_staff_export_all_patients_as_csv(self):
+        self.client.force_login(self.staff)
+        rows = list(csv.DictReader(io.StringIO(self.download('export_patients'))))
+        self.assertEqual([row['mr_number'] for row in rows], [p.mr_number for p in self.patients])
+        self.assertEqual(rows[0]['registration_date'], '2024-01-01')
+
+    def test_filters_by_hospital_and_date(self):
+        self.client.force_login(self.staff)
+        text = self.download('export_patients', hospital=self.hospital.pk, date_from=date.today().isoformat())
+        self.assertEqual([row['mr_number'] for row in csv.DictReader(io.StringIO(text))],
+                         [p.mr_number for p in self.patients[1:3]])
+
+    def test_hospital_admin_is_pinned_to_own_hospital(self):
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.other)
+        self.client.force_login(user)
+        lines = self.download('export_records', format='ndjson', hospital=self.hospital.pk).splitlines()
+        self.assertEqual([json.loads(line)['mr_number'] for line in lines], [self.patients[3].mr_number])
+
+    def test_doctors_cannot_export(self):
+        self.client.force_login(make_doctor(self.hospital, 'house').user)
+        self.assertEqual(self.client.get(reverse('export_patients')).status_code, 403)
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'records.csv.gz')
+            call_command('export_data', 'records', hospital=self.hospital.pk, output=path, stdout=io.StringIO())
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 3)
+
+
+class SeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command('seed', hospitals=2, clinics=2, doctors=2, patients=40, visits=3, batch_size=15, stdout=io.StringIO())
+
+    def test_derived_data_matches_a_full_rebuild(self):
+        self.assertEqual((Hospital.objects.count(), Clinic.objects.count(), Doctor.objects.count()), (2, 4, 8))
+        self.assertEqual(Patient.objects.count(), 40)
+        self.assertTrue(PatientRecord.objects.filter(doctor__clinic__hospital=F('hospital')).count()
+                        == PatientRecord.objects.count() > 0)
+        self.assertEqual(stats.global_counts(), stats.reconcile())
+        panel_rows = set(DoctorPatientPanel.objects.values_list('doctor', 'patient', 'visit_count', 'first_seen', 'last_seen'))
+        postings = set(RecordTerm.objects.values_list('term', 'record', 'hospital', 'visit_date'))
+        panels.rebuild()
+        record_index.rebuild()
+        self.assertEqual(panel_rows, set(DoctorPatientPanel.objects.values_list('doctor', 'patient', 'visit_count', 'first_seen', 'last_seen')))
+        self.assertEqual(postings, set(RecordTerm.objects.values_list('term', 'record', 'hospital', 'visit_date')))
+        self.assertEqual(len(search.search_patients('BENCH000000007')), 1)
+
+    def test_seeding_again_adds_rows(self):
+        call_command('seed', hospitals=1, clinics=1, doctors=1, patients=10, visits=1, stdout=io.StringIO())
+        self.assertEqual(Patient.objects.count(), 50)
+
+    def test_url_benchmark_covers_every_url(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.json')
+            call_command('bench_urls', requests=2, warmup=0, output=path, stdout=io.StringIO(), stderr=io.StringIO())
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['uncovered_urls'], [])
+        for label, result in report['views'].items():
+            self.assertTrue(all(int(status) < 400 for status in result['status']), (label, result['status']))
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Patient.objects.count(), 40)  # the benchmark's writes were rolled back
+
+
+class MRNumberTests(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+
+    def test_numbers_carry_a_check_digit(self):
+        number = mrn.format_mr_number(4, 123)
+        self.assertEqual(number, '4-00001236')
+        self.assertTrue(mrn.is_valid(number))
+        self.assertFalse(mrn.is_valid('4-00001273'))
+        self.assertFalse(mrn.is_valid('000123456'))
+
+    def test_allocations_are_unique_per_hospital(self):
+        other = make_hospital('Other Hospital')
+        numbers = [mrn.allocate(self.hospital.pk) for _ in range(5)] + [mrn.allocate(other.pk) for _ in range(5)]
+        self.assertEqual(len(set(numbers)), 10)
+        self.assertTrue(all(mrn.is_valid(n) for n in numbers))
+
+    def test_patient_form_assigns_a_number_when_left_blank(self):
+        form = PatientForm(data=dict(
+            mr_number='', first_name='Sana', last_name='Malik', date_of_birth='1985-06-15', gender='F',
+            address='Street 9', contact_number='0300', registered_at=self.hospital.pk,
+        ))
+        self.assertTrue(form.is_valid(), form.errors)
+        patient = form.save()
+        self.assertTrue(patient.mr_number.startswith(f'{self.hospital.pk}-'))
+        self.assertTrue(mrn.is_valid(patient.mr_number))
+
+    def test_importer_assigns_missing_numbers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'patients.ndjson')
+            with open(path, 'w') as f:
+                for name in ('Sana', 'Bilal'):
+                    f.write(json.dumps(dict(first_name=name, last_name='Malik', date_of_birth='1985-06-15', gender='F',
+                                            address='Street 9', contact_number='0300', registered_at=self.hospital.pk)) + '\n')
+            call_command('import_patients', path, stdout=io.StringIO())
+        numbers = list(Patient.objects.values_list('mr_number', flat=True))
+        self.assertEqual(len(numbers), 2)
+        self.assertTrue(all(mrn.is_valid(n) for n in numbers))
+
+
+class MRNumberBlockTests(TransactionTestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        mrn._blocks.clear()
+        self.addCleanup(mrn._blocks.clear)
+
+    @mock.patch.object(mrn, 'BLOCK_SIZE', 10)
+    def test_numbers_are_served_from_reserved_blocks(self):
+        numbers = [mrn.allocate(self.hospital.pk) for _ in range(12)]
+        self.assertEqual(numbers, [mrn.format_mr_number(self.hospital.pk, n) for n in range(1, 13)])
+        self.assertEqual(MRNumberSequence.objects.get(hospital=self.hospital).next_value, 21)
+
+    @mock.patch.object(mrn, 'BLOCK_SIZE', 10)
+    def test_forked_process_reserves_its_own_block(self):
+        first = mrn.allocate(self.hospital.pk)
+        with mock.patch('os.getpid', return_value=-1):
+            child = mrn.allocate(self.hospital.pk)
+        self.assertEqual(child, mrn.format_mr_number(self.hospital.pk, 11))
+        self.assertNotEqual(first, child)
+
+
+class HospitalAdminDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        for n in range(3):
+            make_patient(self.hospital, n)
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.hospital, position='Admin', contact_number='0')
+        self.client.force_login(user)
+
+    def test_dashboard(self):
+        response = self.client.get(reverse('hospital_admin_dashboard'))
+        self.assertEqual(response.context['snapshot']['patient_count'], 3)
+        self.assertContains(response, 'MR000002')
+
+    def test_access(self):
+        self.client.logout()
+        response = self.client.get(reverse('hospital_admin_dashboard'))
+        self.assertRedirects(response, reverse('login') + '?next=' + reverse('hospital_admin_dashboard'),
+                             fetch_redirect_response=False)
+        self.client.force_login(User.objects.create_user('plain', password='secret'))
+        self.assertRedirects(self.client.get(reverse('hospital_admin_dashboard')), reverse('login'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).status_code, 302)
+
+
+class AsyncDashboardTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        for n in range(3):
+            make_patient(self.hospital, n)
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.hospital, position='Admin', contact_number='0')
+        self.client.force_login(user)
+
+    def test_snapshot_queries_run_on_pool_connections(self):
+        with self.assertNumQueries(0):
+            snapshot = async_to_sync(stats.ahospital_snapshot)(self.hospital.pk)
+        self.assertEqual(snapshot, stats.compute_hospital_snapshot(self.hospital.pk))
+        self.assertEqual((snapshot['patient_count'], snapshot['doctor_count'], snapshot['record_count']), (3, 0, 0))
+        self.assertEqual(async_to_sync(stats.ahospital_snapshot)(self.hospital.pk)['patient_count'], 3)
+
+    def test_dashboards(self):
+        response = self.client.get(reverse('hospital_admin_dashboard_async'))
+        self.assertEqual(response.context['snapshot'], stats.hospital_snapshot(self.hospital.pk))
+        self.assertContains(response, 'MR000002')
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        response = self.client.get(reverse('admin_dashboard_async'))
+        self.assertEqual(response.context['counts']['patient_count'], 3)
+
+    def test_cached_fragments_skip_the_snapshot(self):
+        first = self.client.get(reverse('hospital_admin_dashboard_async'))
+        with mock.patch.object(stats, 'ahospital_snapshot') as snapshot:
+            second = self.client.get(reverse('hospital_admin_dashboard_async'))
+        snapshot.assert_not_called()
+        self.assertEqual(second.content, first.content)
+
+    def test_access(self):
+        self.client.logout()
+        response = self.client.get(reverse('hospital_admin_dashboard_async'))
+        self.assertRedirects(response, reverse('login') + '?next=' + reverse('hospital_admin_dashboard_async'),
+                             fetch_redirect_response=False)
+        self.client.force_login(User.objects.create_user('plain', password='secret'))
+        self.assertRedirects(self.client.get(reverse('hospital_admin_dashboard_async')), reverse('login'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('admin_dashboard_async')).status_code, 302)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the replica stand-in copies SQLite databases')
+class ReplicaTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # A second SQLite file instead of the test mirror, so the replica can lag
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        replica = connections['replica']
+        mirror_settings = replica.settings_dict
+        replica.close()
+        replica.settings_dict = {**mirror_settings, 'NAME': path}
+
+        def restore():
+            replica.close()
+            replica.settings_dict = mirror_settings
+            os.remove(path)
+        self.addCleanup(restore)
+        patcher = mock.patch.object(replicas, 'REPLICAS', ['replica'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.hospital = make_hospital()
+        self.patient = make_patient(self.hospital, 1)
+        self.doctor = make_doctor(self.hospital, 'doc')
+        PatientRecord.objects.create(patient=self.patient, doctor=self.doctor, symptoms='s', diagnosis='Synced', prescription='p')
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        replicas.sync()
+        # Written after the last sync: only on default
+        make_patient(self.hospital, 2)
+
+    def test_reads_use_the_replica_only_when_routed(self):
+        self.assertEqual(Patient.objects.count(), 2)
+        with replicas.reads_from('replica'):
+            self.assertEqual(Patient.objects.count(), 1)
+            self.assertEqual(replicas.read_alias(), 'replica')
+        self.assertEqual(replicas.read_alias(), 'default')
+
+    def test_read_only_views_read_the_replica(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(len(self.client.get(reverse('patient_list')).context['patients']), 1)
+        rows = gzip.decompress(self.client.get(reverse('export_patients')).getvalue()).decode().splitlines()
+        self.assertEqual(len(rows), 2)  # header + the synced patient
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).context['counts']['hospital_count'], 1)
+
+    def test_dashboard_access_is_checked_on_default(self):
+        # Signed up after the last sync: unknown to the replica
+        staff = User.objects.create_user('new-staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        # /admin/dashboard/ is served by the admin site, so call the view itself
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        self.assertEqual(views.admin_dashboard(request).status_code, 200)
+        self.assertEqual(self.client.get(reverse('admin_dashboard_async')).status_code, 200)
+        user = User.objects.create_user('new-admin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.hospital, position='Admin', contact_number='0')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('hospital_admin_dashboard')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('hospital_admin_dashboard_async')).status_code, 200)
+
+    # Not cached, so that every request below renders from the database it reads
+    @mock.patch.object(fragments, 'TTL', 0)
+    def test_session_that_wrote_reads_its_writes(self):
+        writer, reader = self.client, self.client_class()
+        for client in (writer, reader):
+            client.force_login(self.doctor.user)
+        response = writer.post(reverse('add_patient_record', args=[self.patient.mr_number]),
+                               {'symptoms': 's', 'diagnosis': 'Fresh', 'prescription': 'p'})
+        self.assertEqual(response.status_code, 302)
+        self.assertContains(writer.get(reverse('doctor_dashboard')), 'Fresh')
+        # The doctor's dashboard fragments changed: rendered from default for everyone during the lag
+        self.assertContains(reader.get(reverse('doctor_dashboard')), 'Fresh')
+        with mock.patch('time.time', return_value=time.time() + replicas.MAX_LAG + 1):
+            self.assertNotContains(writer.get(reverse('doctor_dashboard')), 'Fresh')
+
+    def test_changed_cache_entries_are_recomputed_from_default(self):
+        cache.clear()  # the lag window of setUp's writes has passed
+        with replicas.reads_from('replica'):
+            self.assertEqual(stats.hospital_snapshot(self.hospital.pk)['patient_count'], 1)
+        make_patient(self.hospital, 3)  # invalidates and marks the snapshot changed
+        with replicas.reads_from('replica'):
+            self.assertEqual(stats.hospital_snapshot(self.hospital.pk)['patient_count'], 3)
+            self.assertIsNotNone(lookup.record_summary('MR000003'))
+
+
+@skipUnless(connection.settings_dict['ENGINE'] == 'core.backends.sqlite3', 'tests the tuned SQLite backend')
+class SQLiteBackendTests(TransactionTestCase):
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_transactions_take_the_write_lock_at_begin(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Hospital.objects.exists()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """
+    Every query a view runs must be an index lookup: no full table scan and
+    no temp B-tree sort. Inherently bounded sorts are listed below with the
+    reason they are allowed.
+    """
+    # Queries allowed to sort, matched on their SQL
+    exempt_queries = {
+        'core_patient_fts': 'bm25 ranking sorts the newest RANK_WINDOW matches of the search terms',
+        'SELECT DISTINCT "core_recordterm"': 'prefix terms merge postings of several terms',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = make_hospital()
+        cls.doctor = make_doctor(cls.hospital, 'house')
+        cls.patients = [make_patient(cls.hospital, n) for n in range(5)]
+        for patient in cls.patients:
+            make_record(patient, doctor=cls.doctor, diagnosis='dengue fever')
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        cls.hospital_admin = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=cls.hospital_admin, hospital=cls.hospital)
+
+    def setUp(self):
+        # Cached pages would hide their queries
+        cache.clear()
+        caches['local'].clear()
+
+    def assertIndexedPlans(self, user, url, params=None):
+        if user:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or any(key in sql for key in self.exempt_queries):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[3] for row in cursor.fetchall()]
+            for step in plan:
+                full_scan = step.startswith('SCAN ') and 'INDEX' not in step and '(subquery' not in step
+                self.assertFalse(full_scan or 'TEMP B-TREE' in step, f'{url}: {step}\n{sql}\n{plan}')
+
+    def test_patient_views(self):
+        self.assertIndexedPlans(self.staff, reverse('patient_list'))
+        first = keyset_paginate(Patient.objects.all(), ('registration_date', 'id'), page_size=2)
+        self.assertIndexedPlans(self.staff, reverse('patient_list'), {'page_size': 2, 'after': first.next_cursor})
+        self.assertIndexedPlans(self.staff, reverse('patient_search'), {'q': 'first1'})
+        self.assertIndexedPlans(self.staff, reverse('patient_detail', args=[self.patients[0].mr_number]))
+        self.assertIndexedPlans(None, reverse('patient_record_lookup'), {'mr_number': self.patients[1].mr_number})
+        self.assertIndexedPlans(self.staff, reverse('add_patient'))
+        make_record(self.patients[0], doctor=self.doctor)
+        first = keyset_paginate(PatientRecord.objects.filter(patient=self.patients[0]), ('visit_date', 'id'), page_size=1)
+        self.assertIndexedPlans(self.staff, reverse('patient_timeline', args=[self.patients[0].mr_number]),
+                                {'after': first.next_cursor})
+
+    def test_record_search(self):
+        self.assertIndexedPlans(self.staff, reverse('record_search'), {'q': 'dengue fever'})
+        self.assertIndexedPlans(self.hospital_admin, reverse('record_search'), {'q': 'dengu*', 'date_from': '2020-01-01'})
+
+    def test_dashboards(self):
+        self.assertIndexedPlans(self.staff, reverse('admin_dashboard'))
+        self.assertIndexedPlans(self.hospital_admin, reverse('hospital_admin_dashboard'))
+        self.assertIndexedPlans(self.doctor.user, reverse('doctor_dashboard'))
+
+    def test_api(self):
+        # Doctors are reached through the hospital's clinics and sorted by id
+        # afterwards; that is one hospital's staff list, small by nature.
+        for resource in ('patients', 'records', 'clinics'):
+            self.assertIndexedPlans(self.hospital_admin, reverse('api_list', args=[resource]))
+        self.assertIndexedPlans(self.staff, reverse('api_list', args=['records']), {'patient': self.patients[0].mr_number})
+        self.assertIndexedPlans(self.staff, reverse('api_detail', args=['patients', self.patients[0].pk]))
+
+    def test_hospital_exports(self):
+        # Exports of every hospital read the whole table by design and are not checked
+        self.assertIndexedPlans(self.hospital_admin, reverse('export_patients'), {'date_from': '2020-01-01'})
+        self.assertIndexedPlans(self.hospital_admin, reverse('export_records'), {'date_from': '2020-01-01'})
+
+
+class RecordHospitalTests(TestCase):
+    def test_records_follow_their_patients_hospital(self):
+        first, second = make_hospital(), make_hospital('Second Hospital')
+        patient = make_patient(first, 1)
+        record = make_record(patient)
+        self.assertEqual(record.hospital_id, first.pk)
+        patient.registered_at = second
+        patient.save()
+        record.refresh_from_db()
+        self.assertEqual(record.hospital_id, second.pk)
+        self.assertEqual(stats.compute_hospital_snapshot(second.pk)['record_count'], 1)
+
+
+class PublicLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['local'].clear()
+        self.patient = make_patient(make_hospital(), 1)
+        make_record(self.patient, diagnosis='Dengue')
+
+    def lookup(self, mr_number, ip='10.0.0.1'):
+        return self.client.get(reverse('patient_record_lookup'), {'mr_number': mr_number}, REMOTE_ADDR=ip)
+
+    def test_summary_is_cached_until_a_record_is_saved(self):
+        self.assertContains(self.lookup(self.patient.mr_number), 'Dengue')
+        with self.assertNumQueries(0):
+            self.assertContains(self.lookup(self.patient.mr_number), 'Dengue')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_record(self.patient, diagnosis='Typhoid')
+        self.assertContains(self.lookup(self.patient.mr_number), 'Typhoid')
+
+    def test_changed_mr_number_stops_serving_the_old_one(self):
+        old = self.patient.mr_number
+        self.assertContains(self.lookup(old), 'Dengue')
+        self.patient.mr_number = 'MR999999'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.save()
+        self.assertContains(self.lookup(old), 'No records found')
+        self.assertContains(self.lookup('MR999999'), 'Dengue')
+
+    def test_unknown_numbers_are_cached_briefly(self):
+        self.assertContains(self.lookup('NOPE12345'), 'No records found')
+        with self.assertNumQueries(0):
+            self.assertContains(self.lookup('NOPE12345'), 'No records found')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient(self.patient.registered_at, 2, mr_number='NOPE12345')
+        self.assertContains(self.lookup('NOPE12345'), 'Medical Records for')
+
+    def test_each_ip_gets_its_own_token_bucket(self):
+        for _ in range(lookup.BURST):
+            self.assertEqual(self.lookup(self.patient.mr_number).status_code, 200)
+        response = self.lookup(self.patient.mr_number)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.lookup(self.patient.mr_number, ip='10.0.0.2').status_code, 200)
+
+    def test_bucket_refills_over_time(self):
+        with mock.patch('core.throttle.time.monotonic', return_value=1000.0):
+            for _ in range(lookup.BURST):
+                throttle.consume('test', 'ip', lookup.BURST, lookup.RATE)
+            self.assertGreater(throttle.consume('test', 'ip', lookup.BURST, lookup.RATE), 0)
+        with mock.patch('core.throttle.time.monotonic', return_value=1000.0 + 1 / lookup.RATE):
+            self.assertEqual(throttle.consume('test', 'ip', lookup.BURST, lookup.RATE), 0)
+
+
+class PatientTimelineTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient(make_hospital(), 1)
+        self.records = [make_record(self.patient, diagnosis=f'Visit {n} ' + 'x' * 500, notes=f'note {n}') for n in range(15)]
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+
+    def test_detail_shows_newest_page_of_summaries(self):
+        response = self.client.get(reverse('patient_detail', args=[self.patient.mr_number]))
+        visits = response.context['visits']
+        self.assertEqual([v.pk for v in visits], [r.pk for r in reversed(self.records[5:])])
+        self.assertTrue(visits.has_next)
+        self.assertNotContains(response, 'note 14')
+        self.assertNotContains(response, 'x' * 200)
+        self.assertContains(response, ('Visit 14 ' + 'x' * 500)[:119] + '…')
+
+    def test_query_count_does_not_grow_with_history(self):
+        url = reverse('patient_detail', args=[self.patient.mr_number])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for _ in range(20):
+            make_record(self.patient, doctor=make_doctor(self.patient.registered_at, f'dr{_}'))
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+
+    def test_fragments_load_older_pages_and_full_visits(self):
+        first = self.client.get(reverse('patient_detail', args=[self.patient.mr_number])).context['visits']
+        response = self.client.get(reverse('patient_timeline', args=[self.patient.mr_number]), {'after': first.next_cursor})
+        self.assertEqual([v.pk for v in response.context['visits']], [r.pk for r in reversed(self.records[:5])])
+        self.assertNotContains(response, '<html')
+        response = self.client.get(reverse('patient_visit', args=[self.patient.mr_number, self.records[0].pk]))
+        self.assertContains(response, 'note 0')
+        self.assertContains(response, 'x' * 500)
+
+    def test_visit_must_belong_to_the_patient(self):
+        other = make_patient(self.patient.registered_at, 2)
+        response = self.client.get(reverse('patient_visit', args=[other.mr_number, self.records[0].pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class APITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital, self.other = make_hospital(), make_hospital('Other Hospital')
+        self.patients = [make_patient(self.hospital, n) for n in range(5)] + [make_patient(self.other, 5)]
+        for patient in self.patients:
+            make_record(patient)
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def get(self, resource, pk=None, **params):
+        if pk is None:
+            return self.client.get(reverse('api_list', args=[resource]), params)
+        return self.client.get(reverse('api_detail', args=[resource, pk]), params)
+
+    def test_pages_with_selected_fields_without_model_instances(self):
+        seen, params = [], {'fields': 'mr_number,hospital_id', 'page_size': 4}
+        with mock.patch.object(Patient, 'from_db', side_effect=AssertionError('model instantiated')):
+            while True:
+                body = self.get('patients', **params).json()
+                seen.extend(body['results'])
+                if not body['next']:
+                    break
+                params['after'] = body['next'].split('after=')[1]
+        self.assertEqual(seen[0], {'mr_number': self.patients[-1].mr_number, 'hospital_id': self.other.pk})
+        self.assertEqual(sorted(row['mr_number'] for row in seen), sorted(p.mr_number for p in self.patients))
+
+    def test_every_resource_lists_and_details(self):
+        make_doctor(self.hospital, 'house')
+        for resource in api.RESOURCES:
+            rows = self.get(resource).json()['results']
+            self.assertTrue(rows, resource)
+            self.assertEqual(self.get(resource, rows[0]['id']).json(), rows[0])
+
+    def test_hospital_admin_is_pinned_to_own_hospital(self):
+        user = User.objects.create_user('hadmin', password='secret')
+        HospitalAdmin.objects.create(user=user, hospital=self.other)
+        self.client.force_login(user)
+        rows = self.get('records', hospital=self.hospital.pk).json()['results']
+        self.assertEqual([row['mr_number'] for row in rows], [self.patients[-1].mr_number])
+        self.assertEqual(self.get('patients', self.patients[0].pk).status_code, 404)
+
+    def test_records_for_one_patient(self):
+        rows = self.get('records', patient=self.patients[2].mr_number, fields='id,mr_number').json()['results']
+        self.assertEqual(rows, [{'id': PatientRecord.objects.get(patient=self.patients[2]).pk,
+                                 'mr_number': self.patients[2].mr_number}])
+
+    def test_errors(self):
+        self.assertEqual(self.get('patients', fields='nope').status_code, 400)
+        self.assertEqual(self.get('patients', after='garbage').status_code, 400)
+        self.assertEqual(self.get('widgets').status_code, 404)
+        self.client.force_login(make_doctor(self.hospital, 'house').user)
+        self.assertEqual(self.get('patients').status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.get('patients').status_code, 401)
+
+    def test_conditional_get(self):
+        url = reverse('api_list', args=['patients'])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        # Only authentication (session and user) touches the database for an unchanged resource
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient(self.hospital, 99)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        # Other resources keep their validators
+        hospitals_url = reverse('api_list', args=['hospitals'])
+        etag = self.client.get(hospitals_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            make_record(self.patients[0])
+        self.assertEqual(self.client.get(hospitals_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_validators_are_shared_and_stable(self):
+        url = reverse('api_list', args=['patients'])
+        etag = self.client.get(url)['ETag']
+        # A worker with an empty (or expired) cache reads the stamps from the database
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another worker's write: nothing reaches this worker's cache
+        make_patient(self.hospital, 99)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.clear()  # CHANGE_STAMP_TTL later
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        # The test client builds its middleware on the first request, after this patch
+        patcher = mock.patch.object(instrumentation, 'SAMPLE_RATE', 1.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hospital = make_hospital()
+
+    def middleware(self, get_response):
+        return instrumentation.QueryInstrumentationMiddleware(get_response)
+
+    def test_off_by_default(self):
+        with mock.patch.object(instrumentation, 'SAMPLE_RATE', 0.0):
+            with self.assertRaises(MiddlewareNotUsed):
+                self.middleware(lambda request: HttpResponse())
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND n = 3 AND s = \'it\'\'s\''),
+            'SELECT * FROM t WHERE id IN (%s, ...) AND n = ? AND s = ?',
+        )
+
+    def test_headers(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        with self.assertLogs('core.instrumentation', 'INFO'):
+            response = self.client.get(reverse('patient_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+        self.assertNotIn('X-N-Plus-One', response)
+
+    def test_flags_repeated_selects(self):
+        hospitals = [make_hospital(f'Hospital {n}') for n in range(6)]
+
+        def view(request):
+            return HttpResponse(', '.join(Hospital.objects.get(pk=h.pk).name for h in hospitals))
+
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            response = self.middleware(view)(RequestFactory().get('/hospitals/'))
+        self.assertEqual(response['X-DB-Queries'], '6')
+        self.assertEqual(response['X-N-Plus-One'], '1')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], '<unresolved>')
+        self.assertNotIn('/hospitals/', logs.records[0].getMessage())
+        self.assertEqual(entry['n_plus_one'][0]['count'], 6)
+
+    def test_clinic_choices_are_joined(self):
+        for n in range(6):
+            make_doctor(make_hospital(f'Hospital {n}'), f'doctor{n}')
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('register_doctor'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'register_doctor')
+        self.assertNotIn('X-N-Plus-One', response)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for name, value in (('ENABLED', True), ('DIRECTORY', directory)):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The test connection was opened (and left alone) while metrics were off
+        metrics.instrument_connection(connection)
+        self.addCleanup(connection.execute_wrappers.remove, metrics.observe_query)
+
+    def scrape(self, **extra):
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode().splitlines()
+
+    def test_requests_and_tables(self):
+        make_patient(make_hospital(), 1)
+        self.client.get(reverse('register'))
+        self.client.get(reverse('register'))
+        lines = self.scrape()
+        self.assertIn('django_http_requests_total{view="register",method="GET",status="200"} 2.0', lines)
+        self.assertIn('django_http_request_duration_seconds_count{view="register"} 2.0', lines)
+        self.assertIn('core_table_rows{model="core.Patient"} 1.0', lines)
+        self.assertIn('# TYPE django_db_query_duration_seconds histogram', lines)
+        self.assertTrue(any(line.startswith('django_db_query_duration_seconds_count{alias="default"}') for line in lines))
+
+    def test_restricted_to_allowed_networks(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code, 403)
+        self.scrape(REMOTE_ADDR='::1')
+
+    def test_token(self):
+        with mock.patch.object(metrics, 'TOKEN', 's3cret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+
+    def test_off_by_default(self):
+        with mock.patch.object(metrics, 'ENABLED', False):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+            metrics.LOGINS.inc(result='success')
+        self.assertEqual(os.listdir(metrics.DIRECTORY), [])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('kind',), buckets=(0.01, 0.1))
+        self.addCleanup(metrics.REGISTRY.remove, histogram)
+        for value in (0.005, 0.05, 0.06, 5):
+            histogram.observe(value, kind='a')
+        lines = self.scrape()
+        self.assertIn('test_seconds_bucket{kind="a",le="0.01"} 1.0', lines)
+        self.assertIn('test_seconds_bucket{kind="a",le="0.1"} 3.0', lines)
+        self.assertIn('test_seconds_bucket{kind="a",le="+Inf"} 4.0', lines)
+        self.assertIn('test_seconds_count{kind="a"} 4.0', lines)
+        self.assertIn('test_seconds_sum{kind="a"} 5.115', lines)
+
+    def test_processes_are_summed(self):
+        metrics.LOGINS.inc(result='success')
+        # Another worker process writes its own file in the same directory
+        with mock.patch('os.getpid', return_value=os.getpid() + 100000):
+            metrics.ValuesFile(metrics.DIRECTORY).inc(metrics._key('django_logins_total', (('result', 'success'),)), 2)
+        self.assertEqual(len(os.listdir(metrics.DIRECTORY)), 2)
+        self.assertEqual(metrics.collect()['django_logins_total', (('result', 'success'),)], 3)
+
+    def test_values_file_grows_and_reopens(self):
+        values = metrics.ValuesFile(metrics.DIRECTORY)
+        for n in range(3000):
+            values.inc(f'key-{n}', n)
+        reopened = metrics.ValuesFile(metrics.DIRECTORY)
+        reopened.inc('key-2999', 1)
+        totals = dict(((key, value) for key, value, _ in metrics._entries(reopened._map, reopened._used)))
+        self.assertEqual(len(totals), 3000)
+        self.assertEqual(totals['key-2999'], 3000)
+
+    def test_logins_and_cache_reads(self):
+        User.objects.create_user('metrics-staff', password='secret', is_staff=True)
+        self.client.post(reverse('admin_login'), {'username': 'metrics-staff', 'password': 'wrong'})
+        self.client.post(reverse('admin_login'), {'username': 'metrics-staff', 'password': 'secret'})
+        cache.get('metrics-test')
+        cache.set('metrics-test', 1)
+        cache.get('metrics-test')
+        lines = self.scrape()
+        self.assertIn('django_logins_total{result="failure"} 1.0', lines)
+        self.assertIn('django_logins_total{result="success"} 1.0', lines)
+        self.assertIn('django_cache_reads_total{cache="health-system",result="hit"} 1.0', lines)
+        self.assertIn('django_cache_reads_total{cache="health-system",result="miss"} 1.0', lines)
+
+
+class RoleTests(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital()
+        self.doctor = make_doctor(self.hospital, 'house')
+
+    def make_admin(self, user):
+        return HospitalAdmin.objects.create(user=user, hospital=self.hospital, position='Admin', contact_number='0')
+
+    def test_login_stores_role(self):
+        response = self.client.post(reverse('login'), {'username': 'house', 'password': 'secret', 'user_type': 'doctor'})
+        self.assertRedirects(response, reverse('doctor_dashboard'), fetch_redirect_response=False)
+        stored = self.client.session[roles.SESSION_KEY]
+        self.assertEqual((stored['kind'], stored['doctor_id'], stored['user']),
+                         (roles.DOCTOR, self.doctor.pk, self.doctor.user_id))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(reverse('doctor_dashboard')).status_code, 200)
+        self.assertFalse([q for q in captured.captured_queries if 'core_hospitaladmin' in q['sql']])
+
+    def test_role_required(self):
+        url = reverse('hospital_admin_dashboard')
+        self.assertRedirects(self.client.get(url), f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+        self.client.force_login(self.doctor.user)
+        self.assertRedirects(self.client.get(url), reverse('login'), fetch_redirect_response=False)
+        # A doctor who also administers a hospital gets both dashboards
+        self.make_admin(self.doctor.user)
+        self.client.force_login(User.objects.get(pk=self.doctor.user_id))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('doctor_dashboard')).status_code, 200)
+
+    def test_session_without_role_and_stale_role(self):
+        user = User.objects.create_user('clerk', password='secret')
+        self.client.force_login(user)
+        session = self.client.session
+        del session[roles.SESSION_KEY]
+        session.save()
+        # The login page sends signed-in users to their role's dashboard
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        self.assertEqual(self.client.session[roles.SESSION_KEY]['kind'], roles.USER)
+
+        # Made an administrator while signed in: noticed once the stored role expires
+        self.make_admin(user)
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        with mock.patch.object(roles, 'ROLE_SESSION_TTL', 0):
+            self.assertRedirects(self.client.get(reverse('login')), reverse('hospital_admin_dashboard'),
+                                 fetch_redirect_response=False)
+        self.assertEqual(self.client.session[roles.SESSION_KEY]['hospital_id'], self.hospital.pk)
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = dict(settings.CACHES, sessions={
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory,
+        })
+        overridden = override_settings(SESSION_ENGINE='core.sessions', CACHES=shared)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.user = User.objects.create_user('clerk', password='secret')
+
+    def sign_in(self):
+        self.client.force_login(self.user)
+        return self.client.session.session_key
+
+    def session_queries(self, captured):
+        return [q for q in captured.captured_queries if 'django_session' in q['sql']]
+
+    def test_new_sessions_are_written_through(self):
+        key = self.sign_in()
+        self.assertTrue(Session.objects.filter(session_key=key).exists())
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        self.assertEqual(self.session_queries(captured), [])
+
+    def test_changes_are_written_behind(self):
+        key = self.sign_in()
+        session = self.client.session
+        session['note'] = 'queued'
+        with CaptureQueriesContext(connection) as captured:
+            session.save()
+        self.assertEqual(self.session_queries(captured), [])
+        self.assertIn(key, sessions.pending())
+        # Still readable when the cache lost it before the flush
+        caches['sessions'].clear()
+        self.assertEqual(self.client.session['note'], 'queued')
+
+        with mock.patch.object(sessions, 'WRITE_BEHIND_INTERVAL', 0):
+            self.client.get(reverse('login'))
+        self.assertEqual(sessions.pending(), set())
+        self.assertEqual(Session.objects.get(session_key=key).get_decoded()['note'], 'queued')
+
+    def test_logout_is_not_undone_by_a_queued_write(self):
+        key = self.sign_in()
+        session = self.client.session
+        session['note'] = 'queued'
+        session.save()
+        self.client.get(reverse('logout'))
+        self.assertFalse(Session.objects.filter(session_key=key).exists())
+        self.assertNotIn(key, sessions.pending())
+        # Another worker still holding a queued change neither serves nor writes it
+        sessions._pending[key] = (session.encode({'note': 'late'}), timezone.now() + timedelta(days=1))
+        self.assertEqual(sessions.SessionStore(key).load(), {})
+        sessions.flush()
+        self.assertFalse(Session.objects.filter(session_key=key).exists())
+
+    def test_refuses_a_per_process_cache(self):
+        local = dict(settings.CACHES, sessions={'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        with override_settings(CACHES=local):
+            with self.assertRaises(ImproperlyConfigured):
+                sessions.SessionStore()
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookies(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        self.assertEqual(self.session_queries(captured), [])
+        self.assertFalse(Session.objects.exists())
+
+    def test_purge_sessions(self):
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.create(session_key=f'expired{n}', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='current', session_data='', expire_date=now + timedelta(days=1))
+        out = io.StringIO()
+        call_command('purge_sessions', batch_size=2, pause=0, stdout=out)
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+
+
+class FacilityAutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lahore = make_hospital('Lahore General Hospital')
+        self.karachi = make_hospital('Karachi Heart Institute')
+        self.cardiology = Clinic.objects.create(name='Cardiology Wing', hospital=self.karachi, registration_number='C-1',
+                                                contact_number='0', specialization='Cardiology', clinic_type='specialty')
+        Clinic.objects.create(name='General Clinic', hospital=self.lahore, registration_number='C-2',
+                              contact_number='0', specialization='General')
+
+    def search(self, kind, **params):
+        response = self.client.get(reverse('facility_autocomplete', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['id'], row['text']) for row in response.json()['results']]
+
+    def test_prefix_of_any_word(self):
+        self.assertEqual(self.search('hospitals', q='gen'), [(self.lahore.pk, 'Lahore General Hospital')])
+        self.assertEqual(self.search('hospitals', q='  HEART  inst'), [(self.karachi.pk, 'Karachi Heart Institute')])
+        self.assertEqual([pk for pk, _ in self.search('hospitals', q='h')], [self.karachi.pk, self.lahore.pk])
+        self.assertEqual(self.search('hospitals', q=''), [])
+        self.assertEqual(self.search('hospitals', q='hospital', limit='1'), [(self.lahore.pk, 'Lahore General Hospital')])
+        self.assertEqual(self.search('clinics', q='card'), [(self.cardiology.pk, str(self.cardiology))])
+        self.assertEqual(self.search('clinics', q='c', hospital=self.karachi.pk), [(self.cardiology.pk, str(self.cardiology))])
+        self.assertEqual(self.client.get(reverse('facility_autocomplete', args=['wards'])).status_code, 404)
+
+    def test_hospitals_with_the_same_name_are_told_apart(self):
+        rawalpindi = Hospital.objects.create(name='CMH', city='Rawalpindi', contact_number='0', email='a@example.com')
+        lahore = [Hospital.objects.create(name='CMH', city='Lahore', contact_number='0', email=f'{n}@example.com')
+                  for n in range(2)]
+        self.assertEqual(self.search('hospitals', q='cmh'), [
+            (lahore[0].pk, f'CMH - Lahore #{lahore[0].pk}'), (lahore[1].pk, f'CMH - Lahore #{lahore[1].pk}'),
+            (rawalpindi.pk, 'CMH - Rawalpindi'),
+        ])
+
+    def test_index_is_cached_until_a_write(self):
+        self.search('clinics', q='card')
+        with self.assertNumQueries(0):
+            self.search('clinics', q='gen')
+        # Renaming a hospital changes its clinics' labels
+        with self.captureOnCommitCallbacks(execute=True):
+            Hospital.objects.filter(pk=self.karachi.pk).update(name='Karachi Cardiac Centre')
+            api.touch(Hospital)
+        self.assertEqual(self.search('clinics', q='card'),
+                         [(self.cardiology.pk, 'Cardiology Wing (specialty) - Karachi Cardiac Centre')])
+
+    def test_form_pages_do_not_list_facilities(self):
+        for n in range(20):
+            make_hospital(f'Hospital {n}')
+        self.search('clinics', q='x')
+        self.search('hospitals', q='x')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('register_doctor'))
+        self.assertNotContains(response, 'Cardiology Wing')
+        self.assertContains(response, 'js/autocomplete.js')
+        response = self.client.get(reverse('register_admin'))
+        self.assertNotContains(response, 'Hospital 19')
+
+    def test_choice_is_validated_and_relabelled(self):
+        data = {'username': 'drnew', 'first_name': 'New', 'last_name': 'Doctor', 'email': 'new@example.com',
+                'password1': 'a-long-Passw0rd', 'password2': 'a-long-Passw0rd',
+                'specialization': 'GP', 'license_number': 'L9', 'clinic': '999999'}
+        response = self.client.post(reverse('register_doctor'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Doctor.objects.exists())
+        # An invalid choice renders empty; a valid one shows its label again
+        data['clinic'], data['password2'] = str(self.cardiology.pk), 'mismatch'
+        response = self.client.post(reverse('register_doctor'), data)
+        self.assertContains(response, f'value="{self.cardiology.pk}"')
+        self.assertContains(response, 'value="Cardiology Wing (specialty) - Karachi Heart Institute"')
+
+
+class HospitalNameTests(TestCase):
+    def setUp(self):
+        self.hospital = make_hospital('Usman General Hospital')
+
+    def register_clinic(self, hospital_name, n=1):
+        data = {
+            'name': f'Clinic {n}', 'clinic_type': 'general', 'registration_number': f'CR-{n}', 'license_number': 'L-1',
+            'hospital_name': hospital_name, 'specialization': 'General', 'email': 'clinic@example.com',
+            'contact_number': '0300', 'street_address': 'Street 1', 'city': 'Lahore', 'state': 'Punjab',
+            'postal_code': '54000', 'country': 'Pakistan', 'owner_name': 'Owner', 'cnic_number': '1',
+            'designation': 'Manager', 'owner_mobile': '0300', 'owner_email': 'owner@example.com',
+            'username': f'clinic{n}', 'password': 'a-long-Passw0rd', 'confirm_password': 'a-long-Passw0rd',
+        }
+        response = self.client.post(reverse('register_clinic'), data)
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        return Clinic.objects.get(registration_number=f'CR-{n}').hospital
+
+    def test_normalized_on_save(self):
+        self.assertEqual(self.hospital.normalized_name, 'usman general hospital')
+        self.assertEqual(hospital_names.normalize("  St. Mary's  Hôpital--Lahore "), 'st marys hopital lahore')
+        self.hospital.name = 'Usman Hospital'
+        self.hospital.save()
+        self.assertEqual(
+            set(HospitalNameTrigram.objects.filter(hospital=self.hospital).values_list('trigram', flat=True)),
+            hospital_names.trigrams('usman hospital'),
+        )
+
+    def test_exact_and_fuzzy_matches(self):
+        make_hospital('Lahore General Hospital')
+        self.assertEqual(hospital_names.find('USMAN general-hospital.'), (self.hospital, 1.0))
+        hospital, score = hospital_names.find('Usman Genral Hospital')
+        self.assertEqual(hospital, self.hospital)
+        self.assertLess(score, 1.0)
+        self.assertEqual(hospital_names.find('Services Hospital'), (None, 0.0))
+        self.assertEqual(hospital_names.find(' ... '), (None, 0.0))
+
+    def test_registration_links_or_creates_once(self):
+        self.assertEqual(self.register_clinic('USMAN general-hospital.', 1), self.hospital)
+        created = self.register_clinic('Mayo Hospital', 2)
+        self.assertTrue(hospital_names.is_placeholder(created))
+        self.assertEqual(self.register_clinic('MAYO  hospital', 3), created)
+        self.assertEqual(Hospital.objects.count(), 2)
+
+    def test_registration_never_links_a_similar_name(self):
+        make_hospital('City Hospital')
+        self.assertGreater(hospital_names.similarity('city hospital', 'city hospital 2'), hospital_names.SIMILARITY_THRESHOLD)
+        created = self.register_clinic('City Hospital 2')
+        self.assertTrue(hospital_names.is_placeholder(created))
+        self.assertEqual(created.name, 'City Hospital 2')
+
+    def test_seeded_hospitals_are_indexed(self):
+        seeded = synthetic.seed_hospitals(2)
+        self.assertEqual(hospital_names.find(seeded[1].name.upper()), (seeded[1], 1.0))
+        self.assertEqual(HospitalNameTrigram.objects.filter(hospital=seeded[0]).count(),
+                         len(hospital_names.trigrams(seeded[0].normalized_name)))
+
+    def test_dedupe_merges_placeholders(self):
+        placeholders = [
+            Hospital.objects.create(name=name, contact_number='0000000000', email='temp@example.com')
+            for name in ('usman general hospital', 'Usman General Hospital.', 'Usman Genral Hospital', 'Mayo Hospital')
+        ]
+        patient = make_patient(placeholders[0], 1)
+        clinic = Clinic.objects.create(name='C', hospital=placeholders[2], registration_number='C-1',
+                                       contact_number='0', specialization='General')
+        out = io.StringIO()
+        call_command('dedupe_hospitals', dry_run=True, fuzzy=True, stdout=out)
+        self.assertIn('3 placeholder hospital(s) to merge', out.getvalue())
+        self.assertEqual(Hospital.objects.count(), 5)
+
+        call_command('dedupe_hospitals', stdout=io.StringIO())
+        self.assertEqual(Hospital.objects.count(), 3)
+        patient.refresh_from_db()
+        self.assertEqual(patient.registered_at, self.hospital)
+
+        call_command('dedupe_hospitals', fuzzy=True, stdout=io.StringIO())
+        clinic.refresh_from_db()
+        self.assertEqual(clinic.hospital, self.hospital)
+        self.assertEqual(sorted(Hospital.objects.values_list('name', flat=True)), ['Mayo Hospital', 'Usman General Hospital'])
+        self.assertEqual(stats.global_counts()['hospital_count'], 2)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = make_hospital()
+        self.other = make_hospital('Other')
+        self.patient = make_patient(self.hospital, 1)
+        clinic = Clinic.objects.create(name='OPD', hospital=self.hospital, registration_number='C1', contact_number='0',
+                                       specialization='General')
+        self.doctor = Doctor.objects.create(user=User.objects.create_user('doc', first_name='Sara', last_name='Ali'),
+                                            clinic=clinic, specialization='GP', license_number='L1', contact_number='0')
+        self.admin = User.objects.create_user('hadmin')
+        HospitalAdmin.objects.create(user=self.admin, hospital=self.hospital, position='Admin', contact_number='0')
+
+    def test_hospital_dashboard(self):
+        url = reverse('hospital_admin_dashboard')
+        self.client.force_login(self.admin)
+        self.client.get(url)
+        cache.delete(stats._snapshot_key(self.hospital.pk))
+        # session, user and hospital; the blocks come from the fragment cache, not the snapshot
+        with self.assertNumQueries(3):
+            self.assertContains(self.client.get(url), 'First1 Last1')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient(self.other, 2)
+        self.assertNotContains(self.client.get(url), 'First2')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient(self.hospital, 3)
+        self.assertContains(self.client.get(url), 'First3 Last3')
+
+    def test_other_workers_see_writes_within_the_stamp_ttl(self):
+        url = reverse('hospital_admin_dashboard')
+        self.client.force_login(self.admin)
+        self.client.get(url)
+        # Written by another worker: its on-commit cache update never reaches this one
+        make_patient(self.hospital, 3)
+        self.assertNotContains(self.client.get(url), 'First3 Last3')
+        cache.delete(stamps._cache_key(f'fragment_version:hospital:{self.hospital.pk}'))  # CHANGE_STAMP_TTL later
+        self.assertContains(self.client.get(url), 'First3 Last3')
+
+    def test_doctor_dashboard(self):
+        url = reverse('doctor_dashboard')
+        self.client.force_login(self.doctor.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_record(self.patient, doctor=self.doctor)
+        self.assertContains(self.client.get(url), 'First1 Last1')
+        with self.assertNumQueries(2):  # session and user
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.filter(pk=self.patient.pk).update(first_name='Renamed')
+            Patient.objects.get(pk=self.patient.pk).save()
+        self.assertContains(self.client.get(url), 'Renamed Last1')
+        # Each page has its own fragment; a bad cursor is still caught
+        self.assertEqual(self.client.get(url, {'page_size': 1}).context['patients'].page_size, 1)
+        self.assertEqual(self.client.get(url, {'after': 'garbage'}).status_code, 404)
+
+    def test_admin_dashboard_counts(self):
+        url = reverse('admin_dashboard')
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertContains(self.client.get(url), '<div class="stat-value">1</div>', count=2)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        self.assertFalse([q for q in captured.captured_queries if 'core_statcounter' in q['sql']])
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient(self.hospital, 2)
+        self.assertContains(self.client.get(url), '<div class="stat-value">2</div>', count=2)
+
+    def test_warm_compiles_project_templates(self):
+        names = list(templating.template_names())
+        self.assertIn('core/doctor_dashboard.html', names)
+        self.assertIn('admin/custom_dashboard.html', names)
+        with self.assertLogs('core.templating', 'INFO'):
+            self.assertGreaterEqual(templating.warm(), len(names) - 5)
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.source, 'css'))
+        os.makedirs(os.path.join(self.source, 'img'))
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as f:
+            f.write('body { background: url("../img/logo.png"); }\n' + '.card { margin: 0; }\n' * 200)
+        with open(os.path.join(self.source, 'img', 'logo.png'), 'wb') as f:
+            f.write(os.urandom(512))
+        settings = override_settings(
+            STATIC_ROOT=self.root, STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        self.css_url = staticfiles_storage.url('css/site.css')
+
+    def get(self, path, **headers):
+        handler = staticfiles.StaticFilesMiddleware(lambda request: HttpResponse('app', status=404))
+        request = RequestFactory().get(path, **headers)
+        response = handler(request)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_collectstatic_hashes_and_compresses(self):
+        self.assertRegex(self.css_url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        hashed = os.path.join(self.root, self.css_url[len('/static/'):])
+        with open(hashed) as f:
+            self.assertRegex(f.read(), r'url\("\.\./img/logo\.[0-9a-f]{12}\.png"\)')
+        with open(hashed, 'rb') as f, gzip.open(hashed + '.gz') as compressed:
+            self.assertEqual(compressed.read(), f.read())
+        # Incompressible files get no variant
+        self.assertFalse([name for name in os.listdir(os.path.join(self.root, 'img')) if name.endswith('.gz')])
+
+    def test_serves_variants_with_cache_headers(self):
+        response, body = self.get(self.css_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertTrue(response['Content-Type'].startswith('text/css'))
+        self.assertIn(b'.card { margin: 0; }', gzip.decompress(body))
+
+        response, body = self.get(self.css_url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'.card', body)
+        not_modified, _ = self.get(self.css_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        response, _ = self.get('/static/css/site.css')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={staticfiles.MAX_AGE}')
+        response, body = self.get('/static/css/missing.css')
+        self.assertEqual((response.status_code, body), (404, b'app'))
+        self.assertEqual(self.get('/static/staticfiles.json')[0].status_code, 404)
+
+    def test_without_collected_files(self):
+        with override_settings(STATIC_ROOT=os.path.join(self.root, 'missing')):
+            with self.assertRaises(MiddlewareNotUsed):
+                staticfiles.StaticFilesMiddleware(lambda request: None)
@@ -0,0 +1,40 @@
+"""
+Token-bucket rate limiting.
+
+Buckets live in the ``local`` cache, which stays per process even when the
+default cache is shared, so throttling never adds a network round trip. With
+several worker processes each one keeps its own buckets; the effective limit
+is per process.
+"""
+import math
+import time
+
+from django.core.cache import caches
+
+CACHE_ALIAS = 'local'
+
+
+def consume(scope, ident, capacity, rate):
+    """
+    Take a token from ``ident``'s bucket in ``scope``. Buckets hold up to
+    ``capacity`` tokens and refill at ``rate`` tokens per second. Returns 0
+    if a token was available, else the seconds until one will be.
+    """
+    cache = caches[CACHE_ALIAS]
+    key = f'throttle:{scope}:{ident}'
+    now = time.monotonic()
+    tokens, stamp = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - stamp) * rate)
+    # A bucket untouched for this long is full again, so letting it expire is harmless
+    timeout = math.ceil(capacity / rate)
+    if tokens < 1:
+        cache.set(key, (tokens, now), timeout)
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), timeout)
+    return 0
+
+
+def client_ip(request):
+    # REMOTE_ADDR only: X-Forwarded-For is client controlled unless a trusted
+    # proxy rewrites it, and honouring it would let callers pick their bucket.
+    return request.META.get('REMOTE_ADDR', '')
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, metrics, views
 from .views import (
     dashboard, 
     patient_list, 
@@ -25,8 +25,11 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('patients/', views.patient_list, name='patient_list'),
     path('patients/add/', views.add_patient, name='add_patient'),
+    path('patients/search/', views.patient_search, name='patient_search'),
     path('patients/<str:mr_number>/', views.patient_detail, name='patient_detail'),
     path('patients/<str:mr_number>/add-record/', views.add_patient_record, name='add_patient_record'),
+    path('patients/<str:mr_number>/timeline/', views.patient_timeline, name='patient_timeline'),
+    path('patients/<str:mr_number>/visits/<int:pk>/', views.patient_visit, name='patient_visit'),
     path('register/', views.register, name='register'),
     path('register/doctor/', views.register_doctor, name='register_doctor'),
     path('register/hospital/', views.register_hospital, name='register_hospital'),
@@ -35,7 +38,18 @@ urlpatterns = [
     path('register/patient/', views.register_patient, name='register_patient'),
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('hospital-admin/dashboard/', views.hospital_admin_dashboard, name='hospital_admin_dashboard'),
+    path('dashboards/admin/async/', views.admin_dashboard_async, name='admin_dashboard_async'),
+    path('dashboards/hospital-admin/async/', views.hospital_admin_dashboard_async,
+         name='hospital_admin_dashboard_async'),
     path('patient-records/', patient_record_lookup, name='patient_record_lookup'),
+    path('records/search/', views.record_search, name='record_search'),
+    path('exports/patients/', views.export_patients, name='export_patients'),
+    path('exports/records/', views.export_records, name='export_records'),
     path('doctor-dashboard/', doctor_dashboard, name='doctor_dashboard'),
+    path(f'api/{api.VERSION}/<str:resource>/', api.resource_list, name='api_list'),
+    path(f'api/{api.VERSION}/<str:resource>/<int:pk>/', api.resource_detail, name='api_detail'),
+    path('autocomplete/<str:kind>/', views.facility_autocomplete, name='facility_autocomplete'),
+    # No trailing slash: the path Prometheus scrapes by default
+    path('metrics', metrics.metrics_view, name='metrics'),
     # Login/logout URLs are handled in health_system/urls.py
 ]
\ No newline at end of file
@@ -4,14 +4,29 @@ from django.contrib.auth import logout as auth_logout
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
-from .models import Patient, Doctor, Clinic, Hospital, PatientRecord, HospitalAdmin
+from asgiref.sync import sync_to_async
+from .models import Patient, Doctor, Clinic, Hospital, PatientRecord, HospitalAdmin, DoctorPatientPanel
 from .forms import (
     PatientForm, DoctorForm, ClinicForm, HospitalForm, PatientRecordForm, 
     CustomUserCreationForm, DoctorRegistrationForm, HospitalRegistrationForm,
-    ClinicRegistrationForm, HospitalAdminRegistrationForm, PatientRegistrationForm
+    ClinicRegistrationForm, HospitalAdminRegistrationForm, PatientRegistrationForm,
+    RecordSearchForm, ExportForm
 )
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from .pagination import keyset_paginate, clamp_page_size, decode_cursor, InvalidCursor
+from . import search, record_index, stats, exports, mrn, lookup, throttle, replicas, roles, facilities, hospital_names, fragments
+from .replicas import replica_reads
+from .roles import role_required
+import asyncio
+import math
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.db.models.functions import Substr
+
+TIMELINE_PAGE_SIZE = 10
 
 
 def user_login(request):
@@ -29,18 +44,19 @@ def user_login(request):
         user = authenticate(request, username=username, password=password)
         
         if user is not None:
+            role = roles.resolve(user)
             if not user.is_active:
                 return render(request, 'registration/login.html', {'error': 'Your account is disabled. Please contact the administrator.'})
 
             if user_type == 'doctor':
-                if hasattr(user, 'doctor'):
+                if role.is_doctor:
                     login(request, user)
                     return redirect('doctor_dashboard')
                 else:
                     return render(request, 'registration/login.html', {'error': 'This account does not have doctor privileges'})
             
             elif user_type == 'hospital_admin':
-                if hasattr(user, 'hospitaladmin'):
+                if role.is_hospital_admin:
                     login(request, user)
                     return redirect('hospital_admin_dashboard')
                 else:
@@ -60,9 +76,10 @@ def user_login(request):
     
     # If user is already authenticated, redirect to appropriate dashboard
     if request.user.is_authenticated:
-        if hasattr(request.user, 'doctor'):
+        role = roles.get_role(request)
+        if role.is_doctor:
             return redirect('doctor_dashboard')
-        elif hasattr(request.user, 'hospitaladmin'):
+        elif role.is_hospital_admin:
             return redirect('hospital_admin_dashboard')
         elif request.user.is_staff:
             return redirect('admin_dashboard')
@@ -79,7 +96,7 @@ def doctor_login(request):
         password = request.POST.get('password')
         user = authenticate(request, username=username, password=password)
         
-        if user is not None and hasattr(user, 'doctor'):
+        if user is not None and roles.resolve(user).is_doctor:
             login(request, user)
             return redirect('doctor_dashboard')
         else:
@@ -109,7 +126,7 @@ def hospital_admin_login(request):
         password = request.POST.get('password')
         user = authenticate(request, username=username, password=password)
         
-        if user is not None and hasattr(user, 'hospitaladmin'):
+        if user is not None and roles.resolve(user).is_hospital_admin:
             login(request, user)
             return redirect('hospital_admin_dashboard')
         else:
@@ -122,80 +139,127 @@ def root_redirect(request):
     # Always redirect to login page, regardless of authentication status
     return redirect('login')
 
+@replica_reads
 def patient_record_lookup(request):
     if request.method == 'GET' and 'mr_number' in request.GET:
-        mr_number = request.GET.get('mr_number')
-        try:
-            patient = Patient.objects.get(mr_number=mr_number)
-            records = PatientRecord.objects.filter(patient=patient).order_by('-visit_date')
-            return render(request, 'core/patient_records.html', {
-                'patient': patient,
-                'records': records
-            })
-        except Patient.DoesNotExist:
+        retry_after = throttle.consume('mr_lookup', throttle.client_ip(request), lookup.BURST, lookup.RATE)
+        if retry_after:
+            response = render(request, 'registration/login.html', {
+                'error': 'Too many lookups. Please wait a moment and try again.'
+            }, status=429)
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        mr_number = request.GET.get('mr_number').strip()
+        summary = lookup.record_summary(mr_number)
+        if summary is None:
             return render(request, 'registration/login.html', {
                 'error': 'No records found for the provided MR number'
             })
+        return render(request, 'core/patient_records.html', {'summary': summary})
     return redirect('login')
 
-@login_required
+@role_required(roles.DOCTOR)
+@replica_reads
 def doctor_dashboard(request):
-    if not hasattr(request.user, 'doctor'):
-        return redirect('login')
-    
-    # Get doctor's patients and recent records
-    doctor = request.user.doctor
-    patients = Patient.objects.filter(patientrecord__doctor=doctor).distinct()
-    recent_records = PatientRecord.objects.filter(doctor=doctor).order_by('-visit_date')[:10]
+    # Get doctor's patients (from the panel table, most recently seen first) and recent records
+    role = roles.get_role(request)
+    panel = DoctorPatientPanel.objects.filter(doctor_id=role.doctor_id).select_related('patient').only(
+        'last_seen', 'visit_count', 'patient__mr_number', 'patient__first_name', 'patient__last_name'
+    )
+    after, before = request.GET.get('after'), request.GET.get('before')
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    try:
+        # Checked up front: the page itself is only fetched if the cached fragment is missing
+        for cursor in (after, before):
+            if cursor:
+                decode_cursor(cursor, DoctorPatientPanel, ('last_seen', 'id'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    patients = fragments.lazy(keyset_paginate, panel, ('last_seen', 'id'), after, before, page_size)
+    recent_records = PatientRecord.objects.filter(doctor_id=role.doctor_id).select_related('patient').order_by('-visit_date')[:10]
     
-    return render(request, 'core/doctor_dashboard.html', {
-        'patients': patients,
-        'recent_records': recent_records
-    })
+    scope = f'doctor:{role.doctor_id}'
+    with fragments.reads_for(scope):
+        return render(request, 'core/doctor_dashboard.html', {
+            'patients': patients,
+            'recent_records': recent_records,
+            'fragment_version': fragments.version(role, scope),
+            'page_key': (after, before, page_size),
+        })
 
+# The access checks run before replica_reads so the user and role are
+# resolved on the primary, never from a lagging replica
 @staff_member_required
+@replica_reads
 def admin_dashboard(request):
-    stats = {
-        'patient_count': Patient.objects.count(),
-        'doctor_count': Doctor.objects.count(),
-        'hospital_count': Hospital.objects.count(),
-        'record_count': PatientRecord.objects.count(),
-    }
-    return render(request, 'admin/custom_dashboard.html', stats)
+    return _render_admin_dashboard(request)
 
-@login_required
+def _render_admin_dashboard(request):
+    with fragments.reads_for('counts'):
+        return render(request, 'admin/custom_dashboard.html', {
+            'counts': fragments.lazy(stats.global_counts),
+            'fragment_version': fragments.version(roles.Role(roles.STAFF), 'counts'),
+        })
+
+@role_required(roles.HOSPITAL_ADMIN)
+@replica_reads
 def hospital_admin_dashboard(request):
-    if not hasattr(request.user, 'hospitaladmin'):
-        return redirect('login')
-    
-    # Get hospital admin's hospital and related data
-    hospital_admin = request.user.hospitaladmin
-    hospital = hospital_admin.hospital
+    role = roles.get_role(request)
+    hospital = get_object_or_404(Hospital, pk=role.hospital_id)
     
-    # Get statistics for this hospital
-    stats = {
-        'hospital': hospital,
-        'patient_count': Patient.objects.filter(registered_at=hospital).count(),
-        'doctor_count': Doctor.objects.filter(clinic__hospital=hospital).count(),
-        'record_count': PatientRecord.objects.filter(patient__registered_at=hospital).count(),
-        'recent_patients': Patient.objects.filter(registered_at=hospital).order_by('-registration_date')[:10],
-        'recent_records': PatientRecord.objects.filter(patient__registered_at=hospital).order_by('-visit_date')[:10],
-    }
-    
-    return render(request, 'core/hospital_admin_dashboard.html', stats)
+    # Statistics for this hospital (cached per hospital, see stats.hospital_snapshot),
+    # fetched only when the dashboard's cached fragments are missing
+    return _render_hospital_admin_dashboard(
+        request, role, hospital, fragments.lazy(stats.hospital_snapshot, hospital.pk))
+
+def _render_hospital_admin_dashboard(request, role, hospital, snapshot, version=None):
+    scope = f'hospital:{hospital.pk}'
+    with fragments.reads_for(scope):
+        return render(request, 'core/hospital_admin_dashboard.html', {
+            'hospital': hospital,
+            'snapshot': snapshot,
+            'fragment_version': version or fragments.version(role, scope),
+        })
+
+# Async variants of the two dashboards for ASGI deployments; the sync views
+# above stay the defaults. They never block the event loop, and on a fragment
+# miss the hospital dashboard looks up the hospital while
+# stats.ahospital_snapshot runs its queries side by side on a bounded pool.
+@role_required(roles.STAFF)
+@replica_reads
+async def admin_dashboard_async(request):
+    return await sync_to_async(_render_admin_dashboard)(request)
+
+@role_required(roles.HOSPITAL_ADMIN)
+@replica_reads
+async def hospital_admin_dashboard_async(request):
+    role = await sync_to_async(roles.get_role)(request)
+    version = await sync_to_async(fragments.version)(role, f'hospital:{role.hospital_id}')
+    hospitals = Hospital.objects.filter(pk=role.hospital_id)
+    if await fragments.acached(version, 'hospital_dashboard_counts', 'hospital_dashboard_recent'):
+        hospital = await hospitals.afirst()
+        # Only computed if a block expires before the page renders
+        snapshot = fragments.lazy(stats.hospital_snapshot, role.hospital_id)
+    else:
+        hospital, snapshot = await asyncio.gather(hospitals.afirst(), stats.ahospital_snapshot(role.hospital_id))
+    if hospital is None:
+        raise Http404('No Hospital matches the given query.')
+    return await sync_to_async(_render_hospital_admin_dashboard)(request, role, hospital, snapshot, version)
 
 @login_required
+@replica_reads
 def dashboard(request):
-    if hasattr(request.user, 'doctor'):
+    role = roles.get_role(request)
+    if role.is_doctor:
         return redirect('doctor_dashboard')
-    elif hasattr(request.user, 'hospitaladmin'):
+    elif role.is_hospital_admin:
         return redirect('hospital_admin_dashboard')
     elif request.user.is_staff:
         return redirect('admin_dashboard')
     
     # Regular user dashboard - show recent patients and records
     recent_patients = Patient.objects.all().order_by('-registration_date')[:5]
-    recent_records = PatientRecord.objects.all().order_by('-visit_date')[:5]
+    recent_records = PatientRecord.objects.select_related('patient').order_by('-visit_date')[:5]
     
     return render(request, 'core/dashboard.html', {
         'patients': recent_patients,
@@ -203,19 +267,124 @@ def dashboard(request):
     })
 
 @login_required
+@replica_reads
 def patient_list(request):
-    patients = Patient.objects.all().order_by('-registration_date')
-    return render(request, 'core/patient_list.html', {'patients': patients})
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    patients = Patient.objects.select_related('registered_at').only(
+        'mr_number', 'first_name', 'last_name', 'gender', 'registration_date', 'registered_at__name'
+    )
+    try:
+        page = keyset_paginate(
+            patients, ('registration_date', 'id'),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    return render(request, 'core/patient_list.html', {'patients': page, 'page': page})
+
+@login_required
+def patient_search(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return redirect('patient_list')
+    patients = search.search_patients(query, limit=clamp_page_size(request.GET.get('page_size'), maximum=search.MAX_RESULTS))
+    return render(request, 'core/patient_list.html', {'patients': patients, 'query': query})
+
+# Clinical text across hospitals: staff, or a hospital admin for their own hospital
+@role_required(roles.STAFF, roles.HOSPITAL_ADMIN)
+def record_search(request):
+    records = None
+    form = RecordSearchForm(request.GET or None)
+    # Hospital admins only ever see their own hospital's records
+    own_hospital = roles.get_role(request).hospital_id
+    if own_hospital:
+        del form.fields['hospital']
+    if form.is_valid():
+        hospital = own_hospital or form.cleaned_data.get('hospital')
+        date_from = form.cleaned_data.get('date_from')
+        date_to = form.cleaned_data.get('date_to')
+        records = record_index.search_records(
+            form.cleaned_data['q'],
+            hospital=hospital,
+            date_from=timezone.make_aware(datetime.combine(date_from, time.min)) if date_from else None,
+            date_to=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)) if date_to else None,
+        )
+    return render(request, 'core/record_search.html', {'form': form, 'records': records})
+
+def _export(request, kind):
+    # Staff can export any hospital (or all of them); hospital admins only their own
+    role = roles.get_role(request)
+    if role.is_hospital_admin:
+        own_hospital = role.hospital_id
+    elif request.user.is_staff:
+        own_hospital = None
+    else:
+        return HttpResponseForbidden('Exports are limited to administrators')
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    hospital = own_hospital or form.cleaned_data['hospital']
+    fmt = form.cleaned_data['format']
+    # The rows are read while the response streams, after the view (and its
+    # replica routing) has returned, so the alias is passed down explicitly
+    chunks = exports.export_chunks(
+        kind, fmt,
+        using=replicas.read_alias(),
+        hospital=hospital,
+        date_from=form.cleaned_data['date_from'],
+        date_to=form.cleaned_data['date_to'],
+    )
+    response = StreamingHttpResponse(chunks, content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(kind, fmt, hospital)}"'
+    return response
+
+@login_required
+@replica_reads
+def export_patients(request):
+    return _export(request, 'patients')
+
+@login_required
+@replica_reads
+def export_records(request):
+    return _export(request, 'records')
 
 @login_required
 def patient_detail(request, mr_number):
-    patient = get_object_or_404(Patient, mr_number=mr_number)
-    records = PatientRecord.objects.filter(patient=patient).order_by('-visit_date')
+    patient = get_object_or_404(Patient.objects.select_related('registered_at'), mr_number=mr_number)
     return render(request, 'core/patient_detail.html', {
         'patient': patient,
-        'records': records
+        'visits': _visit_timeline(request, patient),
     })
 
+def _visit_timeline(request, patient):
+    # One page of visit summaries; the large text fields load per visit via patient_visit
+    visits = (
+        PatientRecord.objects.filter(patient=patient)
+        .select_related('doctor__user')
+        .only('visit_date', 'next_visit', 'doctor__user__first_name', 'doctor__user__last_name')
+        # One character past the template's truncatechars:120, so a longer diagnosis gets its ellipsis
+        .annotate(diagnosis_preview=Substr('diagnosis', 1, 121))
+    )
+    try:
+        return keyset_paginate(visits, ('visit_date', 'id'), after=request.GET.get('after'), page_size=TIMELINE_PAGE_SIZE)
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+
+@login_required
+def patient_timeline(request, mr_number):
+    patient = get_object_or_404(Patient.objects.only('mr_number'), mr_number=mr_number)
+    return render(request, 'core/includes/visit_timeline.html', {
+        'patient': patient,
+        'visits': _visit_timeline(request, patient),
+    })
+
+@login_required
+def patient_visit(request, mr_number, pk):
+    record = get_object_or_404(PatientRecord, pk=pk, patient__mr_number=mr_number)
+    return render(request, 'core/includes/visit_detail.html', {'record': record})
+
 @login_required
 def add_patient(request):
     if request.method == 'POST':
@@ -236,8 +405,9 @@ def add_patient_record(request, mr_number):
         if form.is_valid():
             record = form.save(commit=False)
             record.patient = patient
-            if hasattr(request.user, 'doctor'):
-                record.doctor = request.user.doctor
+            role = roles.get_role(request)
+            if role.is_doctor:
+                record.doctor_id = role.doctor_id
             record.save()
             return redirect('patient_detail', mr_number=mr_number)
     else:
@@ -302,27 +472,8 @@ def register_clinic(request):
             # Create clinic but don't save username and password fields to the model
             clinic = form.save(commit=False)
             
-            # Handle the hospital relationship
-            hospital_name = form.cleaned_data.get('hospital_name')
-            # Try to find an existing hospital with this name, or create a default one
-            try:
-                hospital = Hospital.objects.filter(name__icontains=hospital_name).first()
-                if not hospital:
-                    # Create a temporary hospital with minimal information
-                    hospital = Hospital.objects.create(
-                        name=hospital_name,
-                        contact_number='0000000000',  # Default value
-                        email='temp@example.com'      # Default value
-                    )
-                clinic.hospital = hospital
-            except Exception as e:
-                # If there's any error with hospital, create a default one
-                hospital = Hospital.objects.create(
-                    name='Default Hospital',
-                    contact_number='0000000000',
-                    email='default@example.com'
-                )
-                clinic.hospital = hospital
+            # Link the hospital with this (normalized) name, or create a placeholder
+            clinic.hospital = hospital_names.resolve(form.cleaned_data.get('hospital_name'))
             
             clinic.save()
             
@@ -374,9 +525,8 @@ def register_patient(request):
             # Create a new patient instance but don't save yet
             patient = form.save(commit=False)
             
-            # Generate a unique MR number (you might want to implement a more sophisticated method)
-            import uuid
-            patient.mr_number = str(uuid.uuid4())[:8].upper()
+            # Assign the hospital's next MR number
+            patient.mr_number = mrn.allocate(patient.registered_at_id)
             
             # Set the registration date
             from django.utils import timezone
@@ -390,4 +540,23 @@ def register_patient(request):
             return redirect('login')
     else:
         form = PatientRegistrationForm()
-    return render(request, 'registration/register.html', {'form': form, 'title': 'Patient Registration', 'user_type': 'patient'})
\ No newline at end of file
+    return render(request, 'registration/register.html', {'form': form, 'title': 'Patient Registration', 'user_type': 'patient'})
+
+def facility_autocomplete(request, kind):
+    # Public like the registration forms it serves; answered from the in-process name index
+    index = facilities.INDEXES.get(kind)
+    if index is None:
+        raise Http404('Unknown facility type')
+    try:
+        hospital = int(request.GET['hospital']) if request.GET.get('hospital') else None
+    except ValueError:
+        return HttpResponseBadRequest('hospital must be an id')
+    matches = index.search(
+        request.GET.get('q', ''),
+        limit=clamp_page_size(request.GET.get('limit'), default=facilities.DEFAULT_LIMIT, maximum=facilities.MAX_LIMIT),
+        hospital=hospital,
+    )
+    response = JsonResponse({'results': [{'id': pk, 'text': label} for pk, label in matches]})
+    # Keystrokes repeat prefixes; let the browser answer those for a minute
+    patch_cache_control(response, public=True, max_age=60)
+    return response
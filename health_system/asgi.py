@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_management.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_system.settings')
 
 application = get_asgi_application()
+
+from core import templating  # noqa: E402  (needs the app registry set up above)
+
+if templating.ENABLED:
+    templating.warm()
@@ -20,13 +20,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'health_system.urls'
@@ -42,6 +46,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.fragments.context',
+                'core.roles.context',
             ],
         },
     },
@@ -49,13 +55,87 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'health_system.wsgi.application'
 
+# core.backends.sqlite3 turns on WAL and the other pragmas in its
+# DEFAULT_PRAGMAS. IMMEDIATE transactions take the write lock up front, so
+# concurrent atomic blocks wait for each other instead of failing with
+# "database is locked". Connections are kept for CONN_MAX_AGE seconds.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Read replica (see core/replicas.py). Locally a second SQLite file that
+    # `manage.py sync_replica` copies from default; tests mirror default.
+    'replica': {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Aliases the dashboards, patient list, exports and public lookup may read
+# from; empty sends everything to default. Add 'replica' once it is synced.
+REPLICA_DATABASES = []
+# Seconds a session stays on default after writing (read-your-writes), and
+# changed cache entries are recomputed from default; should exceed the lag.
+REPLICA_MAX_LAG = 5
+
+# Per-process cache. Cached dashboard snapshots and blocks are versioned by
+# last-write stamps kept in the database (core/stamps.py), so another
+# worker's writes show within CHANGE_STAMP_TTL; a shared backend (e.g. Redis
+# or Memcached) shows them at once and shares the cached values.
+CACHES = {
+    'default': {
+        # Django's LocMemCache, counting hits and misses for /metrics
+        'BACKEND': 'core.metrics.LocMemCache',
+        'LOCATION': 'health-system',
+    },
+    # Per-process state that must stay local even if 'default' moves to a
+    # shared backend (rate-limit buckets, see core/throttle.py)
+    'local': {
+        'BACKEND': 'core.metrics.LocMemCache',
+        'LOCATION': 'local',
+    },
+    # Session data for SESSION_BACKEND='cache' (core/sessions.py), which
+    # refuses this per-process cache: point it at one every worker shares
+    # (memcached or redis; the file cache on a single host) before using it.
+    'sessions': {
+        'BACKEND': 'core.metrics.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Where sessions live: 'db' is Django's plain table; 'cache' reads them from
+# the shared 'sessions' cache and writes changes to the database behind the
+# request (core/sessions.py; a killed worker loses up to
+# SESSION_WRITE_BEHIND_INTERVAL seconds of changes other than login/logout);
+# 'cookies' keeps them in signed cookies, for stateless workers (no server
+# state, but the client can read the contents).
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+SESSION_ENGINE = {
+    'cache': 'core.sessions',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+# Seconds a change to an existing session may wait before it is written to
+# the database (new sessions are written at once)
+SESSION_WRITE_BEHIND_INTERVAL = 5
+
+
+# Seconds an unchanged per-hospital dashboard snapshot may be served from cache
+HOSPITAL_SNAPSHOT_TTL = 300
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -78,6 +158,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# `manage.py collectstatic` (run on every deploy) writes content-hashed copies
+# of the assets here, with .gz/.br variants; core.staticfiles.StaticFilesMiddleware
+# serves them, so restart the workers afterwards. See core/staticfiles.py.
+STATIC_ROOT = os.environ.get('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+# Seconds browsers may reuse a static file linked by its plain, unhashed name
+# (hashed names are cached for a year)
+STATIC_MAX_AGE = 60
+# Off when a CDN or the web server in front serves STATIC_ROOT itself
+STATIC_HANDLER_ENABLED = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -93,4 +186,73 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'your-email@example.com'  # For production - replace with actual email
 EMAIL_HOST_PASSWORD = 'your-password'  # For production - replace with actual password
-DEFAULT_FROM_EMAIL = 'Health Management System <noreply@healthmanagementsystem.com>'
\ No newline at end of file
+DEFAULT_FROM_EMAIL = 'Health Management System <noreply@healthmanagementsystem.com>'
+# MR numbers each worker process reserves per round trip to MRNumberSequence
+MR_NUMBER_BLOCK_SIZE = 100
+
+# Patient search matches bm25-ranked per query; past this many only the newest
+# are ranked, which keeps a lone common name well under 50ms at 1M patients
+PATIENT_SEARCH_RANK_WINDOW = 10000
+
+# Public MR lookup: seconds a rendered summary / an unknown-MR miss is cached,
+# and the per-IP token bucket (burst size, tokens refilled per second)
+PUBLIC_LOOKUP_TTL = 3600
+PUBLIC_LOOKUP_MISS_TTL = 60
+PUBLIC_LOOKUP_BURST = 10
+PUBLIC_LOOKUP_RATE = 0.2
+
+# Seconds a worker trusts its cached copy of a last-write stamp (API ETags,
+# facility indexes, dashboard blocks; see core/stamps.py) before reading it from
+# the database again. With a per-process cache this bounds how long another
+# worker may serve the old version after a change.
+CHANGE_STAMP_TTL = 5
+
+# Threads (each with its own DB connection) that run the async dashboards'
+# snapshot queries concurrently under ASGI; see core/stats.py
+DASHBOARD_QUERY_THREADS = 4
+
+# Fraction of requests that get query/template timing headers and a log line
+# from core.instrumentation (0 removes the middleware). Set to 1.0 while
+# developing; the headers expose query counts, so sample sparingly in production.
+INSTRUMENTATION_SAMPLE_RATE = 0.0
+# Executions of one SELECT shape within a request that count as a likely N+1
+INSTRUMENTATION_REPEAT_THRESHOLD = 5
+
+# Seconds a user's role (doctor / hospital admin and their profile ids) is
+# trusted from the session before it is looked up again; see core/roles.py
+ROLE_SESSION_TTL = 300
+
+# Prometheus metrics (core/metrics.py). Each worker process writes its samples
+# to its own file in METRICS_DIR and /metrics adds them up, so every worker must
+# see the same directory; empty it when the server starts. Off unless turned
+# on. /metrics answers only clients in METRICS_ALLOWED_NETWORKS and, when
+# METRICS_TOKEN is set, sending "Authorization: Bearer <token>". Behind a
+# reverse proxy every client comes from the proxy's address, so set a token.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_ALLOWED_NETWORKS = ['127.0.0.0/8', '::1/128']
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Trigram similarity (0-1) at which clinic registration links a typed hospital
+# name to an existing hospital rather than creating one; see core/hospital_names.py
+HOSPITAL_NAME_SIMILARITY = 0.7
+
+# Seconds a rendered dashboard block may be served from the cache. A write
+# retires the blocks it affects at once in the worker that made it, and in
+# the others within CHANGE_STAMP_TTL (core/fragments.py); this only bounds how
+# long unused blocks linger.
+FRAGMENT_CACHE_TTL = 600
+# Compile every template when a worker starts (health_system/wsgi.py and
+# asgi.py) rather than on each worker's first request for it
+TEMPLATE_WARMUP = True
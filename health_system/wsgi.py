@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_system.settings')
 
 application = get_wsgi_application()
+
+from core import templating  # noqa: E402  (needs the app registry set up above)
+
+if templating.ENABLED:
+    templating.warm()
@@ -0,0 +1,49 @@
+// Facility autocomplete (core.forms.AutocompleteInput): suggestions from
+// /autocomplete/<kind>/ fill the field's <datalist>, and picking one puts its
+// id into the hidden input the form actually submits.
+(function () {
+    var timers = new WeakMap();
+
+    function choose(input) {
+        var options = document.getElementById(input.getAttribute('list')).options;
+        var ids = [];
+        for (var i = 0; i < options.length; i++) {
+            if (options[i].value === input.value) {
+                ids.push(options[i].dataset.id);
+            }
+        }
+        // Labels are unique, but never guess between two suggestions with the same text
+        document.getElementById(input.dataset.autocompleteValue).value = ids.length === 1 ? ids[0] : '';
+    }
+
+    function suggest(input) {
+        var url = input.dataset.autocomplete + '?q=' + encodeURIComponent(input.value);
+        fetch(url, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+            .then(function (response) { return response.ok ? response.json() : Promise.reject(response); })
+            .then(function (data) {
+                var list = document.getElementById(input.getAttribute('list'));
+                list.textContent = '';
+                data.results.forEach(function (result) {
+                    var option = document.createElement('option');
+                    option.value = result.text;
+                    option.dataset.id = result.id;
+                    list.appendChild(option);
+                });
+                choose(input);
+            })
+            .catch(function () {});
+    }
+
+    document.addEventListener('input', function (event) {
+        var input = event.target;
+        if (!input.matches || !input.matches('input[data-autocomplete]')) {
+            return;
+        }
+        // Typing over a choice clears it until the text matches a suggestion again
+        choose(input);
+        clearTimeout(timers.get(input));
+        if (input.value.trim()) {
+            timers.set(input, setTimeout(function () { suggest(input); }, 150));
+        }
+    });
+})();
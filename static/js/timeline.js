@@ -0,0 +1,27 @@
+// Lazy visit timeline on the patient page: "Load older visits" and the
+// per-visit details are fetched as HTML fragments on demand.
+document.addEventListener('click', function (event) {
+    var more = event.target.closest('.timeline-more a[data-src]');
+    if (!more) {
+        return;
+    }
+    event.preventDefault();
+    more.classList.add('disabled');
+    fetch(more.dataset.src, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+        .then(function (response) { return response.ok ? response.text() : Promise.reject(response); })
+        .then(function (html) { more.closest('.timeline-more').outerHTML = html; })
+        .catch(function () { more.classList.remove('disabled'); });
+});
+
+// <details> "toggle" does not bubble, so listen in the capture phase
+document.addEventListener('toggle', function (event) {
+    var details = event.target;
+    if (!details.matches || !details.matches('details.visit-details') || !details.open || details.dataset.loaded) {
+        return;
+    }
+    details.dataset.loaded = '1';
+    fetch(details.dataset.src, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+        .then(function (response) { return response.ok ? response.text() : Promise.reject(response); })
+        .then(function (html) { details.querySelector('.visit-body').innerHTML = html; })
+        .catch(function () { delete details.dataset.loaded; });
+}, true);